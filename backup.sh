@@ -1,6 +1,9 @@
 # !/bin/bash
 dir2make="/mnt/datamanager_backup/$(date +"%d-%m-%Y_%H-%M")"
+db_folder=/home/aaron/Documents/Data-Manager/src/database
 sudo mount -o rw /mnt/datamanager_backup
 mkdir $dir2make
-cp -r -f --no-preserve=mode,ownership /home/aaron/Documents/Data-Manager/src/database/{db_main.db,uploaded_files,conditions} $dir2make
+# the database runs in WAL mode: copy it through sqlite so transactions still in db_main.db-wal are included
+sqlite3 $db_folder/db_main.db ".backup '$dir2make/db_main.db'"
+cp -r -f --no-preserve=mode,ownership $db_folder/{uploaded_files,conditions} $dir2make
 sudo umount /mnt/datamanager_backup
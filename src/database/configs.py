@@ -1,8 +1,16 @@
-import operators
+import os
+import logging
+import flask
+from connection_pool import ConnectionPool
+
+logger = logging.getLogger(__name__)
 
 class database_configs():
     def __init__(self) -> None:
         self.dbName = './src/database/db_main.db'
+        # milliseconds a connection waits on a locked database before giving up
+        self.busy_timeout = int(os.environ.get('DB_BUSY_TIMEOUT', 5000))
+        self.pool = None
         self.make_conn()
         self.table_lists = [
             """ CREATE TABLE IF NOT EXISTS entries (
@@ -84,4 +92,19 @@ class database_configs():
                                     ); """
         ]
     def make_conn(self):
-        self.conn = operators.create_connection(self.dbName)
\ No newline at end of file
+        if self.pool is not None:
+            self.pool.close_all()
+        self.pool = ConnectionPool(self.dbName, busy_timeout=self.busy_timeout)
+        logger.info('Connected to database %s using SQLite', self.dbName)
+
+    def get_conn(self):
+        """Return the connection for the current request (or thread outside of requests)."""
+        if flask.has_request_context():
+            if 'db_conn' not in flask.g:
+                flask.g.db_conn = self.pool.acquire()
+            return flask.g.db_conn
+        return self.pool.thread_conn()
+
+    def release_conn(self, exception=None):
+        if flask.has_request_context():
+            self.pool.release(flask.g.pop('db_conn', None))
@@ -0,0 +1,163 @@
+import os
+import shutil
+import sqlite3
+import threading
+import queue
+
+import sql_trace
+
+
+class ConnectionPool():
+    """Hands out SQLite connections so concurrent requests never share one.
+
+    File databases are opened in WAL mode, which lets readers run in parallel
+    with a writer. Connections are either checked out for the lifetime of a
+    request (``acquire``/``release``) or pinned to the calling thread
+    (``thread_conn``) for startup code and background workers.
+
+    An in-memory database only exists inside the connection that created it,
+    so for ``:memory:`` every caller gets the same shared connection.
+
+    With WAL, committed transactions may still sit in the ``-wal`` file, so
+    the database file alone is not a copy of the database: ``backup`` and
+    ``restore`` go through SQLite instead of copying files. ``restore`` waits
+    for the connections other requests have checked out to come back (up to
+    ``restore_timeout`` seconds) and holds new checkouts until it is done.
+    """
+    def __init__(self, db_file, busy_timeout=5000, max_idle=8, restore_timeout=30) -> None:
+        self.db_file = db_file
+        self.busy_timeout = busy_timeout
+        self.restore_timeout = restore_timeout
+        self.shared = db_file == ':memory:'
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._drained = threading.Condition(self._lock)
+        self._restoring = False
+        # checked-out connection -> ident of the thread holding it
+        self._checked_out = {}
+        self._connections = []
+        self._shared_conn = self.connect() if self.shared else None
+
+    def connect(self):
+        """Open and configure a new connection to the pool's database."""
+        conn = sqlite3.connect(self.db_file, timeout=self.busy_timeout / 1000, check_same_thread=False,
+                               factory=sql_trace.TracedConnection)
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        if not self.shared:
+            # takes effect on a new database; an existing one switches at its next VACUUM
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def acquire(self):
+        """Check out a connection, reusing an idle one when available."""
+        if self.shared:
+            return self._shared_conn
+        with self._drained:
+            while self._restoring:
+                self._drained.wait()
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self.connect()
+                if not self._is_open(conn):
+                    conn = None
+            self._checked_out[conn] = threading.get_ident()
+            return conn
+
+    def release(self, conn):
+        """Return a checked-out connection, discarding any uncommitted work."""
+        if self.shared or conn is None:
+            return
+        with self._drained:
+            self._checked_out.pop(conn, None)
+            self._drained.notify_all()
+        if not self._is_open(conn):
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+
+    def thread_conn(self):
+        """Return the connection pinned to the calling thread."""
+        if self.shared:
+            return self._shared_conn
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or not self._is_open(conn):
+            conn = self.connect()
+            self._local.conn = conn
+        return conn
+
+    def close_all(self):
+        """Close every connection; threads holding one get a new one on their next call."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def backup(self, target_file):
+        """Write a consistent copy of the database, WAL content included, to ``target_file``."""
+        source = self._shared_conn if self.shared else sqlite3.connect(self.db_file, timeout=self.busy_timeout / 1000)
+        target = sqlite3.connect(target_file)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            if source is not self._shared_conn:
+                source.close()
+
+    def restore(self, source_file):
+        """Replace the database by the copy in ``source_file``.
+
+        Connections checked out by other threads are waited for first, and
+        ``TimeoutError`` is raised if they are not all released within
+        ``restore_timeout`` seconds. Then the pool's connections are closed
+        and the ``-wal``/``-shm`` files removed, so no frame of the old
+        database is replayed onto the restored one. Connections pinned to a
+        thread are reopened by that thread's next ``thread_conn`` call.
+        """
+        if self.shared:
+            source = sqlite3.connect(source_file)
+            try:
+                source.backup(self._shared_conn)
+            finally:
+                source.close()
+            return
+        caller = threading.get_ident()
+        with self._drained:
+            self._restoring = True
+            try:
+                if not self._drained.wait_for(lambda: all(owner == caller for owner in self._checked_out.values()),
+                                              self.restore_timeout):
+                    raise TimeoutError('Connections are still checked out by other requests, database not restored')
+                self.close_all()
+                for path in (self.db_file + '-wal', self.db_file + '-shm', self.db_file):
+                    if os.path.exists(path):
+                        os.remove(path)
+                shutil.copyfile(source_file, self.db_file)
+            finally:
+                self._restoring = False
+                self._drained.notify_all()
+
+    def _is_open(self, conn):
+        # close_all drops closed connections from the list
+        with self._lock:
+            return conn in self._connections
+
+    def _discard(self, conn):
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        conn.close()
@@ -0,0 +1,120 @@
+"""Full-text index over the searchable columns of ``entries``.
+
+``entries_fts`` is an external-content FTS5 table: it stores only the index,
+reads the text back from ``entries`` and is kept in sync by triggers. The
+trigram tokenizer keeps the substring semantics the search box has always had
+with ``LIKE '%term%'`` while letting SQLite answer from the index.
+"""
+import sqlite3
+from markupsafe import escape
+
+FTS_TABLE = 'entries_fts'
+FTS_COLUMNS = ['entry_name', 'tags', 'conditions', 'extra_txt', 'author', 'id_hash']
+# columns the search box "keyword" field looks at
+KEYWORD_COLUMNS = ['entry_name', 'tags', 'conditions', 'extra_txt']
+# the trigram tokenizer cannot match anything shorter than this
+MIN_MATCH_LENGTH = 3
+
+# BM25 weight of each column when ranking by relevance: title above tags above notes
+RANK_WEIGHTS = {'entry_name': 10.0, 'tags': 5.0, 'conditions': 2.0, 'extra_txt': 1.0, 'author': 1.0, 'id_hash': 1.0}
+# snippet() markers around matches, swapped for HTML once the text is escaped
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+_columns = ', '.join(FTS_COLUMNS)
+_new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+_old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+
+fts_schema = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {_columns},
+            content='entries', content_rowid='id', tokenize='trigram'
+        );""",
+    f"""CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+        END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE ON entries BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+        END;""",
+]
+
+REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+def fts_exists(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", (FTS_TABLE,))
+    return cursor.fetchone()[0] > 0
+
+def create_fts(conn):
+    """Create the index and its triggers, backfilling it if it is new."""
+    backfill = not fts_exists(conn)
+    cursor = conn.cursor()
+    for statement in fts_schema:
+        cursor.execute(statement)
+    if backfill:
+        rebuild_fts(conn)
+    conn.commit()
+
+def rebuild_fts(conn):
+    """Re-index every entry from scratch."""
+    cursor = conn.cursor()
+    cursor.execute(REBUILD_SQL)
+    conn.commit()
+
+def fts_query(term, columns=None):
+    """Build an FTS5 query matching ``term`` as a substring of ``columns``."""
+    phrase = '"' + term.replace('"', '""') + '"'
+    if not columns:
+        return phrase
+    return '{' + ' '.join(columns) + '} : ' + phrase
+
+def match_clause(term, columns, id_column='id'):
+    """Return ``(sql, params)`` restricting entries to rows containing ``term``.
+
+    Terms too short for the trigram index fall back to ``LIKE`` on the same
+    columns so results never depend on which path was taken.
+    """
+    if len(term) >= MIN_MATCH_LENGTH:
+        return f'{id_column} IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)', [fts_query(term, columns)]
+    sql = ' OR '.join(f'{column} LIKE ?' for column in columns)
+    return f'({sql})', [f'%{term}%'] * len(columns)
+
+def bm25_expression():
+    """SQL scoring a match with the per-column RANK_WEIGHTS; lower is more relevant."""
+    weights = ', '.join(str(RANK_WEIGHTS[column]) for column in FTS_COLUMNS)
+    return f'bm25({FTS_TABLE}, {weights})'
+
+def excerpt_query(column, context=20):
+    """SQL returning ``(rowid, excerpt)`` for the best matches of ``column``.
+
+    Takes the MATCH query and a LIMIT as parameters. The excerpt spans
+    ``context`` characters either side of the first match, which is marked
+    with HIGHLIGHT_START/HIGHLIGHT_END. It is cut from highlight() because
+    snippet() counts trigrams, not characters, and can split the match.
+    """
+    start = f'max(instr(marked, char(2)) - {context}, 1)'
+    return (f'SELECT id, substr(marked, {start}, instr(marked, char(3)) + {context} - {start} + 1) FROM '
+            f'(SELECT rowid AS id, highlight({FTS_TABLE}, {FTS_COLUMNS.index(column)}, char(2), char(3)) AS marked '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? ORDER BY {bm25_expression()} LIMIT ?)')
+
+def highlight_html(text):
+    """Escape a snippet and wrap its marked matches in <mark>."""
+    text = str(escape(text or ''))
+    return text.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>')
+
+def strip_highlight(text):
+    return (text or '').replace(HIGHLIGHT_START, '').replace(HIGHLIGHT_END, '')
+
+
+if __name__ == '__main__':
+    import sys
+    db_file = sys.argv[1] if len(sys.argv) > 1 else './src/database/db_main.db'
+    conn = sqlite3.connect(db_file)
+    create_fts(conn)
+    rebuild_fts(conn)
+    conn.close()
+    print(f'Rebuilt {FTS_TABLE} in {db_file}')
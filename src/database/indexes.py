@@ -0,0 +1,189 @@
+import re
+
+# Secondary indexes and the migration that creates each one. The hot queries
+# they exist for are checked with EXPLAIN QUERY PLAN in the tests, so a query
+# that silently falls back to a full table scan fails CI.
+indexes = {
+    'idx_entries_id_hash': {
+        'migration': 4,
+        'table': 'entries',
+        'columns': ['id_hash'],
+    },
+    'idx_entries_author_date': {
+        'migration': 4,
+        'table': 'entries',
+        'columns': ['author', 'date'],
+    },
+    'idx_entries_entry_parent': {
+        'migration': 4,
+        'table': 'entries',
+        'columns': ['entry_parent'],
+    },
+    'idx_entries_date': {
+        'migration': 7,
+        'table': 'entries',
+        'columns': ['date'],
+    },
+    'idx_notifications_destination_read_date': {
+        'migration': 4,
+        'table': 'notifications',
+        'columns': ['destination', 'read', 'date'],
+    },
+    'idx_notifications_destination_date': {
+        'migration': 4,
+        'table': 'notifications',
+        'columns': ['destination', 'date'],
+    },
+    'idx_logs_date': {
+        'migration': 4,
+        'table': 'logs',
+        'columns': ['date'],
+    },
+    'idx_logs_username_date': {
+        'migration': 8,
+        'table': 'logs',
+        'columns': ['username', 'date'],
+    },
+    'idx_logs_action_date': {
+        'migration': 8,
+        'table': 'logs',
+        'columns': ['action', 'date'],
+    },
+    'idx_logs_status_date': {
+        'migration': 8,
+        'table': 'logs',
+        'columns': ['status', 'date'],
+    },
+    'idx_logs_date_action_status': {
+        'migration': 8,
+        'table': 'logs',
+        'columns': ['date', 'action', 'status'],
+    },
+    'idx_orders_status_date': {
+        'migration': 4,
+        'table': 'orders',
+        'columns': ['status', 'date'],
+    },
+    'idx_orders_date': {
+        'migration': 4,
+        'table': 'orders',
+        'columns': ['date'],
+    },
+    'idx_tags_tag': {
+        'migration': 4,
+        'table': 'tags',
+        'columns': ['tag'],
+    },
+    'idx_tags_tag_nocase': {
+        'migration': 10,
+        'table': 'tags',
+        'columns': ['tag COLLATE NOCASE'],
+    },
+    'idx_authors_author': {
+        'migration': 4,
+        'table': 'authors',
+        'columns': ['author'],
+    },
+    'idx_entry_tags_tag_entry': {
+        'migration': 5,
+        'table': 'entry_tags',
+        'columns': ['tag_id', 'entry_id'],
+    },
+    'idx_entry_conditions_entry': {
+        'migration': 6,
+        'table': 'entry_conditions',
+        'columns': ['entry_id'],
+    },
+    'idx_entry_conditions_category_item': {
+        'migration': 6,
+        'table': 'entry_conditions',
+        'columns': ['category', 'item', 'entry_id'],
+    },
+    'idx_entry_conditions_item_number': {
+        'migration': 6,
+        'table': 'entry_conditions',
+        'columns': ['item', 'param_number'],
+    },
+    'idx_jobs_status_run_after': {
+        'migration': 9,
+        'table': 'jobs',
+        'columns': ['status', 'run_after'],
+    },
+    'idx_jobs_idempotency_key': {
+        'migration': 9,
+        'table': 'jobs',
+        'columns': ['idempotency_key', 'created_at'],
+    },
+    'idx_jobs_owner': {
+        'migration': 9,
+        'table': 'jobs',
+        'columns': ['owner'],
+    },
+}
+
+def create_index_sql(name):
+    index = indexes[name]
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {index['table']} ({', '.join(index['columns'])})"
+
+def create_indexes(cursor, migration):
+    """Create the indexes introduced by schema migration ``migration``."""
+    for name, index in indexes.items():
+        if index['migration'] == migration:
+            cursor.execute(create_index_sql(name))
+
+def missing_indexes(conn):
+    """Return the names of declared indexes that do not exist in the database."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
+    existing = {row[0] for row in cursor.fetchall()}
+    return [name for name in indexes if name not in existing]
+
+def hot_queries():
+    """Return the fixed hot statements, as executed by the modules that run them.
+
+    Queries built at run time (searches, log explorer pages, order lists) are
+    compiled by the tests and checked with ``full_scans`` as well.
+    """
+    # imported here: these modules import migrate, which imports this one
+    import jobs
+    import log_retention
+    import operators
+    import search_engine
+    import utils
+    return [
+        operators.USER_BY_USERNAME_SQL,  # served by the UNIQUE constraint on users.username
+        operators.ENTRY_BY_HASH_ID_SQL,
+        operators.ID_BY_HASH_ID_SQL,
+        operators.HASH_ID_COUNT_SQL,
+        operators.CLEAR_PARENT_SQL,
+        operators.DELETE_ENTRY_CONDITIONS_SQL,
+        operators.NOTIFICATIONS_SQL,
+        operators.NOTIFICATION_COUNT_SQL,
+        operators.UNREAD_NOTIFICATIONS_SQL,
+        operators.UNREAD_NOTIFICATION_COUNT_SQL,
+        utils.AUTHOR_BY_NAME_SQL,
+        utils.TAG_BY_NAME_SQL,
+        utils.CHILDREN_SQL,
+        search_engine.TIME_LINE_SQL,
+        log_retention.OLD_MONTHS_SQL,
+        log_retention.DELETE_MONTH_SQL,
+        jobs.IDEMPOTENT_JOB_SQL,
+        jobs.OWNER_JOBS_SQL,
+        jobs.CLAIM_SQL,
+        jobs.RECOVER_SQL,
+    ]
+
+def explain_query_plan(conn, query):
+    """Return the detail lines of EXPLAIN QUERY PLAN for ``query``."""
+    cursor = conn.cursor()
+    cursor.execute(f"EXPLAIN QUERY PLAN {query}", (None,) * query.count('?'))
+    return [row[3] for row in cursor.fetchall()]
+
+def full_scans(conn, queries=None):
+    """Return ``(query, plan)`` for every query whose plan scans a whole table."""
+    scans = []
+    for query in queries if queries is not None else hot_queries():
+        plan = explain_query_plan(conn, query)
+        if any(re.fullmatch(r'SCAN \w+', detail) for detail in plan):
+            scans.append((query, plan))
+    return scans
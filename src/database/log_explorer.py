@@ -0,0 +1,191 @@
+"""Filtering, paging and counting the ``logs`` table for the log explorer.
+
+Filters are exact ``username``, ``action`` and ``status`` matches and a
+``start``/``end`` date range. Pages are sorted on the server by ``date`` or
+by one of the filter columns, followed by ``date`` and ``id`` so the order is
+total, and are read with keyset pagination: the cursor of a page holds the
+sort values of its last row and the next page starts strictly after them.
+Every sort column has an index on ``(column, date)``, so a page costs one
+index range walk however deep into the history it lies.
+
+``counts`` aggregates the filtered rows per action and status over hour,
+day or month buckets.
+
+Given the ``archive_file`` of ``log_retention``, both also read the archived
+months whose ``logs_YYYY_MM`` table overlaps the filtered date range. Each
+table is queried on its own, in the page order and up to the page limit,
+and the union of these runs is ordered and cut once more, so paging carries
+on from the live rows into the archive under the same cursors.
+"""
+import base64
+import json
+import os
+import re
+import datetime as dt
+from contextlib import contextmanager
+
+import query_guard
+import log_retention
+
+SORT_COLUMNS = ('date', 'username', 'action', 'status')
+FILTER_COLUMNS = ('username', 'action', 'status')
+# bucket -> length of the date prefix it groups on
+BUCKETS = {'hour': 13, 'day': 10, 'month': 7}
+COLUMNS = 'id, username, action, date, status, error'
+MAX_LIMIT = 500
+
+_date = re.compile(r'\d{4}-\d{2}-\d{2}(?: \d{2}:\d{2}(?::\d{2})?)?')
+
+
+def parse_date(value, end=False):
+    """Return ``value`` as a stored date prefix; a bare day given as ``end`` includes the whole day.
+
+    Raises ValueError for anything else than ``YYYY-MM-DD[ HH:MM[:SS]]``.
+    """
+    value = value.strip().replace('T', ' ')
+    if not _date.fullmatch(value):
+        raise ValueError(f'Invalid date "{value}", expected YYYY-MM-DD or YYYY-MM-DD HH:MM')
+    if end and len(value) == 10:
+        return (dt.date.fromisoformat(value) + dt.timedelta(days=1)).isoformat()
+    return value
+
+
+def parse_filters(args):
+    """Build the filters from request arguments, skipping empty ones."""
+    filters = {}
+    for column in FILTER_COLUMNS:
+        value = (args.get(column) or '').strip()
+        if value:
+            filters[column] = value
+    if (args.get('start') or '').strip():
+        filters['start'] = parse_date(args['start'])
+    if (args.get('end') or '').strip():
+        filters['end'] = parse_date(args['end'], end=True)
+    return filters
+
+
+def where_clause(filters):
+    """Return ``(sql, params)`` for ``filters``; ``end`` is exclusive."""
+    clauses = []
+    params = []
+    for column in FILTER_COLUMNS:
+        if column in filters:
+            clauses.append(f'{column} = ?')
+            params.append(filters[column])
+    if 'start' in filters:
+        clauses.append('date >= ?')
+        params.append(filters['start'])
+    if 'end' in filters:
+        clauses.append('date < ?')
+        params.append(filters['end'])
+    return ' AND '.join(clauses), params
+
+
+def sort_key(sort):
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f'Cannot sort logs by "{sort}"')
+    return ['date', 'id'] if sort == 'date' else [sort, 'date', 'id']
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(token, length):
+    """Return the sort values held by ``token``: text values followed by the integer id.
+
+    Raises ValueError for anything that is not a cursor made by ``encode_cursor``.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        raise ValueError('Invalid page cursor')
+    if not isinstance(values, list) or len(values) != length:
+        raise ValueError('Invalid page cursor')
+    # bool is an int subclass but never an id
+    if not all(isinstance(value, str) for value in values[:-1]) or \
+            not isinstance(values[-1], int) or isinstance(values[-1], bool):
+        raise ValueError('Invalid page cursor')
+    return values
+
+
+def page_query(filters, sort='date', descending=True, after=None, limit=50, tables=('logs',)):
+    """Return ``(sql, params)`` selecting up to ``limit`` rows of ``tables`` after the cursor ``after``."""
+    key = sort_key(sort)
+    where, params = where_clause(filters)
+    clauses = [where] if where else []
+    if after:
+        clauses.append(f'({", ".join(key)}) {"<" if descending else ">"} ({", ".join("?" * len(key))})')
+        params.extend(decode_cursor(after, len(key)))
+    direction = 'DESC' if descending else 'ASC'
+    order = f' ORDER BY {", ".join(f"{column} {direction}" for column in key)} LIMIT ?'
+    selects = [f'SELECT {COLUMNS} FROM {table}' + (' WHERE ' + ' AND '.join(clauses) if clauses else '') + order
+               for table in tables]
+    if len(selects) == 1:
+        return selects[0], params + [limit]
+    # the first rows of each table, merged in the same order
+    sql = ' UNION ALL '.join(f'SELECT * FROM ({select})' for select in selects) + order
+    return sql, (params + [limit]) * len(selects) + [limit]
+
+
+def month_overlaps(month, filters):
+    """True when the archived ``month`` (``'YYYY-MM'``) holds dates within the range of ``filters``."""
+    year, number = map(int, month.split('-'))
+    start, end = f'{month}-01', log_retention.month_start(dt.date(year, number, 1), -1)
+    return ('start' not in filters or end > filters['start']) and ('end' not in filters or start < filters['end'])
+
+
+@contextmanager
+def sources(conn, filters, archive_file=None):
+    """Yield the tables holding the rows of ``filters``: ``logs`` and the overlapping archived months."""
+    if archive_file is None or not os.path.exists(archive_file):
+        yield ['logs']
+        return
+    with log_retention.attached(conn, archive_file):
+        yield ['logs'] + [f'archive.{table}' for month, table in log_retention.month_tables(conn)
+                          if month_overlaps(month, filters)]
+
+
+def page(conn, filters, sort='date', descending=True, after=None, limit=50, archive_file=None):
+    """Return ``(rows, next_cursor)`` of the page following the cursor ``after``.
+
+    ``rows`` are dicts; ``next_cursor`` is None on the last page.
+    """
+    key = sort_key(sort)
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    with sources(conn, filters, archive_file) as tables:
+        # one row more than the page tells whether another page follows
+        sql, params = page_query(filters, sort, descending, after, limit + 1, tables)
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        names = [column[0] for column in cursor.description]
+        rows = [dict(zip(names, row)) for row in query_guard.fetch(cursor)]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1][column] for column in key])
+
+
+def counts_query(filters, bucket='day', tables=('logs',)):
+    """Return ``(sql, params)`` counting the filtered rows of ``tables`` per ``bucket``, action and status."""
+    if bucket not in BUCKETS:
+        raise ValueError(f'Unknown bucket "{bucket}", expected one of {", ".join(BUCKETS)}')
+    where, params = where_clause(filters)
+    where = ' WHERE ' + where if where else ''
+    if len(tables) == 1:
+        source = tables[0] + where
+    else:
+        source = '(' + ' UNION ALL '.join(f'SELECT date, action, status FROM {table}{where}' for table in tables) + ')'
+        params = params * len(tables)
+    sql = f'SELECT substr(date, 1, {BUCKETS[bucket]}) AS bucket, action, status, COUNT(*) FROM {source}'
+    sql += ' GROUP BY bucket, action, status ORDER BY bucket DESC, action, status'
+    return sql, params
+
+
+def counts(conn, filters, bucket='day', archive_file=None):
+    """Return ``[{'bucket', 'action', 'status', 'count'}, ...]`` of the filtered rows, newest bucket first."""
+    with sources(conn, filters, archive_file) as tables:
+        sql, params = counts_query(filters, bucket, tables)
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = query_guard.fetch(cursor)
+    return [{'bucket': row[0], 'action': row[1], 'status': row[2], 'count': row[3]} for row in rows]
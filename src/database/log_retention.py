@@ -0,0 +1,263 @@
+"""Retention of the ``logs`` table.
+
+The live ``logs`` table keeps the last ``LOGS_LIVE_MONTHS`` calendar months,
+the current one included. ``rollover`` moves every older month into its own
+table ``logs_YYYY_MM`` of an archive database, attached to the live one for
+the move, so each month is a partition that can be read or dropped on its
+own. Archived months older than ``LOGS_ARCHIVE_MONTHS`` are dropped by
+``expire`` (0 keeps them forever), and ``compact`` hands the pages freed in
+either file back to the filesystem once they are a large share of it.
+
+Both files use incremental auto-vacuum, so ``compact`` frees pages in steps
+of ``LOGS_COMPACT_PAGES``, each a short write transaction that request
+writers only wait on for a moment. A live database created before that
+setting needs one full ``VACUUM`` to switch over; as it rewrites the whole
+file under the write lock, it only runs inside the off-peak
+``LOGS_VACUUM_HOURS`` window (e.g. ``2-5``; empty, the default, never).
+
+The archive is a separate file next to the live database (``LOGS_ARCHIVE``
+overrides its path), read by the log explorer alongside the live table, and
+is not part of ``/backup``, which only copies the
+live database. With WAL a transaction spanning two attached files is atomic
+in each file but not across both; a month interrupted between the copy and
+the delete is copied again on the next run and ``INSERT OR IGNORE`` on the
+primary key keeps the archive free of duplicates.
+
+``LogRetention`` runs the three steps on a background thread every
+``LOGS_RETENTION_INTERVAL`` seconds.
+"""
+import os
+import re
+import logging
+import threading
+import datetime as dt
+from contextlib import contextmanager
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+LIVE_MONTHS = int(os.environ.get('LOGS_LIVE_MONTHS', 3))
+ARCHIVE_MONTHS = int(os.environ.get('LOGS_ARCHIVE_MONTHS', 0))
+INTERVAL = float(os.environ.get('LOGS_RETENTION_INTERVAL', 6 * 3600))
+# share of free pages above which a database file is compacted
+COMPACT_RATIO = 0.25
+# pages freed per incremental vacuum step
+COMPACT_PAGES = int(os.environ.get('LOGS_COMPACT_PAGES', 1000))
+VACUUM_HOURS = os.environ.get('LOGS_VACUUM_HOURS', '')
+
+ARCHIVE_TABLE_SQL = """CREATE TABLE IF NOT EXISTS archive.{table} (
+                           username text NOT NULL,
+                           action text NOT NULL,
+                           date text NOT NULL,
+                           status text NOT NULL,
+                           error text,
+                           id integer primary key
+                       )"""
+# the log explorer reads archived months in date order
+ARCHIVE_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS archive.idx_{table}_date ON {table} (date)'
+# both served by idx_logs_date
+OLD_MONTHS_SQL = 'SELECT DISTINCT substr(date, 1, 7) FROM logs WHERE date < ?'
+DELETE_MONTH_SQL = 'DELETE FROM logs WHERE date >= ? AND date < ?'
+
+_month_table = re.compile(r'logs_(\d{4})_(\d{2})')
+
+
+def month_start(today, months_back=0):
+    """Return ``'YYYY-MM-01'`` of the month ``months_back`` months before ``today``."""
+    month = today.year * 12 + today.month - 1 - months_back
+    return f'{month // 12:04d}-{month % 12 + 1:02d}-01'
+
+def month_table(month):
+    """Return the archive table of ``month`` (``'YYYY-MM'``)."""
+    return 'logs_' + month.replace('-', '_')
+
+def archive_path(db_file):
+    return os.environ.get('LOGS_ARCHIVE') or os.path.join(os.path.dirname(os.path.abspath(db_file)), 'logs_archive.db')
+
+def parse_hours(spec):
+    """Parse ``"start-end"`` (inclusive, may wrap past midnight) into a set of hours."""
+    spec = spec.strip()
+    if spec == '':
+        return set()
+    start, end = (int(hour) for hour in spec.split('-'))
+    if start <= end:
+        return set(range(start, end + 1))
+    return set(range(start, 24)) | set(range(0, end + 1))
+
+
+@contextmanager
+def attached(conn, archive_file):
+    """Attach ``archive_file`` to ``conn`` as ``archive`` for the block."""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_file,))
+    # takes effect when the archive is created, before its first table
+    conn.execute('PRAGMA archive.auto_vacuum = INCREMENTAL')
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.execute('DETACH DATABASE archive')
+
+
+def rollover(conn, archive_file, live_months=None, today=None):
+    """Move the months before the live window into the archive.
+
+    Returns ``{'YYYY-MM': rows moved}``.
+    """
+    live_months = LIVE_MONTHS if live_months is None else live_months
+    cutoff = month_start(today or dt.date.today(), max(live_months - 1, 0))
+    cursor = conn.cursor()
+    cursor.execute(OLD_MONTHS_SQL, (cutoff,))
+    months = sorted(row[0] for row in cursor.fetchall() if re.fullmatch(r'\d{4}-\d{2}', row[0] or ''))
+    moved = {}
+    if not months:
+        return moved
+
+    with attached(conn, archive_file):
+        for month in months:
+            year, number = map(int, month.split('-'))
+            start = f'{month}-01'
+            end = month_start(dt.date(year, number, 1), -1)
+            table = month_table(month)
+            cursor.execute('BEGIN')
+            cursor.execute(ARCHIVE_TABLE_SQL.format(table=table))
+            cursor.execute(ARCHIVE_INDEX_SQL.format(table=table))
+            cursor.execute(f'INSERT OR IGNORE INTO archive.{table} SELECT * FROM logs WHERE date >= ? AND date < ?',
+                           (start, end))
+            cursor.execute(DELETE_MONTH_SQL, (start, end))
+            moved[month] = cursor.rowcount
+            conn.commit()
+    return moved
+
+
+def month_tables(conn):
+    """Return ``[('YYYY-MM', table), ...]`` of the archive attached to ``conn``, oldest first."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM archive.sqlite_master WHERE type='table' AND name LIKE 'logs\\_%' ESCAPE '\\'")
+    months = []
+    for (table,) in cursor.fetchall():
+        match = _month_table.fullmatch(table)
+        if match:
+            months.append((f'{match.group(1)}-{match.group(2)}', table))
+    return sorted(months)
+
+
+def archived_months(conn, archive_file):
+    """Return ``[('YYYY-MM', rows), ...]`` of the archive, oldest first."""
+    if not os.path.exists(archive_file):
+        return []
+    with attached(conn, archive_file):
+        cursor = conn.cursor()
+        months = []
+        for month, table in month_tables(conn):
+            cursor.execute(f'SELECT COUNT(*) FROM archive.{table}')
+            months.append((month, cursor.fetchone()[0]))
+    return months
+
+
+def expire(conn, archive_file, archive_months=None, today=None):
+    """Drop the archived months older than ``archive_months``; 0 keeps every month.
+
+    Returns the months dropped.
+    """
+    archive_months = ARCHIVE_MONTHS if archive_months is None else archive_months
+    if archive_months <= 0:
+        return []
+    cutoff = month_start(today or dt.date.today(), archive_months)[:7]
+    expired = [month for month, _ in archived_months(conn, archive_file) if month < cutoff]
+    if expired:
+        with attached(conn, archive_file):
+            for month in expired:
+                conn.execute(f'DROP TABLE IF EXISTS archive.{month_table(month)}')
+            conn.commit()
+    return expired
+
+
+def free_ratio(conn, schema='main'):
+    pages = conn.execute(f'PRAGMA {schema}.page_count').fetchone()[0]
+    free = conn.execute(f'PRAGMA {schema}.freelist_count').fetchone()[0]
+    return free / pages if pages else 0.0
+
+def compact_schema(conn, schema, ratio=COMPACT_RATIO, pages=COMPACT_PAGES, off_peak=False):
+    """Free the pages of ``schema`` once they exceed ``ratio``; returns whether it was compacted."""
+    if free_ratio(conn, schema) <= ratio:
+        return False
+    if conn.execute(f'PRAGMA {schema}.auto_vacuum').fetchone()[0] != 2:
+        if not off_peak:
+            logger.info('%s has no incremental auto-vacuum yet; it is vacuumed within LOGS_VACUUM_HOURS', schema)
+            return False
+        conn.execute(f'PRAGMA {schema}.auto_vacuum = INCREMENTAL')
+        conn.execute(f'VACUUM {schema}')
+        return True
+    while conn.execute(f'PRAGMA {schema}.freelist_count').fetchone()[0] > 0:
+        # executescript steps the pragma to the end; execute() would free a single page
+        conn.executescript(f'PRAGMA {schema}.incremental_vacuum({int(pages)})')
+    return True
+
+def compact(conn, archive_file=None, ratio=COMPACT_RATIO, pages=COMPACT_PAGES, now=None):
+    """Hand the free pages of the live database, and the archive, back to the filesystem.
+
+    Returns the schemas that were compacted.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    off_peak = (now or dt.datetime.now()).hour in parse_hours(VACUUM_HOURS)
+    compacted = []
+    if compact_schema(conn, 'main', ratio, pages, off_peak):
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        compacted.append('main')
+    if archive_file is not None and os.path.exists(archive_file):
+        with attached(conn, archive_file):
+            # only retention writes the archive, so it is switched over at once
+            if compact_schema(conn, 'archive', ratio, pages, off_peak=True):
+                compacted.append('archive')
+    return compacted
+
+
+class LogRetention():
+    def __init__(self, db_configs, archive_file=None, live_months=None, archive_months=None,
+                 interval=None) -> None:
+        self.db_configs = db_configs
+        self.archive_file = archive_file or archive_path(db_configs.pool.db_file)
+        self.live_months = LIVE_MONTHS if live_months is None else live_months
+        self.archive_months = ARCHIVE_MONTHS if archive_months is None else archive_months
+        self.interval = INTERVAL if interval is None else interval
+        self.last_run = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, today=None):
+        """Roll over, expire and compact once; returns what was done."""
+        conn = self.db_configs.pool.thread_conn()
+        result = {
+            'moved': rollover(conn, self.archive_file, self.live_months, today),
+            'expired': expire(conn, self.archive_file, self.archive_months, today),
+        }
+        result['compacted'] = compact(conn, self.archive_file)
+        self.last_run = result
+        return result
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                result = self.run_once()
+                if result['moved'] or result['expired'] or result['compacted']:
+                    logger.info('Logs retention: moved %s, expired %s, compacted %s',
+                                result['moved'], result['expired'], result['compacted'])
+            except Exception as e:
+                utils.error_log(e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='logs-retention', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
@@ -1,6 +1,14 @@
 import sqlite3
+import logging
+import datetime as dt
 from typing import List, Tuple
 
+import full_text
+import indexes
+import operators
+
+logger = logging.getLogger(__name__)
+
 def get_table_schema(cursor, table_name: str) -> List[Tuple]:
     """Get the current schema of a table"""
     cursor.execute(f"PRAGMA table_info({table_name})")
@@ -40,57 +48,188 @@ def get_expected_schemas() -> dict:
         # Add other tables as needed
     }
 
-def migrate_database():
-    """Check and update all tables to match expected schema"""
+def get_existing_tables(cursor) -> List[str]:
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    return [table[0] for table in cursor.fetchall()]
+
+### Migrations ###
+# Each migration runs in its own transaction and is recorded in schema_version.
+# Append new steps to the end of `migrations`; never renumber or edit applied ones.
+
+def create_base_tables(cursor, table_lists):
+    for table in table_lists:
+        cursor.execute(table)
+
+def add_missing_columns(cursor, table_lists):
+    """Bring databases created by older releases up to the expected columns."""
+    existing_tables = get_existing_tables(cursor)
+    for table_name, expected_columns in get_expected_schemas().items():
+        if table_name not in existing_tables:
+            continue
+
+        current_columns = [col[1] for col in get_table_schema(cursor, table_name)]
+        for col_name, col_type, notnull, default, pk in expected_columns:
+            if col_name not in current_columns:
+                # SQLite cannot add a NOT NULL column without a default to a populated table
+                notnull_str = "NOT NULL" if notnull and default is not None else ""
+                default_str = f"DEFAULT {default}" if default else ""
+                alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type} {notnull_str} {default_str}"
+                cursor.execute(alter_sql.strip())
+                logger.info("Added column %s to %s", col_name, table_name)
+
+                # Special case for email_enabled: set default value for existing rows
+                if col_name == 'email_enabled':
+                    cursor.execute(f"UPDATE {table_name} SET email_enabled = 1 WHERE email_enabled IS NULL")
+
+def create_full_text_index(cursor, table_lists):
+    for statement in full_text.fts_schema:
+        cursor.execute(statement)
+    cursor.execute(full_text.REBUILD_SQL)
+
+def create_secondary_indexes(cursor, table_lists):
+    indexes.create_indexes(cursor, 4)
+
+def create_entry_tags(cursor, table_lists):
+    """Normalize the comma-joined entries.tags into an indexed junction table."""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS entry_tags (
+                        entry_id integer NOT NULL,
+                        tag_id integer NOT NULL,
+                        PRIMARY KEY (entry_id, tag_id)
+                    ) WITHOUT ROWID;""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS entry_tags_delete AFTER DELETE ON entries BEGIN
+                        DELETE FROM entry_tags WHERE entry_id = old.id;
+                    END;""")
+    indexes.create_indexes(cursor, 5)
+
+    # backfill from the existing tag strings
+    cursor.execute("SELECT id, tags FROM entries WHERE tags IS NOT NULL AND tags != ''")
+    for entry_id, tags in cursor.fetchall():
+        for tag in set(tag.strip() for tag in tags.split(',')):
+            if tag == '':
+                continue
+            cursor.execute("SELECT id FROM tags WHERE tag=? ORDER BY id LIMIT 1", (tag,))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute("INSERT INTO tags (tag) VALUES (?)", (tag,))
+                tag_id = cursor.lastrowid
+            else:
+                tag_id = row[0]
+            cursor.execute("INSERT OR IGNORE INTO entry_tags VALUES (?, ?)", (entry_id, tag_id))
+
+def create_entry_conditions(cursor, table_lists):
+    """Store each entry condition as a row so categories, items and PARAM values are indexable."""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS entry_conditions (
+                        entry_id integer NOT NULL,
+                        template text,
+                        category text,
+                        subcategory text,
+                        item text NOT NULL,
+                        param_value text,
+                        param_number real
+                    );""")
+    cursor.execute("""CREATE TRIGGER IF NOT EXISTS entry_conditions_delete AFTER DELETE ON entries BEGIN
+                        DELETE FROM entry_conditions WHERE entry_id = old.id;
+                    END;""")
+    indexes.create_indexes(cursor, 6)
+
+    # backfill from the existing condition strings
+    cursor.execute("SELECT id, conditions FROM entries WHERE conditions IS NOT NULL AND conditions != ''")
+    for entry_id, conditions in cursor.fetchall():
+        operators.set_entry_conditions(cursor.connection, entry_id, conditions)
+
+def create_pagination_index(cursor, table_lists):
+    indexes.create_indexes(cursor, 7)
+
+def create_logs_explorer_indexes(cursor, table_lists):
+    indexes.create_indexes(cursor, 8)
+
+def create_jobs(cursor, table_lists):
+    """Queue of background jobs run by the worker pool in jobs.py."""
+    cursor.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                        id integer primary key autoincrement,
+                        kind text NOT NULL,
+                        payload text NOT NULL,
+                        status text NOT NULL,
+                        progress real NOT NULL DEFAULT 0,
+                        message text,
+                        result text,
+                        error text,
+                        attempts integer NOT NULL DEFAULT 0,
+                        max_attempts integer NOT NULL DEFAULT 3,
+                        owner text,
+                        idempotency_key text,
+                        checkpoint text,
+                        run_after text NOT NULL,
+                        created_at text NOT NULL,
+                        updated_at text NOT NULL
+                    );""")
+    indexes.create_indexes(cursor, 9)
+
+def create_tag_nocase_index(cursor, table_lists):
+    indexes.create_indexes(cursor, 10)
+
+migrations = [
+    (1, 'create base tables', create_base_tables),
+    (2, 'add columns missing from older databases', add_missing_columns),
+    (3, 'full-text index over entries', create_full_text_index),
+    (4, 'secondary indexes for hot queries', create_secondary_indexes),
+    (5, 'entry_tags junction table', create_entry_tags),
+    (6, 'entry_conditions table', create_entry_conditions),
+    (7, 'entries date index for keyset pagination', create_pagination_index),
+    (8, 'logs indexes for the log explorer', create_logs_explorer_indexes),
+    (9, 'jobs table', create_jobs),
+    (10, 'case-insensitive tags index for tag filters', create_tag_nocase_index),
+]
+
+SCHEMA_VERSION = migrations[-1][0]
+
+def get_schema_version(conn) -> int:
+    """Return the version recorded in schema_version, or 0 for a new database."""
     try:
-        conn = sqlite3.connect('./src/database/db_main.db')
         cursor = conn.cursor()
-        
-        # Get list of all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-        existing_tables = [table[0] for table in cursor.fetchall()]
-        
-        expected_schemas = get_expected_schemas()
-        migrations_performed = []
-        
-        for table_name, expected_columns in expected_schemas.items():
-            if table_name not in existing_tables:
-                continue
-                
-            current_schema = get_table_schema(cursor, table_name)
-            current_columns = [col[1] for col in current_schema]
-            
-            # Check for missing columns
-            for col_name, col_type, notnull, default, pk in expected_columns:
-                if col_name not in current_columns:
-                    default_str = f"DEFAULT {default}" if default else ""
-                    notnull_str = "NOT NULL" if notnull else ""
-                    
-                    alter_sql = f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type} {notnull_str} {default_str}"
-                    cursor.execute(alter_sql.strip())
-                    migrations_performed.append(f"Added column {col_name} to {table_name}")
-                    
-                    # Special case for email_enabled: set default value for existing rows
-                    if col_name == 'email_enabled':
-                        cursor.execute(f"UPDATE {table_name} SET email_enabled = 1 WHERE email_enabled IS NULL")
-                        migrations_performed.append(f"Set default email_enabled=1 for existing users")
-            
-            conn.commit()
-        
-        conn.close()
-        
-        if migrations_performed:
-            print("Database migrations performed:")
-            for migration in migrations_performed:
-                print(f"- {migration}")
-        else:
-            print("Database schema is up to date")
-            
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        version = cursor.fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    return version or 0
+
+def migrate_database(conn, table_lists) -> bool:
+    """Apply every migration newer than the stored schema version.
+
+    When the database is already at SCHEMA_VERSION this is a single query and
+    no table is introspected.
+    """
+    current_version = get_schema_version(conn)
+    if current_version >= SCHEMA_VERSION:
         return True
-        
-    except Exception as e:
-        print(f"Error during database migration: {str(e)}")
-        return False
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+                        version integer primary key,
+                        description text NOT NULL,
+                        applied_at text NOT NULL
+                    );""")
+
+    for version, description, migration in migrations:
+        if version <= current_version:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration(cursor, table_lists)
+            cursor.execute("INSERT INTO schema_version VALUES (?, ?, ?)",
+                           (version, description, dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+            logger.info("Database migration %s applied: %s", version, description)
+        except Exception as e:
+            conn.rollback()
+            logger.error("Error during database migration %s (%s): %s", version, description, e)
+            return False
+
+    return True
 
 if __name__ == "__main__":
-    migrate_database() 
\ No newline at end of file
+    import configs
+    db_configs = configs.database_configs()
+    migrate_database(db_configs.get_conn(), db_configs.table_lists)
@@ -5,20 +5,38 @@ parent_parent_path = str(pathlib.Path(__file__).parent.parent.absolute())
 sys.path.append(os.path.join(parent_parent_path, 'utils'))
 
 import utils
+import autocomplete
+import search_cache
 from dictianory import slef_made_codes
 import sqlite3
 from sqlite3 import Error
 import itertools
 import hashlib
 import datetime as dt
+import logging
+
+logger = logging.getLogger(__name__)
+
+# hot statements, checked against full table scans by indexes.hot_queries
+USER_BY_USERNAME_SQL = 'SELECT * FROM users WHERE username=?'
+ENTRY_BY_HASH_ID_SQL = 'SELECT * FROM entries WHERE id_hash=?'
+ID_BY_HASH_ID_SQL = 'SELECT id FROM entries WHERE id_hash=?'
+HASH_ID_COUNT_SQL = 'SELECT COUNT(*) FROM entries WHERE id_hash=?'
+CLEAR_PARENT_SQL = "UPDATE entries SET entry_parent='' WHERE entry_parent=?"
+DELETE_ENTRY_CONDITIONS_SQL = 'DELETE FROM entry_conditions WHERE entry_id=?'
+NOTIFICATIONS_SQL = ('SELECT id, author, message, date, destination, read, type, reference_id FROM notifications '
+                     'WHERE destination = ? ORDER BY date DESC LIMIT ? OFFSET ?')
+NOTIFICATION_COUNT_SQL = 'SELECT COUNT(*) FROM notifications WHERE destination = ?'
+UNREAD_NOTIFICATIONS_SQL = 'SELECT * FROM notifications WHERE destination = ? AND read = 0'
+UNREAD_NOTIFICATION_COUNT_SQL = 'SELECT COUNT(*) FROM notifications WHERE destination = ? AND read = 0'
 
 def create_connection(db_file):
     conn = None
     try:
         conn = sqlite3.connect(db_file, check_same_thread=False)
-        print('Connected to database using SQLite')
+        logger.info('Connected to database using SQLite')
     except Error as e:
-        print(e)
+        utils.error_log(e)
     return conn
 
 def create_table(conn, create_table_sql):
@@ -36,6 +54,7 @@ def add_user(conn, username, password, admin, order_manager, name, email, email_
         cursor.execute('insert into users (username, password, admin, order_manager, name, email, email_enabled) values (?,?,?,?,?,?,?)', 
                       (username, hashed_password, admin, order_manager, name, email, email_enabled))
         conn.commit()
+        autocomplete.appended('usernames')
         return True
     except Error as e:
         utils.error_log(e)
@@ -98,6 +117,7 @@ def delete_user(conn, user_id):
         cursor = conn.cursor()
         cursor.execute('delete from users where id=?', (user_id,))
         conn.commit()
+        autocomplete.invalidate('usernames')
         return True
     except Error as e:
         utils.error_log(e)
@@ -126,7 +146,7 @@ def get_users(conn):
 def get_user_by_username(conn, username):
     try:
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE username=?', (username,))
+        cursor.execute(USER_BY_USERNAME_SQL, (username,))
         user = cursor.fetchone()
         
         if not user:
@@ -171,9 +191,14 @@ def insert_entry_to_db(conn, Author, date, Tags, File_Path, Notes, conditions, e
         insert_author(conn, Author)
         cursor = conn.cursor()
         hash_id = utils.generate_hash(conn)
-        rows = [(hash_id, Tags, Notes, File_Path, date, Author, conditions, entry_name, parent_entry, None)]
-        cursor.executemany('insert into entries values (?,?,?,?,?,?,?,?,?,?)', rows)
+        row = (hash_id, Tags, Notes, File_Path, date, Author, conditions, entry_name, parent_entry, None)
+        cursor.execute('insert into entries values (?,?,?,?,?,?,?,?,?,?)', row)
+        entry_id = cursor.lastrowid
+        set_entry_tags(conn, entry_id, Tags_parsed)
+        set_entry_conditions(conn, entry_id, conditions)
         conn.commit()
+        search_cache.invalidate()
+        autocomplete.appended('titles')
         success_bool = 1
     except Error as e:
         utils.error_log(e)
@@ -227,9 +252,17 @@ def update_entry_in_db(conn, id, post_form, app_config, hash_id, Files):
         
         # Update the database
         cursor = conn.cursor()
+        cursor.execute('select entry_name from entries where id=?', (id,))
+        old_entry_name = cursor.fetchone()
         rows = [(Tags, Notes, File_Path, date, conditions, entry_name, parent_entry, id)]
         cursor.executemany('update entries set tags=?, extra_txt=?, file_path=?, date=?, conditions=?, entry_name=?, entry_parent=? where id=?', rows)
+        set_entry_tags(conn, id, Tags_parsed)
+        set_entry_conditions(conn, id, conditions)
         conn.commit()
+        search_cache.invalidate()
+        # only a rename changes the titles autocomplete
+        if old_entry_name is None or old_entry_name[0] != entry_name:
+            autocomplete.invalidate('titles')
         success_bool = 1
 
     except Exception as e:
@@ -238,12 +271,21 @@ def update_entry_in_db(conn, id, post_form, app_config, hash_id, Files):
     
     return success_bool
 
+def update_entry_title(conn, id, entry_name):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE entries SET entry_name=? WHERE id=?", (entry_name, id))
+    conn.commit()
+    search_cache.invalidate()
+    autocomplete.invalidate('titles')
+
 def delete_entry_from_db(conn, id):
     try:
         hash_id = utils.get_hash_id_by_entry_id(conn, id)
         cursor = conn.cursor()
         cursor.execute('delete from entries where id=?', (id,))
         conn.commit()
+        search_cache.invalidate()
+        autocomplete.invalidate('titles')
         remove_deleted_entry_as_parent(conn, hash_id)
         delete_author(conn, id)
         success_bool = 1
@@ -255,8 +297,9 @@ def delete_entry_from_db(conn, id):
 def remove_deleted_entry_as_parent(conn, hash_id):
     try:
         cursor = conn.cursor()
-        cursor.execute("update entries set entry_parent='' where entry_parent=?", (hash_id,))
+        cursor.execute(CLEAR_PARENT_SQL, (hash_id,))
         conn.commit()
+        search_cache.invalidate()
         success_bool = 1
     except Error as e:
         utils.error_log(e)
@@ -271,9 +314,9 @@ def get_entry_by_id(conn, entry_id):
             # Check if the first element is success_bool and it's 1 (success)
             if entry_id[0] == 1:
                 # Use the hash_id to find the entry
-                cursor.execute("SELECT * FROM entries WHERE id_hash=?", (entry_id[1],))
+                cursor.execute(ENTRY_BY_HASH_ID_SQL, (entry_id[1],))
             else:
-                print(f"Entry insertion was not successful: {entry_id}")
+                logger.warning("Entry insertion was not successful: %s", entry_id)
                 return None
         else:
             # Use the id directly
@@ -291,12 +334,10 @@ def get_entry_by_id(conn, entry_id):
                 entry_dict = {columns[i]: entry[i] for i in range(len(columns))}
             return entry_dict
         else:
-            print(f"No entry found with ID: {entry_id}")
+            logger.debug("No entry found with ID: %s", entry_id)
             return None
     except Error as e:
         utils.error_log(e)
-        print(f"{type(e)} operators.py 269")
-        print(f"Error retrieving entry with ID {entry_id}: {e}")
         return None
 
 def get_hash_id_by_entry_id(conn, entry_id):
@@ -314,7 +355,7 @@ def get_hash_id_by_entry_id(conn, entry_id):
 def get_id_by_hash_id(conn, hash_id):
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT id FROM entries WHERE id_hash=?", (hash_id,))
+        cursor.execute(ID_BY_HASH_ID_SQL, (hash_id,))
         result = cursor.fetchone()
         if result:
             return result[0]
@@ -328,7 +369,7 @@ def check_hash_id_existence(conn, hash_id):
         return False
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM entries WHERE id_hash=?", (hash_id,))
+        cursor.execute(HASH_ID_COUNT_SQL, (hash_id,))
         count = cursor.fetchone()[0]
         return count > 0
     except Error as e:
@@ -344,12 +385,20 @@ def insert_tag(conn, Tags_parsed):
                 rows = [(tag, None)]
                 cursor.executemany('insert into tags values (?, ?)', rows)
                 conn.commit()
+                autocomplete.appended('tags')
         success_bool = 1
     except Error as e:
         utils.error_log(e)
         success_bool = 0
     return success_bool
 
+def set_entry_tags(conn, entry_id, Tags_parsed):
+    """Replace the entry_tags rows of an entry; the caller commits."""
+    cursor = conn.cursor()
+    cursor.execute('delete from entry_tags where entry_id=?', (entry_id,))
+    rows = [(entry_id, tag) for tag in set(Tags_parsed) if tag != '']
+    cursor.executemany('insert or ignore into entry_tags (entry_id, tag_id) select ?, id from tags where tag=? order by id limit 1', rows)
+
 def get_all_tags(conn):
     try:
         cursor = conn.cursor()
@@ -368,6 +417,7 @@ def insert_author(conn, Author):
             rows = [(Author, None)]
             cursor.executemany('insert into authors values (?, ?)', rows)
             conn.commit()
+            autocomplete.appended('authors')
         success_bool = 1
     except Error as e:
         utils.error_log(e)
@@ -379,6 +429,7 @@ def delete_author(conn, id):
         cursor = conn.cursor()
         cursor.execute('delete from authors where id=?', (id,))
         conn.commit()
+        autocomplete.invalidate('authors')
 
 def get_all_authors(conn):
     try:
@@ -405,6 +456,13 @@ def insert_conditions(conn, conditions):
         success_bool = 0
     return success_bool
 
+def set_entry_conditions(conn, entry_id, conditions):
+    """Replace the entry_conditions rows of an entry; the caller commits."""
+    cursor = conn.cursor()
+    cursor.execute(DELETE_ENTRY_CONDITIONS_SQL, (entry_id,))
+    rows = [(entry_id,) + row for row in utils.structure_conditions(conditions)]
+    cursor.executemany('insert into entry_conditions (entry_id, template, category, subcategory, item, param_value, param_number) values (?,?,?,?,?,?,?)', rows)
+
 def update_conditions_templates(conn, post_form, username):
     post_form = post_form.to_dict()
     new_template_name = post_form['new_template_name']
@@ -490,43 +548,47 @@ def verify_password(stored_password, provided_password):
     return hash_obj.hex() == hash_hex
 
 ### Order Operations ###
+def orders_query(search_term='', author_term='', status_filter='', date_start='', date_end='', limit=10, offset=0):
+    """Return ``(query, params)`` selecting a page of the filtered orders, newest first."""
+    query = "SELECT * FROM orders WHERE 1=1"
+    params = []
+    
+    if search_term:
+        query += " AND order_name LIKE ?"
+        params.append(f'%{search_term}%')
+    
+    if author_term:
+        # Split author terms by comma and create OR conditions
+        author_terms = [term.strip() for term in author_term.split(',') if term.strip()]
+        if author_terms:
+            author_conditions = []
+            for term in author_terms:
+                author_conditions.append("order_author LIKE ?")
+                params.append(f'%{term}%')
+            query += f" AND ({' OR '.join(author_conditions)})"
+    
+    if status_filter:
+        query += " AND status = ?"
+        params.append(status_filter)
+    
+    if date_start:
+        query += " AND date >= ?"
+        params.append(date_start)
+    
+    if date_end:
+        query += " AND date <= ?"
+        # Add 23:59:59 to include the entire end day
+        params.append(f"{date_end} 23:59:59")
+    
+    # Add ordering and pagination
+    query += " ORDER BY date DESC LIMIT ? OFFSET ?"
+    params.append(limit)
+    params.append(offset)
+    return query, params
+
 def get_orders(conn, search_term='', author_term='', status_filter='', date_start='', date_end='', limit=10, offset=0):
     try:
-        # Build the query
-        query = "SELECT * FROM orders WHERE 1=1"
-        params = []
-        
-        if search_term:
-            query += " AND order_name LIKE ?"
-            params.append(f'%{search_term}%')
-        
-        if author_term:
-            # Split author terms by comma and create OR conditions
-            author_terms = [term.strip() for term in author_term.split(',') if term.strip()]
-            if author_terms:
-                author_conditions = []
-                for term in author_terms:
-                    author_conditions.append("order_author LIKE ?")
-                    params.append(f'%{term}%')
-                query += f" AND ({' OR '.join(author_conditions)})"
-        
-        if status_filter:
-            query += " AND status = ?"
-            params.append(status_filter)
-        
-        if date_start:
-            query += " AND date >= ?"
-            params.append(date_start)
-        
-        if date_end:
-            query += " AND date <= ?"
-            # Add 23:59:59 to include the entire end day
-            params.append(f"{date_end} 23:59:59")
-        
-        # Add ordering and pagination
-        query += " ORDER BY date DESC LIMIT ? OFFSET ?"
-        params.append(limit)
-        params.append(offset)
+        query, params = orders_query(search_term, author_term, status_filter, date_start, date_end, limit, offset)
         
         # Execute the query
         cursor = conn.cursor()
@@ -663,13 +725,7 @@ def add_notification(conn, author, message, destination, notification_type, refe
 def get_notifications(conn, username, limit=10, offset=0):
     try:
         cursor = conn.cursor()
-        cursor.execute(
-            '''SELECT id, author, message, date, destination, read, type, reference_id 
-               FROM notifications 
-               WHERE destination = ? 
-               ORDER BY date DESC LIMIT ? OFFSET ?''',
-            (username, limit, offset)
-        )
+        cursor.execute(NOTIFICATIONS_SQL, (username, limit, offset))
         notifications = []
         for row in cursor.fetchall():
             notifications.append({
@@ -700,13 +756,28 @@ def mark_notification_read(conn, notification_id):
 def get_unread_notification_count(conn, username):
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM notifications WHERE destination=? AND read=0", (username,))
+        cursor.execute(UNREAD_NOTIFICATION_COUNT_SQL, (username,))
         count = cursor.fetchone()[0]
         return count
     except Error as e:
         utils.error_log(e)
         return 0
 
+def count_notifications(conn, username):
+    try:
+        cursor = conn.cursor()
+        cursor.execute(NOTIFICATION_COUNT_SQL, (username,))
+        return cursor.fetchone()[0]
+    except Error as e:
+        utils.error_log(e)
+        return 0
+
+def get_unread_notifications(conn, username):
+    cursor = conn.cursor()
+    cursor.execute(UNREAD_NOTIFICATIONS_SQL, (username,))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
 ### Log Operations ###
 def add_log(conn, username, action, status='pass', error=None):
     try:
@@ -720,22 +791,6 @@ def add_log(conn, username, action, status='pass', error=None):
         utils.error_log(e)
         return False
 
-def get_recent_logs(conn, days=7):
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM logs WHERE date > date('now', '-? days')", (days,))
-        logs = cursor.fetchall()
-        
-        # Get column names
-        cursor.execute("PRAGMA table_info(logs)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        # Convert to list of dictionaries
-        return [dict(zip(columns, log)) for log in logs]
-    except Error as e:
-        utils.error_log(e)
-        return []
-
 ### Password Reset Operations ###
 def create_password_reset_token(conn, username, token, expiry):
     try:
@@ -796,4 +851,5 @@ def get_column_names(conn, table_name):
 def set_parent_entry(conn, entry_id, parent_hash_id):
     cursor = conn.cursor()
     cursor.execute('update entries set entry_parent=? where id=?', (parent_hash_id, entry_id))
-    conn.commit()
\ No newline at end of file
+    conn.commit()
+    search_cache.invalidate()
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""Per-request SQL tracing, slow-query log and N+1 detection.
+
+Connections opened by the pool are ``TracedConnection``s. While a request is
+being traced (``start``/``finish`` around it) every statement run on the
+thread is recorded with its normalized text, duration and row count:
+cursor calls are timed by the wrappers below, including the time spent
+fetching rows, and the statements SQLite runs outside of them (transaction
+control, ``executescript``) are picked up through ``set_trace_callback``.
+
+``finish`` returns the request summary and keeps the statements slower than
+``SLOW_QUERY_MS`` in ``slow_queries``. A statement shape repeated at least
+``N_PLUS_ONE_THRESHOLD`` times within one request is flagged as N+1.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+
+# rolling logs for the admin page, newest last
+slow_queries = deque(maxlen=200)
+recent_requests = deque(maxlen=100)
+
+_local = threading.local()
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_spaces = re.compile(r'\s+')
+
+def normalize(sql):
+    """Return the shape of ``sql``: literals replaced by ``?``, lists and whitespace collapsed."""
+    sql = _literals.sub('?', sql)
+    sql = _in_lists.sub('(?)', sql)
+    return _spaces.sub(' ', sql).strip()
+
+
+class RequestTrace():
+    def __init__(self, endpoint) -> None:
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.statements = []  # [shape, seconds, rows]
+        self.in_cursor = False
+
+    def add(self, sql, seconds=0.0, rows=0):
+        statement = [normalize(sql), seconds, rows]
+        self.statements.append(statement)
+        return statement
+
+    def on_trace(self, sql):
+        # statements run through a traced cursor are recorded by the cursor;
+        # FTS5 reports the reads of its shadow tables as '-- ' comments
+        if not self.in_cursor and not sql.startswith('--'):
+            self.add(sql)
+
+    def summary(self):
+        shapes = {}
+        for shape, seconds, rows in self.statements:
+            count, total = shapes.get(shape, (0, 0.0))
+            shapes[shape] = (count + 1, total + seconds)
+        return {
+            'endpoint': self.endpoint,
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'duration_ms': (time.perf_counter() - self.started) * 1000,
+            'queries': len(self.statements),
+            'sql_ms': sum(seconds for _, seconds, _ in self.statements) * 1000,
+            'rows': sum(rows for _, _, rows in self.statements),
+            'n_plus_one': [{'sql': shape, 'count': count, 'sql_ms': total * 1000}
+                           for shape, (count, total) in shapes.items() if count >= N_PLUS_ONE_THRESHOLD],
+        }
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+def start(endpoint, conn=None):
+    """Trace the statements of the calling thread until ``finish``."""
+    trace = RequestTrace(endpoint)
+    _local.trace = trace
+    if conn is not None:
+        conn.set_trace_callback(trace.on_trace)
+        _local.conn = conn
+    return trace
+
+def finish():
+    """Stop tracing the calling thread and return the request summary, or None."""
+    trace = getattr(_local, 'trace', None)
+    conn = getattr(_local, 'conn', None)
+    _local.trace = None
+    _local.conn = None
+    if conn is not None:
+        conn.set_trace_callback(None)
+    if trace is None:
+        return None
+    for shape, seconds, rows in trace.statements:
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            slow_queries.append({'endpoint': trace.endpoint, 'sql': shape, 'duration_ms': seconds * 1000,
+                                 'rows': rows, 'date': time.strftime('%Y-%m-%d %H:%M:%S')})
+    summary = trace.summary()
+    recent_requests.append(summary)
+    return summary
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor timing its statements and counting their rows for the current trace."""
+    _statement = None
+
+    def _run(self, method, sql, args):
+        trace = current()
+        if trace is None:
+            return method(self, sql, *args)
+        trace.in_cursor = True
+        began = time.perf_counter()
+        try:
+            return method(self, sql, *args)
+        finally:
+            trace.in_cursor = False
+            self._statement = trace.add(sql, time.perf_counter() - began,
+                                        max(super().rowcount, 0))
+
+    def execute(self, sql, *args):
+        return self._run(sqlite3.Cursor.execute, sql, args)
+
+    def executemany(self, sql, *args):
+        return self._run(sqlite3.Cursor.executemany, sql, args)
+
+    def _fetch(self, method, *args):
+        statement = self._statement
+        if statement is None:
+            return method(self, *args)
+        began = time.perf_counter()
+        rows = method(self, *args)
+        statement[1] += time.perf_counter() - began
+        statement[2] += len(rows) if isinstance(rows, list) else int(rows is not None)
+        return rows
+
+    def fetchone(self):
+        return self._fetch(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(sqlite3.Cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(sqlite3.Cursor.fetchall)
+
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
@@ -13,19 +13,20 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+import log_config
 import operators
 import configs
 import utils
 import api
 
+# one queued logging pipeline for the whole process (DEBUG=1 for diagnostics)
+log_config.setup()
+
 # database configuration
 db_configs = configs.database_configs()
-# if not utils.check_existence_table(db_configs):
+# create the database or bring it up to the latest schema version
 utils.init_db(db_configs)
 
-# apply updates to the database (if exists)
-utils.apply_updates2db(db_configs)
-
 # Args parser from command line
 @click.command()
 @click.option('--server_ip', default='localhost', help='Server address')
@@ -35,7 +36,10 @@ utils.apply_updates2db(db_configs)
 @click.option('--num_threads', '-nt', default=6, help='Number of threads to run the server on')
 @click.option('--mailing_bool', '-mb', default=True, help='Enable mailing')
 @click.option('--host_url', '-hu', help='Host url', required=True)
-def setup_all(server_ip, port, static_folder, recaptcha_bool, num_threads, mailing_bool, host_url):
+@click.option('--debug', is_flag=True, default=False, help='Log debug diagnostics (also DEBUG=1)')
+def setup_all(server_ip, port, static_folder, recaptcha_bool, num_threads, mailing_bool, host_url, debug):
+    if debug:
+        log_config.setup(debug=True)
     webapp = api.WebApp(db_configs, server_ip, port, static_folder, recaptcha_bool, num_threads, mailing_bool, host_url)
     utils.init_directories(webapp.app.config['DATABASE_FOLDER'])
     webapp.run()
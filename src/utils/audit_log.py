@@ -0,0 +1,154 @@
+"""Write-behind audit log for ``WebApp.logger``.
+
+Routes used to insert and commit their ``logs`` row before doing any work.
+Now ``record`` only puts the row on a bounded in-memory queue and returns
+an ``AuditRecord``; a background thread writes the queue in batched
+transactions and SQLite assigns the row id, which the record receives when
+its insert runs. A failed route marks its row with ``fail``, an update by
+primary key queued behind the insert. When a batch fails its rows are
+written again one at a time, so only the row at fault is dropped.
+
+When the queue is full the caller waits up to ``block_timeout`` seconds for
+room (backpressure) and the record is then dropped and counted; with
+``overflow='drop'`` it is dropped at once. ``close`` flushes what is left
+and runs at interpreter exit.
+
+A shared in-memory database (used by tests) is written inline, since its
+single connection must not be used from a second thread mid-transaction.
+"""
+import atexit
+import os
+import queue
+import threading
+
+import utils
+
+INSERT_SQL = 'INSERT INTO logs (username, action, date, status, error) VALUES (?, ?, ?, ?, ?)'
+FAIL_SQL = "UPDATE logs SET status='fail', error=? WHERE id=?"
+
+
+class AuditRecord():
+    """A queued logs row; ``id`` is set once the row is written."""
+    __slots__ = ('id',)
+
+    def __init__(self) -> None:
+        self.id = None
+
+
+class AuditLogger():
+    def __init__(self, db_configs, max_queue=None, batch_size=200, flush_interval=1.0,
+                 overflow=None, block_timeout=0.5) -> None:
+        self.db_configs = db_configs
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow or os.environ.get('AUDIT_LOG_OVERFLOW', 'block')
+        self.block_timeout = block_timeout
+        self.queue = queue.Queue(maxsize=max_queue or int(os.environ.get('AUDIT_LOG_QUEUE_SIZE', 10000)))
+        self.inline = getattr(db_configs.pool, 'shared', False)
+        self.dropped = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        atexit.register(self.close)
+
+    def _put(self, item):
+        if self.inline:
+            self._write([item])
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            if self.overflow == 'drop':
+                self.queue.put_nowait(item)
+            else:
+                self.queue.put(item, timeout=self.block_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def record(self, username, action, date, status='pass', error=None):
+        """Queue a logs row and return its AuditRecord."""
+        record = AuditRecord()
+        self._put((INSERT_SQL, (username, action, date, status, error), record))
+        return record
+
+    def fail(self, record, error):
+        """Mark the row of ``record`` as failed with ``error``."""
+        self._put((FAIL_SQL, error, record))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.flush(wait=self.flush_interval)
+
+    def _drain(self, wait=None):
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=wait) if wait else self.queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def flush(self, wait=None):
+        """Write the queued rows, waiting up to ``wait`` seconds for the first one."""
+        with self._flush_lock:
+            batch = self._drain(wait)
+            while batch:
+                self._write(batch)
+                batch = self._drain()
+
+    def _execute(self, cursor, item):
+        sql, params, record = item
+        if sql == INSERT_SQL:
+            cursor.execute(sql, params)
+            record.id = cursor.lastrowid
+        elif record.id is not None:
+            cursor.execute(sql, (params, record.id))
+        # else the insert of the failed row was dropped: nothing to update
+
+    def _write(self, batch):
+        conn = self.db_configs.pool.thread_conn()
+        try:
+            cursor = conn.cursor()
+            for item in batch:
+                self._execute(cursor, item)
+            conn.commit()
+            with self._lock:
+                self.written += len(batch)
+            return
+        except Exception as e:
+            conn.rollback()
+            error = e
+        # the ids handed out by the rolled back inserts are void
+        for sql, _, record in batch:
+            if sql == INSERT_SQL:
+                record.id = None
+        if len(batch) == 1:
+            utils.error_log(error)
+            with self._lock:
+                self.dropped += 1
+            return
+        for item in batch:
+            self._write([item])
+
+    def close(self):
+        """Stop the writer thread and write everything still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 1)
+        try:
+            self.flush()
+        except Exception as e:
+            utils.error_log(e)
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'written': self.written, 'dropped': self.dropped}
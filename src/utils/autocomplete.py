@@ -0,0 +1,159 @@
+"""In-memory autocomplete for tags, authors, usernames and entry titles.
+
+The search boxes ask for suggestions on every keystroke. Each source is kept
+as a sorted array of lowercased values for prefix matches, plus the same
+values joined into one string for infix matches with ``str.find``. The
+FuzzyIndex fills in when nothing contains the typed text.
+
+A source is read from the database once and then kept current by the
+operators that write it. After an insert they call ``appended``, and the
+next search reads only the rows past the highest rowid seen so far and adds
+them to the index. After an update, rename or delete they call
+``invalidate``, and the next search rebuilds the source from the database.
+"""
+import bisect
+import heapq
+import threading
+import fuzzy
+
+# each row is (value, id, rowid)
+SOURCES = {
+    'tags': 'SELECT tag, id, id FROM tags WHERE id > ? ORDER BY id',
+    'authors': 'SELECT author, id, id FROM authors WHERE id > ? ORDER BY id',
+    'usernames': 'SELECT username, id, id FROM users WHERE id > ? ORDER BY id',
+    'titles': 'SELECT entry_name, NULL, id FROM entries WHERE id > ? AND entry_name IS NOT NULL ORDER BY id',
+}
+
+# bumped by invalidate(); indexes built at an older generation are rebuilt
+_generations = {source: 0 for source in SOURCES}
+# bumped by appended(); indexes at an older version read the new rows only
+_versions = {source: 0 for source in SOURCES}
+_generations_lock = threading.Lock()
+
+def invalidate(source):
+    """Mark ``source`` as changed in a way new rowids do not show (update, rename or delete)."""
+    with _generations_lock:
+        _generations[source] += 1
+
+def appended(source):
+    """Mark rows as inserted into ``source``; call after the insert is committed."""
+    with _generations_lock:
+        _versions[source] += 1
+
+class AutocompleteIndex():
+    def __init__(self, rows) -> None:
+        self.values = {}  # lowercased key -> (value, id)
+        self.fuzzy = fuzzy.FuzzyIndex()
+        self.keys = sorted(self._new_keys(rows))
+        self._join()
+        # add() runs while other requests search
+        self._lock = threading.Lock()
+
+    def _new_keys(self, rows):
+        """Record the ``(value, id)`` rows whose key is not indexed yet and return those keys."""
+        keys = []
+        for value, value_id in rows:
+            key = (value or '').strip().lower()
+            if key == '' or key in self.values:
+                continue
+            self.values[key] = (value, value_id)
+            self.fuzzy.add(value, value_id)
+            keys.append(key)
+        return keys
+
+    def _join(self):
+        # every key followed by a newline, and where each one starts
+        self.joined = list(self.keys)
+        self.blob = ''.join(key + '\n' for key in self.joined)
+        self.starts = []
+        position = 0
+        for key in self.joined:
+            self.starts.append(position)
+            position += len(key) + 1
+        self.recent = []
+
+    def add(self, rows):
+        """Add rows inserted since the index was built, without rebuilding it."""
+        with self._lock:
+            for key in self._new_keys(rows):
+                bisect.insort(self.keys, key)
+                self.recent.append(key)
+            # keys added after the blob was joined are matched one by one until there are enough to join again
+            if len(self.recent) > max(64, len(self.joined) // 8):
+                self._join()
+
+    def search(self, term, limit=10):
+        """Return up to ``limit`` ``(value, id)`` pairs.
+
+        Prefix matches come first, then matches at the start of a word, then
+        any other infix match, each shortest first; typo-tolerant matches
+        fill the remaining slots.
+        """
+        term = term.strip().lower()
+        if term == '' or '\n' in term:
+            return []
+        with self._lock:
+            return self._search(term, limit)
+
+    def _search(self, term, limit):
+        low = bisect.bisect_left(self.keys, term)
+        high = bisect.bisect_left(self.keys, term + '\uffff')
+        ranked = [(0, len(self.keys[i]), self.keys[i]) for i in range(low, high)]
+
+        position = self.blob.find(term)
+        while position != -1:
+            i = bisect.bisect_right(self.starts, position) - 1
+            key = self.joined[i]
+            offset = position - self.starts[i]
+            if offset > 0:
+                ranked.append((1 if key[offset - 1] == ' ' else 2, len(key), key))
+            # continue with the next key
+            position = self.blob.find(term, self.starts[i] + len(key) + 1)
+        for key in self.recent:
+            offset = key.find(term)
+            if offset > 0:
+                ranked.append((1 if key[offset - 1] == ' ' else 2, len(key), key))
+
+        results = [self.values[key] for _, _, key in heapq.nsmallest(limit, ranked)]
+        if len(results) < limit:
+            found = {value for value, _ in results}
+            for value, value_id, _ in self.fuzzy.search(term, limit):
+                if len(results) >= limit:
+                    break
+                if value not in found:
+                    results.append((value, value_id))
+        return results
+
+class AutocompleteService():
+    def __init__(self, db_configs) -> None:
+        self.db_configs = db_configs
+        self._indexes = {}  # source -> [generation, version, last rowid, AutocompleteIndex]
+        self._lock = threading.Lock()
+
+    def _read(self, source, after):
+        cursor = self.db_configs.get_conn().cursor()
+        cursor.execute(SOURCES[source], (after,))
+        rows = cursor.fetchall()
+        last = rows[-1][2] if rows else after
+        return [(value, value_id) for value, value_id, _ in rows], last
+
+    def index(self, source):
+        """Return the index of ``source``, reading from the database only what changed."""
+        generation, version = _generations[source], _versions[source]
+        state = self._indexes.get(source)
+        if state is not None and state[0] == generation and state[1] == version:
+            return state[3]
+        with self._lock:
+            state = self._indexes.get(source)
+            if state is None or state[0] != generation:
+                rows, last = self._read(source, 0)
+                state = [generation, version, last, AutocompleteIndex(rows)]
+                self._indexes[source] = state
+            elif state[1] != version:
+                rows, state[2] = self._read(source, state[2])
+                state[3].add(rows)
+                state[1] = version
+            return state[3]
+
+    def search(self, source, term, limit=10):
+        return self.index(source).search(term or '', limit)
@@ -0,0 +1,97 @@
+"""Typo-tolerant matching for tags, authors and entry titles.
+
+Each source is held in memory as a trigram index. A query collects the
+values sharing enough trigrams with it and ranks them by bounded edit
+distance. The distance is computed with Myers' bit-parallel algorithm, which
+handles a whole column of the edit-distance matrix in a few integer
+operations. Matching is approximate-substring, so "immunstain" finds
+"GFP immunostaining".
+
+The index of a source is part of its ``AutocompleteIndex``: inserted values
+are added to it, and it is rebuilt with the source after updates or deletes.
+"""
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def max_distance(term):
+    """Edits tolerated for ``term``: none below 3 characters, then one per 4."""
+    return 0 if len(term) < 3 else 1 + (len(term) - 3) // 4
+
+def edit_distance(pattern, text, bound=None):
+    """Smallest edit distance between ``pattern`` and any substring of ``text``.
+
+    Returns None as soon as the distance is known to exceed ``bound``.
+    """
+    m = len(pattern)
+    if m == 0:
+        return 0
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = mask, 0, m
+    best = m
+    for position, char in enumerate(text):
+        remaining = len(text) - position - 1
+        # the score drops by at most one per column left
+        if bound is not None and best > bound and score - remaining - 1 > bound:
+            return None
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+        best = min(best, score)
+    if bound is not None and best > bound:
+        return None
+    return best
+
+class FuzzyIndex():
+    def __init__(self) -> None:
+        self.values = {}    # lowercased value -> (value, id)
+        self.trigrams = {}  # trigram -> set of lowercased values
+
+    def add(self, value, value_id=None):
+        key = value.strip().lower()
+        if key == '' or key in self.values:
+            return
+        self.values[key] = (value, value_id)
+        for trigram in trigrams(key):
+            self.trigrams.setdefault(trigram, set()).add(key)
+
+    def candidates(self, term, distance):
+        """Values sharing enough trigrams with ``term`` to be within ``distance`` edits."""
+        term_trigrams = trigrams(term)
+        # one edit destroys at most three trigrams of the term
+        needed = len(term_trigrams) - 3 * distance
+        if needed <= 0:
+            return list(self.values)
+        shared = {}
+        for trigram in term_trigrams:
+            for key in self.trigrams.get(trigram, ()):
+                shared[key] = shared.get(key, 0) + 1
+        return [key for key, count in shared.items() if count >= needed]
+
+    def search(self, term, limit=10):
+        """Return up to ``limit`` ``(value, id, distance)`` tuples, closest first."""
+        term = term.strip().lower()
+        distance = max_distance(term)
+        if distance == 0:
+            return []
+        matches = []
+        for key in self.candidates(term, distance):
+            found = edit_distance(term, key, distance)
+            if found is not None:
+                matches.append((found, len(key), key))
+        matches.sort()
+        return [self.values[key] + (found,) for found, _, key in matches[:limit]]
@@ -0,0 +1,260 @@
+"""Background jobs backed by the ``jobs`` table.
+
+Request threads only ``enqueue`` a job (a kind and a JSON payload) and
+return; a pool of worker threads claims queued jobs in order and runs the
+function registered for their kind. A job reports its progress through its
+``Job`` context, and may save a ``checkpoint`` so that a retry carries on
+where the failed attempt stopped instead of redoing its side effects (e.g.
+mails already sent).
+
+A failed attempt is queued again after an exponential backoff
+(``JOB_RETRY_DELAY`` seconds doubled per attempt, capped at
+``JOB_MAX_DELAY``) until ``max_attempts`` is reached, then the job is
+``failed``. Jobs found ``running`` at startup were cut off by a restart and
+are queued again.
+
+An idempotency key makes ``enqueue`` return the job the same owner already
+created with that key within ``window`` seconds instead of creating a second
+one, so a resubmitted form does not send its mails twice. A failed job is
+never returned this way: resubmitting after a failure starts a new job.
+
+``enqueue`` commits its own transaction on the request's connection, so it
+refuses to run while the caller has one open: committing it would publish
+the caller's unfinished work, and a second connection would wait on the
+caller's write lock. A shared in-memory database (used by tests) runs every
+job inline in the enqueuing thread, since its single connection must not be
+used from a second thread mid-transaction.
+"""
+import datetime as dt
+import json
+import logging
+import os
+import threading
+
+import utils
+
+logger = logging.getLogger(__name__)
+
+RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', 30))
+MAX_DELAY = float(os.environ.get('JOB_MAX_DELAY', 3600))
+IDEMPOTENCY_WINDOW = float(os.environ.get('JOB_IDEMPOTENCY_WINDOW', 24 * 3600))
+
+COLUMNS = ('id', 'kind', 'payload', 'status', 'progress', 'message', 'result', 'error', 'attempts',
+           'max_attempts', 'owner', 'idempotency_key', 'run_after', 'created_at', 'updated_at', 'checkpoint')
+
+# hot statements, checked against full table scans by indexes.hot_queries
+IDEMPOTENT_JOB_SQL = ("SELECT id FROM jobs WHERE idempotency_key = ? AND created_at >= ? AND owner IS ? "
+                      "AND status != 'failed' ORDER BY id DESC LIMIT 1")
+OWNER_JOBS_SQL = f'SELECT {", ".join(COLUMNS)} FROM jobs WHERE owner = ? ORDER BY id DESC LIMIT ?'
+CLAIM_SQL = (f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE status = 'queued' AND run_after <= ? "
+             "ORDER BY run_after, id LIMIT 1")
+RECOVER_SQL = "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'"
+
+
+def _time(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+class JobError(Exception):
+    """Raised by a job function to fail the attempt with a message."""
+
+
+class Job():
+    """What a job function gets: its payload, progress reporting and checkpoint."""
+    def __init__(self, queue, row) -> None:
+        self.queue = queue
+        self.id = row['id']
+        self.kind = row['kind']
+        self.payload = json.loads(row['payload'])
+        self.attempt = row['attempts']
+        self.owner = row['owner']
+        self.checkpoint = json.loads(row['checkpoint']) if row['checkpoint'] else {}
+
+    def progress(self, done, total=None, message=None, checkpoint=None):
+        """Record ``done`` of ``total`` steps (or a fraction) and an optional checkpoint."""
+        if checkpoint is not None:
+            self.checkpoint = checkpoint
+        fraction = done / total if total else done
+        self.queue._update(self.id, progress=min(max(fraction, 0.0), 1.0), message=message,
+                           checkpoint=json.dumps(self.checkpoint))
+
+
+class JobQueue():
+    def __init__(self, db_configs, workers=None, poll_interval=1.0, retry_delay=None, max_delay=None) -> None:
+        self.db_configs = db_configs
+        self.workers = workers or int(os.environ.get('JOB_WORKERS', 2))
+        self.poll_interval = poll_interval
+        self.retry_delay = RETRY_DELAY if retry_delay is None else retry_delay
+        self.max_delay = MAX_DELAY if max_delay is None else max_delay
+        self.inline = getattr(db_configs.pool, 'shared', False)
+        self.functions = {}
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._threads = []
+
+    def register(self, kind, function):
+        """Run ``function(job)`` for the jobs of ``kind``; its return value is stored as the result."""
+        self.functions[kind] = function
+
+    def _conn(self):
+        # the request's connection when enqueuing, the worker's own one otherwise
+        return self.db_configs.get_conn()
+
+    def _row(self, cursor):
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def enqueue(self, kind, payload, owner=None, idempotency_key=None, max_attempts=3, window=None):
+        """Queue a job and return its id, or the id of ``owner``'s unfailed job under ``idempotency_key``."""
+        if kind not in self.functions:
+            raise ValueError(f'No job function registered for "{kind}"')
+        window = IDEMPOTENCY_WINDOW if window is None else window
+        now = dt.datetime.now()
+        conn = self._conn()
+        if conn.in_transaction:
+            # the caller's work is the caller's to commit or roll back, not the queue's
+            raise RuntimeError(f'Cannot enqueue "{kind}" inside an open transaction; commit or roll back first')
+        cursor = conn.cursor()
+        # IMMEDIATE so two requests with the same key cannot both miss the other's job
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            if idempotency_key is not None:
+                cursor.execute(IDEMPOTENT_JOB_SQL,
+                               (idempotency_key, _time(now - dt.timedelta(seconds=window)), owner))
+                existing = cursor.fetchone()
+                if existing is not None:
+                    conn.commit()
+                    return existing[0]
+            cursor.execute('INSERT INTO jobs (kind, payload, status, progress, attempts, max_attempts, owner, '
+                           'idempotency_key, run_after, created_at, updated_at) '
+                           "VALUES (?, ?, 'queued', 0, 0, ?, ?, ?, ?, ?, ?)",
+                           (kind, json.dumps(payload), max_attempts, owner, idempotency_key,
+                            _time(now), _time(now), _time(now)))
+            job_id = cursor.lastrowid
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if self.inline:
+            self.run_next()
+        else:
+            with self._wake:
+                self._wake.notify()
+        return job_id
+
+    def _decode(self, job):
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job.pop('checkpoint')
+        return job
+
+    def get(self, job_id):
+        """Return the job ``job_id`` as a dict with decoded payload and result, or None."""
+        cursor = self._conn().cursor()
+        cursor.execute(f'SELECT {", ".join(COLUMNS)} FROM jobs WHERE id = ?', (job_id,))
+        job = self._row(cursor)
+        return self._decode(job) if job is not None else None
+
+    def recent(self, owner=None, limit=20):
+        """Return the newest jobs, of ``owner`` only when given."""
+        cursor = self._conn().cursor()
+        if owner is None:
+            cursor.execute(f'SELECT {", ".join(COLUMNS)} FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+        else:
+            cursor.execute(OWNER_JOBS_SQL, (owner, limit))
+        names = [column[0] for column in cursor.description]
+        return [self._decode(dict(zip(names, row))) for row in cursor.fetchall()]
+
+    def _update(self, job_id, **values):
+        values['updated_at'] = _time(dt.datetime.now())
+        conn = self._conn()
+        conn.execute(f'UPDATE jobs SET {", ".join(f"{name} = ?" for name in values)} WHERE id = ?',
+                     list(values.values()) + [job_id])
+        conn.commit()
+
+    def _claim(self):
+        """Mark the next due job as running and return it, or None."""
+        conn = self._conn()
+        cursor = conn.cursor()
+        with self._claim_lock:
+            if conn.in_transaction:
+                conn.commit()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute(CLAIM_SQL, (_time(dt.datetime.now()),))
+                row = self._row(cursor)
+                if row is not None:
+                    row['attempts'] += 1
+                    cursor.execute("UPDATE jobs SET status = 'running', attempts = ?, updated_at = ? WHERE id = ?",
+                                   (row['attempts'], _time(dt.datetime.now()), row['id']))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return row
+
+    def backoff(self, attempt):
+        return min(self.retry_delay * 2 ** (attempt - 1), self.max_delay)
+
+    def run_next(self):
+        """Run the next due job in the calling thread; returns False when none was due."""
+        row = self._claim()
+        if row is None:
+            return False
+        job = Job(self, row)
+        try:
+            result = self.functions[job.kind](job)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            if job.attempt < row['max_attempts']:
+                run_after = dt.datetime.now() + dt.timedelta(seconds=self.backoff(job.attempt))
+                self._update(job.id, status='queued', error=error, run_after=_time(run_after),
+                             checkpoint=json.dumps(job.checkpoint))
+                logger.warning('Job %s (%s) attempt %s failed, retrying at %s: %s',
+                               job.id, job.kind, job.attempt, _time(run_after), error)
+            else:
+                self._update(job.id, status='failed', error=error, checkpoint=json.dumps(job.checkpoint))
+                utils.error_log(e)
+            return True
+        self._update(job.id, status='done', progress=1.0, error=None, result=json.dumps(result))
+        return True
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                ran = self.run_next()
+            except Exception as e:
+                utils.error_log(e)
+                ran = False
+            if not ran:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+
+    def recover(self):
+        """Queue again the jobs a previous process left running."""
+        conn = self._conn()
+        cursor = conn.cursor()
+        cursor.execute(RECOVER_SQL, (_time(dt.datetime.now()),))
+        conn.commit()
+        return cursor.rowcount
+
+    def start(self):
+        if self._threads:
+            return
+        self.recover()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(self.poll_interval + 1)
+        self._threads = []
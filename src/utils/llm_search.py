@@ -1,10 +1,16 @@
 import json
+import logging
 import re
 import datetime
 import os
 import requests
 import time
 from dotenv import load_dotenv
+import search_query
+import query_guard
+import search_engine
+
+logger = logging.getLogger(__name__)
 
 class ExternalLLMSearch:
     """Search assistant that uses Claude API rather than loading models locally"""
@@ -31,7 +37,7 @@ class ExternalLLMSearch:
         self.api_key = api_key or os.environ.get("CLAUDE_API_KEY")
         
         if not self.api_key:
-            print("WARNING: Claude API key not provided. Set the CLAUDE_API_KEY environment variable.")
+            logger.warning("Claude API key not provided. Set the CLAUDE_API_KEY environment variable.")
             return
             
         self.ready = True
@@ -80,7 +86,7 @@ class ExternalLLMSearch:
     def extract_search_params(self, user_query):
         """Extract search parameters from a natural language query using Claude API."""
         if not self.ready:
-            print("Claude API not initialized. Cannot process query.")
+            logger.warning("Claude API not initialized. Cannot process query.")
             return None
             
         # If in testing mode, return mock search parameters
@@ -129,7 +135,7 @@ class ExternalLLMSearch:
                 "max_tokens": 500
             }
             
-            print("Sending request to Claude API...")
+            logger.debug("Sending request to Claude API")
             response = requests.post(
                 "https://api.anthropic.com/v1/messages",  # Claude API endpoint
                 headers=headers,
@@ -138,7 +144,7 @@ class ExternalLLMSearch:
             )
             
             if response.status_code != 200:
-                print(f"API error: {response.status_code}, {response.text}")
+                logger.error("API error: %s, %s", response.status_code, response.text)
                 return None
             
             result = response.json()
@@ -151,10 +157,10 @@ class ExternalLLMSearch:
                     if content_block["type"] == "text":
                         response_text += content_block["text"]
             else:
-                print("Unexpected Claude API response format")
+                logger.error("Unexpected Claude API response format")
                 return None
             
-            print(f"Claude response: {response_text}")
+            logger.debug("Claude response: %s", response_text)
             
             # Process the LLM response
             search_params = self._process_llm_response(response_text)
@@ -166,9 +172,7 @@ class ExternalLLMSearch:
             return search_params
         
         except Exception as e:
-            print(f"Error querying Claude API: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error querying Claude API: %s", e)
             return None
     
     def _process_llm_response(self, response_text):
@@ -249,7 +253,7 @@ class ExternalLLMSearch:
                 "max_tokens": 500
             }
             
-            print("Sending follow-up request for structured data...")
+            logger.debug("Sending follow-up request for structured data")
             response = requests.post(
                 "https://api.anthropic.com/v1/messages",
                 headers=headers,
@@ -258,7 +262,7 @@ class ExternalLLMSearch:
             )
             
             if response.status_code != 200:
-                print(f"Follow-up API error: {response.status_code}, {response.text}")
+                logger.error("Follow-up API error: %s, %s", response.status_code, response.text)
                 return self._fallback_extraction(user_query)
             
             result = response.json()
@@ -301,12 +305,12 @@ class ExternalLLMSearch:
             return self._fallback_extraction(user_query)
         
         except Exception as e:
-            print(f"Error in follow-up request: {str(e)}")
+            logger.error("Error in follow-up request: %s", e)
             return self._fallback_extraction(user_query)
     
     def _fallback_extraction(self, user_query):
         """Simple fallback keyword extraction when LLM is unavailable"""
-        print("Using fallback keyword extraction")
+        logger.info("Using fallback keyword extraction")
         
         # Check if this is a question about software usage rather than a search
         usage_keywords = ["how to", "how do i", "help me", "guide", "instructions", "tutorial", 
@@ -523,70 +527,26 @@ I can also help you search for entries using natural language queries like *"fin
         except:
             return None
 
-def execute_llm_search(conn, search_params):
+def execute_llm_search(conn, search_params, cache=None):
     """Execute a search based on parameters extracted by the search system"""
     # Check if this is a usage question rather than a search
     if search_params.get("is_usage_question"):
         # Return empty results for usage questions
         return []
     
-    # Start with a basic query
-    sql_command = 'SELECT * FROM entries WHERE '
-    params = []
-    conditions_added = False
-    
-    # Handle text search across all relevant fields
-    if search_params.get("text"):
-        # Split the text into individual keywords
-        keywords = [kw.strip() for kw in search_params["text"].split(',')]
-        for keyword in keywords:
-            if keyword and len(keyword) >= 3:  # Only search keywords with 3+ chars
-                sql_command += '('
-                # Search across all relevant fields
-                field_conditions = []
-                for field in ['entry_name', 'author', 'tags', 'conditions', 'extra_txt', 'id_hash']:
-                    field_conditions.append(f'{field} LIKE ?')
-                    params.append(f'%{keyword}%')
-                
-                sql_command += ' OR '.join(field_conditions)
-                sql_command += ') OR '
-                conditions_added = True
-
-        sql_command = sql_command[:-4]
-    
-    # Handle date range
-    if search_params.get("date_start"):
-        sql_command += ' AND date >= ? AND '
-        params.append(search_params["date_start"])
-        conditions_added = True
-    
-    if search_params.get("date_end"):
-        sql_command += 'date <= ? AND '
-        params.append(search_params["date_end"])
-        conditions_added = True
-    
-    # Finalize the SQL command
-    if sql_command.endswith('AND '):
-        sql_command = sql_command[:-5]
-    elif not conditions_added:
-        sql_command += '1=1'
-    
-    # Add ordering by date
-    sql_command += ' ORDER BY date DESC'
+    query = search_query.from_llm(search_params)
+    sql_command, params = query.compile(rank=True)
     
-    # Debug logging
-    print("\nSearch parameters:", search_params)
-    print("\nGenerated SQL:", sql_command)
-    print("\nParameters:", params)
+    logger.debug("Search parameters: %s; SQL: %s; parameters: %s", search_params, sql_command, params)
     
-    # Execute the query
-    cursor = conn.cursor()
-    cursor.execute(sql_command, tuple(params))
-    entries_list = cursor.fetchall()
+    # Execute the query, unless the same search ran since the last write
+    def run():
+        cursor = conn.cursor()
+        cursor.execute(sql_command, tuple(params))
+        return query_guard.fetch(cursor)
+    entries_list = run() if cache is None else search_engine.cached(conn, cache, ('entries', query.key(), True), run)
     
-    print(f"\nFound {len(entries_list)} results")
-    if entries_list:
-        print("First result entry_name:", entries_list[0][7])  # Assuming entry_name is at index 7
+    logger.debug("Found %d results", len(entries_list))
     
     return entries_list
 
@@ -594,11 +554,11 @@ class KeywordSearch:
     """A keyword-based search implementation that doesn't use an LLM"""
     def __init__(self):
         self.ready = True
-        print("Initialized keyword-based search (no LLM required)")
+        logger.info("Initialized keyword-based search (no LLM required)")
         
     def extract_search_params(self, user_query):
         """Parse the query using basic keyword matching"""
-        print(f"Processing query: {user_query}")
+        logger.debug("Processing query: %s", user_query)
         search_params = {
             "explanation": "I'm searching based on keywords I extracted from your query."
         }
@@ -672,7 +632,7 @@ class KeywordSearch:
             if terms:
                 search_params["text"] = " ".join(terms[:3])  # Use first 3 meaningful terms
         
-        print(f"Extracted parameters: {search_params}")
+        logger.debug("Extracted parameters: %s", search_params)
         return search_params
     
     def _extract_date_params(self, user_query, search_params):
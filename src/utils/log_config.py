@@ -0,0 +1,103 @@
+"""Central logging setup.
+
+Modules log through ``logging.getLogger(__name__)``. ``setup`` gives the
+root logger a single ``QueueHandler``: a request thread only puts the record
+on a queue, and one ``QueueListener`` thread formats it and writes it to the
+console and to ``logs/app.log``, which rotates at ``LOG_MAX_BYTES`` keeping
+``LOG_BACKUP_COUNT`` old files.
+
+The root level is ``LOG_LEVEL`` (INFO), or DEBUG when the debug switch is
+on (``setup(debug=True)``, ``--debug`` or ``DEBUG=1``). ``LOG_LEVELS`` sets
+single modules, e.g. ``LOG_LEVELS="search_engine=DEBUG,waitress=WARNING"``.
+Diagnostics such as generated SQL and result sizes are logged at DEBUG, so
+in production they are dropped before anything is formatted.
+
+``utils.error_log`` keeps its own synchronous ``error_log.log`` file so an
+error is on disk even when the process dies right after it; the loggers of
+``utils.create_log`` do not propagate, so nothing is written twice.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import pathlib
+import queue
+import threading
+
+LOG_DIR = os.path.join(str(pathlib.Path(__file__).parent.parent.absolute()), 'logs')
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+_lock = threading.Lock()
+
+
+def parse_levels(spec):
+    """Parse ``"module=LEVEL,..."`` into ``{module: level}``."""
+    levels = {}
+    for item in spec.split(','):
+        if item.strip() == '':
+            continue
+        name, level = item.split('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def debug_enabled():
+    return os.environ.get('DEBUG', '').lower() in ('1', 'true', 'yes')
+
+
+def setup(log_dir=None, level=None, levels=None, debug=None, console=True):
+    """Install the queue pipeline on the root logger; later calls only change levels.
+
+    Returns the QueueListener.
+    """
+    global _listener
+    debug = debug_enabled() if debug is None else debug
+    level = 'DEBUG' if debug else (level or os.environ.get('LOG_LEVEL', 'INFO'))
+    root = logging.getLogger()
+    with _lock:
+        if _listener is None:
+            log_dir = log_dir or LOG_DIR
+            os.makedirs(log_dir, exist_ok=True)
+            formatter = logging.Formatter(FORMAT)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, 'app.log'), maxBytes=int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+                backupCount=int(os.environ.get('LOG_BACKUP_COUNT', 5)))
+            handlers = [file_handler]
+            if console:
+                handlers.append(logging.StreamHandler())
+            for handler in handlers:
+                handler.setFormatter(formatter)
+
+            records = queue.Queue(-1)
+            root.addHandler(logging.handlers.QueueHandler(records))
+            _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown)
+
+    root.setLevel(level)
+    for name, module_level in {**parse_levels(os.environ.get('LOG_LEVELS', '')), **(levels or {})}.items():
+        logging.getLogger(name).setLevel(module_level)
+    return _listener
+
+
+def flush():
+    """Wait until the listener has written every queued record."""
+    if _listener is not None:
+        _listener.queue.join()
+
+
+def shutdown():
+    """Write the queued records and stop the listener thread."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is None:
+        return
+    listener.stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is listener.queue:
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        handler.close()
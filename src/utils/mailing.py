@@ -1,10 +1,13 @@
 import smtplib, ssl
 import os
+import logging
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email import encoders
 
+logger = logging.getLogger(__name__)
+
 def get_email_template():
     """Read the HTML email template file and return its content."""
     template_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'web', 'templates', 'email_template.html')
@@ -38,7 +41,7 @@ def send_email(receiver_email, sender_email, password, subject, html):
             server.sendmail(sender_email, receiver_email, message.as_string())
             return True
     except Exception as e:
-        print(e)
+        logger.error('Could not send "%s" to %s: %s', subject, receiver_email, e)
         return False
 
 def send_welcome_mail(info):
@@ -178,4 +181,4 @@ def send_order_status_mail(order_data, mail_args):
     </table>
     <p>You can log in to the Data Manager to view more details about this order.</p>
     """
-    send_email(receiver_email, sender_email, password, subject, html)   
\ No newline at end of file
+    return send_email(receiver_email, sender_email, password, subject, html)   
\ No newline at end of file
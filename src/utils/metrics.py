@@ -0,0 +1,134 @@
+"""Request metrics in the Prometheus text format.
+
+Every worker thread counts into its own shard, so recording a request takes
+no lock; ``render`` adds the shards up when ``/metrics`` is scraped. Shards
+are only ever written by their own thread, and the scrape reads them as they
+are, which may miss the request being recorded at that very moment.
+"""
+import threading
+import time
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+
+class _Shard():
+    def __init__(self) -> None:
+        self.latency = {}        # endpoint -> [bucket counts..., +Inf count, sum]
+        self.sql = {}            # endpoint -> [bucket counts..., +Inf count, sum]
+        self.queries = {}        # endpoint -> statements run
+        self.statuses = {}       # (endpoint, status) -> responses
+        self.started = 0
+        self.finished = 0
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def _observe(histograms, endpoint, seconds):
+    histogram = histograms.get(endpoint)
+    if histogram is None:
+        histogram = histograms[endpoint] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            histogram[i] += 1
+            break
+    else:
+        histogram[len(LATENCY_BUCKETS)] += 1
+    histogram[-1] += seconds
+
+
+def request_started():
+    _shard().started += 1
+    return time.perf_counter()
+
+
+def request_finished():
+    _shard().finished += 1
+
+
+def observe_response(endpoint, status, started):
+    shard = _shard()
+    _observe(shard.latency, endpoint, time.perf_counter() - started)
+    key = (endpoint, status)
+    shard.statuses[key] = shard.statuses.get(key, 0) + 1
+
+
+def observe_sql(endpoint, seconds, queries):
+    shard = _shard()
+    _observe(shard.sql, endpoint, seconds)
+    shard.queries[endpoint] = shard.queries.get(endpoint, 0) + queries
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _merge(name):
+    merged = {}
+    for shard in list(_shards):
+        for key, value in list(getattr(shard, name).items()):
+            if isinstance(value, list):
+                total = merged.setdefault(key, [0] * len(value))
+                for i, count in enumerate(value):
+                    total[i] += count
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _histogram(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for endpoint, histogram in sorted(histograms.items()):
+        label = f'endpoint="{_label(endpoint)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+        cumulative += histogram[len(LATENCY_BUCKETS)]
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{label}}} {histogram[-1]}')
+        lines.append(f'{name}_count{{{label}}} {cumulative}')
+
+
+def render(samples=()):
+    """Return all metrics as Prometheus text.
+
+    ``samples`` adds ``(name, type, help, value)`` metrics read at scrape
+    time, such as cache counters or the server queue depth.
+    """
+    lines = []
+    _histogram(lines, 'http_request_duration_seconds', 'Time spent handling requests.', _merge('latency'))
+    _histogram(lines, 'sql_request_duration_seconds', 'Time spent in SQL per request.', _merge('sql'))
+
+    lines.append('# HELP sql_queries_total SQL statements run by requests.')
+    lines.append('# TYPE sql_queries_total counter')
+    for endpoint, count in sorted(_merge('queries').items()):
+        lines.append(f'sql_queries_total{{endpoint="{_label(endpoint)}"}} {count}')
+
+    lines.append('# HELP http_responses_total Responses by endpoint and status code.')
+    lines.append('# TYPE http_responses_total counter')
+    for (endpoint, status), count in sorted(_merge('statuses').items()):
+        lines.append(f'http_responses_total{{endpoint="{_label(endpoint)}",status="{status}"}} {count}')
+
+    in_flight = sum(shard.started - shard.finished for shard in list(_shards))
+    lines.append('# HELP http_requests_in_flight Requests being handled.')
+    lines.append('# TYPE http_requests_in_flight gauge')
+    lines.append(f'http_requests_in_flight {in_flight}')
+
+    for name, kind, help_text, value in samples:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,226 @@
+"""Stopping SQLite statements that are no longer wanted or cost too much.
+
+SQLite calls the connection's progress handler every few hundred virtual
+machine instructions; when it returns non-zero the running statement is
+aborted with ``sqlite3.OperationalError('interrupted')``.
+
+Every request runs under a ``QueryBudget``: a time limit enforced through
+the progress handler and a row limit enforced by ``fetch``. The limits are
+chosen per endpoint from ``ROUTE_BUDGETS``, falling back to the
+``SQL_TIME_BUDGET``/``SQL_ROW_BUDGET`` environment variables, and can be
+overridden with ``SQL_BUDGETS="realtime_search=2:500,logs=3:2000"``.
+``interruptible`` additionally stops the statements of a block once a
+condition holds, e.g. when a newer search replaced this one.
+
+``SearchGenerations`` numbers the searches of each browser session, so a
+search can tell it has been superseded by a newer one from the same session.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# virtual machine instructions between two checks
+CHECK_INTERVAL = 1000
+
+DEFAULT_BUDGET = (float(os.environ.get('SQL_TIME_BUDGET', 10)), int(os.environ.get('SQL_ROW_BUDGET', 10000)))
+
+# endpoint -> (seconds, rows)
+ROUTE_BUDGETS = {
+    'realtime_search': (3.0, 1000),
+    'entries': (10.0, 10000),
+    'llm_search': (5.0, 1000),
+    'keyword_search': (2.0, 100),
+    'title_search': (2.0, 100),
+    'text_search': (3.0, 100),
+    'orders': (5.0, 1000),
+    'load_more_orders': (5.0, 1000),
+    'logs': (5.0, 5000),
+    'logs_api': (5.0, 5000),
+    'logs_counts': (5.0, 5000),
+    'chatroom': (3.0, 2000),
+}
+
+# the most recent overruns, newest last, for the admin pages
+overruns = deque(maxlen=200)
+
+# connection -> the QueryBudget of the request using it
+_active = {}
+_active_lock = threading.Lock()
+
+
+class QueryCancelled(Exception):
+    """Raised when a running query was aborted because its result is no longer wanted."""
+
+
+class BudgetExceeded(Exception):
+    """Raised when the queries of a request ran past its time budget."""
+    def __init__(self, endpoint, seconds) -> None:
+        super().__init__(f'Queries of {endpoint} exceeded their {seconds:g} s budget')
+        self.endpoint = endpoint
+        self.seconds = seconds
+
+
+class PartialRows(list):
+    """Rows of a statement cut off at the row budget."""
+    partial = True
+
+
+def is_complete(result):
+    """False for rows cut off at a row budget, which only the request that ran them may get."""
+    return not getattr(result, 'partial', False)
+
+
+def is_interrupt(error):
+    return isinstance(error, sqlite3.OperationalError) and str(error) == 'interrupted'
+
+
+def parse_budgets(spec):
+    """Parse ``"endpoint=seconds:rows,..."`` into ``{endpoint: (seconds, rows)}``."""
+    budgets = {}
+    for item in spec.split(','):
+        if item.strip() == '':
+            continue
+        endpoint, limits = item.split('=')
+        seconds, rows = limits.split(':')
+        budgets[endpoint.strip()] = (float(seconds), int(rows))
+    return budgets
+
+
+ROUTE_BUDGETS.update(parse_budgets(os.environ.get('SQL_BUDGETS', '')))
+
+
+def route_budget(endpoint):
+    return ROUTE_BUDGETS.get(endpoint, DEFAULT_BUDGET)
+
+
+class QueryBudget():
+    def __init__(self, endpoint, seconds, rows) -> None:
+        self.endpoint = endpoint
+        self.seconds = seconds
+        self.rows = rows
+        self.deadline = time.monotonic() + seconds
+        self.checks = []        # extra stop conditions, see interruptible()
+        self.timed_out = False
+        self.truncated = False
+        self.conn = None
+
+    def _progress(self):
+        for check in self.checks:
+            if check():
+                return 1
+        if time.monotonic() > self.deadline:
+            self.timed_out = True
+            return 1
+        return 0
+
+    def install(self, conn, interval=CHECK_INTERVAL):
+        self.conn = conn
+        with _active_lock:
+            _active[conn] = self
+        conn.set_progress_handler(self._progress, interval)
+
+    def uninstall(self):
+        if self.conn is None:
+            return
+        self.conn.set_progress_handler(None, CHECK_INTERVAL)
+        with _active_lock:
+            if _active.get(self.conn) is self:
+                del _active[self.conn]
+        self.conn = None
+
+    def record(self):
+        """Remember an overrun of this request, if there was one, and return its kind."""
+        kind = 'time' if self.timed_out else 'rows' if self.truncated else None
+        if kind is not None:
+            overruns.append({'endpoint': self.endpoint, 'kind': kind, 'seconds': self.seconds,
+                             'rows': self.rows, 'date': time.strftime('%Y-%m-%d %H:%M:%S')})
+        return kind
+
+
+def active(conn):
+    """Return the QueryBudget installed on ``conn``, if any."""
+    return _active.get(conn)
+
+
+def time_left(conn):
+    """Seconds left of the time budget of the request using ``conn``, or None when it has none."""
+    budget = active(conn)
+    return None if budget is None else max(budget.deadline - time.monotonic(), 0.0)
+
+
+def waited_out(conn):
+    """Return the BudgetExceeded of the request using ``conn``, whose time ran out waiting on another's query."""
+    budget = active(conn)
+    budget.timed_out = True
+    return BudgetExceeded(budget.endpoint, budget.seconds)
+
+
+def fetch(cursor):
+    """Return the rows of ``cursor``, cut off at the row budget of its connection.
+
+    A cut-off result is a PartialRows list.
+    """
+    budget = active(cursor.connection)
+    if budget is None:
+        return cursor.fetchall()
+    rows = cursor.fetchmany(budget.rows + 1)
+    if len(rows) <= budget.rows:
+        return rows
+    budget.truncated = True
+    return PartialRows(rows[:budget.rows])
+
+
+@contextmanager
+def interruptible(conn, should_stop, interval=CHECK_INTERVAL):
+    """Abort statements run on ``conn`` inside the block once ``should_stop()`` is true.
+
+    An aborted statement surfaces as QueryCancelled, or as BudgetExceeded when
+    the request's time budget ran out first.
+    """
+    budget = active(conn)
+    if budget is not None:
+        budget.checks.append(should_stop)
+    else:
+        conn.set_progress_handler(lambda: 1 if should_stop() else 0, interval)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if is_interrupt(e) and should_stop():
+            raise QueryCancelled('Query cancelled') from e
+        if is_interrupt(e) and budget is not None and budget.timed_out:
+            raise BudgetExceeded(budget.endpoint, budget.seconds) from e
+        raise
+    finally:
+        if budget is not None:
+            budget.checks.remove(should_stop)
+        else:
+            conn.set_progress_handler(None, interval)
+
+
+class SearchGenerations():
+    def __init__(self) -> None:
+        self._current = {}  # session key -> generation of its newest search
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def start(self, session_key):
+        """Register a new search of ``session_key``, superseding its earlier ones."""
+        with self._lock:
+            self._next += 1
+            self._current[session_key] = self._next
+            return self._next
+
+    def is_current(self, session_key, generation):
+        return self._current.get(session_key) == generation
+
+    def finish(self, session_key, generation):
+        """Forget the session once its newest search is done."""
+        with self._lock:
+            if self._current.get(session_key) == generation:
+                del self._current[session_key]
+
+    def __len__(self):
+        return len(self._current)
@@ -0,0 +1,62 @@
+"""Server-side store for search result lists.
+
+A search keeps its full result list here and puts only the cursor id in the
+(cookie) session, so large searches never travel with every request.
+Cursors expire ``ttl`` seconds after they were last read and the least
+recently used ones are evicted once ``max_cursors`` are held.
+"""
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCursorStore():
+    def __init__(self, ttl=900, max_cursors=256) -> None:
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self._cursors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, owner, results):
+        """Store ``results`` for ``owner`` and return the new cursor id."""
+        cursor_id = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            # least recently used first, which is also soonest to expire
+            while self._cursors and (len(self._cursors) >= self.max_cursors
+                                     or next(iter(self._cursors.values()))[1] < now):
+                self._cursors.popitem(last=False)
+            self._cursors[cursor_id] = (owner, now + self.ttl, results)
+        return cursor_id
+
+    def get(self, cursor_id, owner):
+        """Return the results of ``cursor_id``, or None if it expired or belongs to someone else."""
+        with self._lock:
+            item = self._cursors.get(cursor_id)
+            if item is None:
+                return None
+            cursor_owner, expires, results = item
+            now = time.monotonic()
+            if expires < now:
+                del self._cursors[cursor_id]
+                return None
+            if cursor_owner != owner:
+                return None
+            self._cursors[cursor_id] = (cursor_owner, now + self.ttl, results)
+            self._cursors.move_to_end(cursor_id)
+            return results
+
+    def page(self, cursor_id, owner, offset, limit):
+        """Return ``(entries, has_more)`` for one page, or None if the cursor is gone."""
+        results = self.get(cursor_id, owner)
+        if results is None:
+            return None
+        return results[offset:offset + limit], len(results) > offset + limit
+
+    def discard(self, cursor_id):
+        with self._lock:
+            self._cursors.pop(cursor_id, None)
+
+    def __len__(self):
+        return len(self._cursors)
@@ -0,0 +1,104 @@
+"""Cache of search results keyed on the search AST.
+
+The entries page, realtime search, its pagination and the chatbot often run
+the same search again. Results are kept here under the canonical
+``SearchQuery.key()`` plus whatever selects the page, and are tagged with
+the entries write version. The operators that insert, update or delete
+entries call ``invalidate``, so a result computed before a write is never
+served after it. The least recently used results are evicted once
+``max_entries`` results or ``SEARCH_CACHE_ROWS`` rows in total are held, so
+the memory a worker spends on the cache stays bounded however large the
+entries are. Identical misses arriving together run once and
+share the result, unless it was cut off at the row budget of the route that
+ran it: the others then run the search under their own budget. A caller
+waits for the shared search at most ``timeout`` seconds.
+"""
+import os
+import threading
+from collections import OrderedDict
+from single_flight import SingleFlight
+from query_guard import is_complete, is_interrupt
+
+# bumped by invalidate() on every write to entries, their tags or conditions
+_version = 0
+_version_lock = threading.Lock()
+
+def invalidate():
+    global _version
+    with _version_lock:
+        _version += 1
+
+def version():
+    return _version
+
+def result_rows(result):
+    """Rows a cached result counts for: its length for a list of rows, 1 for anything else."""
+    return len(result) if isinstance(result, (list, tuple)) else 1
+
+class SearchCache():
+    def __init__(self, max_entries=512, max_rows=5000, max_total_rows=None) -> None:
+        self.max_entries = max_entries
+        # larger results are computed every time rather than crowd out the rest
+        self.max_rows = max_rows
+        self.max_total_rows = (int(os.environ.get('SEARCH_CACHE_ROWS', 20000))
+                               if max_total_rows is None else max_total_rows)
+        self._results = OrderedDict()  # key -> (result, rows)
+        self.rows = 0
+        self._version = _version
+        self._lock = threading.Lock()
+        # a search cancelled for its own session must not fail the others waiting on it,
+        # nor rows cut off at its route's budget stand in for theirs
+        self._flights = SingleFlight(retry_on=is_interrupt, share=is_complete)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute, timeout=None):
+        """Return the cached result of ``key``, or store and return ``compute()``."""
+        current = _version
+        with self._lock:
+            if current != self._version:
+                # everything held predates the write
+                self._results.clear()
+                self.rows = 0
+                self._version = current
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key][0]
+            self.misses += 1
+
+        result = self._flights.do((current, key), compute, timeout)
+        # rows cut off at a request's row budget are not the full result
+        rows = result_rows(result)
+        if not is_complete(result) or rows > min(self.max_rows, self.max_total_rows):
+            return result
+        with self._lock:
+            # a write during compute() may have made the result stale
+            if current == _version == self._version:
+                if key in self._results:
+                    self.rows -= self._results.pop(key)[1]
+                self._results[key] = (result, rows)
+                self.rows += rows
+                while len(self._results) > self.max_entries or self.rows > self.max_total_rows:
+                    self.rows -= self._results.popitem(last=False)[1][1]
+                    self.evictions += 1
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.rows = 0
+
+    def stats(self):
+        """Return the hit, miss and eviction counters and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'coalesced': self._flights.shared,
+                    'entries': len(self._results), 'max_entries': self.max_entries,
+                    'rows': self.rows, 'max_total_rows': self.max_total_rows,
+                    'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        return len(self._results)
@@ -1,316 +1,170 @@
+import json
+import base64
 import flask
 from flask import jsonify
 import utils
+import search_query
+import query_guard
+import single_flight
+from full_text import (match_clause, fts_query, excerpt_query, highlight_html, strip_highlight,
+                       KEYWORD_COLUMNS, MIN_MATCH_LENGTH)
 
-def author_search_in_db(conn, keyword):
-    if keyword != '' and keyword != ' ':
-        keyword = keyword.split(',')
-        keyword = keyword[-1]
-        try:
-            cursor = conn.cursor()
-            cursor.execute("select *  FROM authors WHERE author LIKE ?", (f"%{keyword}%",))
-            result = cursor.fetchall()
-            # Convert SQLite Row objects to dictionaries
-            columns = [column[0] for column in cursor.description]
-            result = [dict(zip(columns, row)) for row in result] if result else []
-            print(result)
-        except:
-            result = []
-    else:
-        result = []
-    return jsonify(result)
+# the current user's latest entries, served by idx_entries_author_date
+TIME_LINE_SQL = 'SELECT * FROM entries WHERE author = ? ORDER BY date DESC LIMIT 12'
 
-def tags_search_in_db(conn, keyword):
-    if keyword != '' and keyword != ' ':
-        keyword = keyword.split(',')
-        keyword = keyword[-1]
-        try:
-            cursor = conn.cursor()
-            cursor.execute("select *  FROM tags WHERE tag LIKE ?", (f"%{keyword}%",))
-            result = cursor.fetchall()
-            # Convert SQLite Row objects to dictionaries
-            columns = [column[0] for column in cursor.description]
-            result = [dict(zip(columns, row)) for row in result] if result else []
-        except:
-            result = []
-    else:
-        result = []
-    return jsonify(result)
+def autocomplete_search(service, source, keyword, column, limit=10):
+    """Suggest values of ``source`` for the last comma-separated part of ``keyword``.
 
-def text_search_in_db(conn, keyword):
-    print(keyword)
-    if keyword != '' and keyword != ' ':
-        try:
-            cursor = conn.cursor()
-            cursor.execute("select *  FROM entries WHERE extra_txt LIKE ?", (f"%{keyword}%",))
-            result = cursor.fetchall()
-            # Convert SQLite Row objects to dictionaries
-            columns = [column[0] for column in cursor.description]
-            result = [dict(zip(columns, row)) for row in result] if result else []
-        except:
-            result = []
-    else:
-        result = []
-    
-    processed_result = []
-    for r in result:
-        if 'extra_txt' in r and r['extra_txt'] and keyword in r['extra_txt']:
-            index = r['extra_txt'].find(keyword)
-            start_index = max(0, index - 20)
-            end_index = min(len(r['extra_txt']), index + 20)
-            excerpt = r['extra_txt'][start_index:end_index]
-            entry_id = r.get('id', '')
-            processed_result.append({'excerpt': excerpt, 'id': entry_id})
-    
-    return jsonify(processed_result)
+    Served from the in-memory AutocompleteService, so no query runs unless the
+    source changed since the last keystroke.
+    """
+    keyword = (keyword or '').split(',')[-1].strip()
+    if keyword == '':
+        return jsonify([])
+    results = service.search(source, keyword, limit)
+    if source == 'titles':
+        return jsonify([{column: value} for value, _ in results])
+    return jsonify([{column: value, 'id': value_id} for value, value_id in results])
+
+def text_search_in_db(conn, keyword, limit=10):
+    """Return the ``limit`` notes most relevant to ``keyword`` with an excerpt around the match.
 
-def title_search_in_db(conn, keyword):
+    The excerpt is cut and highlighted by SQLite, so note bodies are never
+    loaded into Python.
+    """
+    keyword = (keyword or '').strip()
+    if keyword == '':
+        return jsonify([])
     cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT entry_name FROM entries WHERE entry_name LIKE ? LIMIT 10", (f'%{keyword}%',))
-    results = cursor.fetchall()
-    # Convert SQLite Row objects to dictionaries
-    results = [{'entry_name': row[0]} for row in results] if results else []
-    return flask.jsonify(results)
+    try:
+        if len(keyword) >= MIN_MATCH_LENGTH:
+            cursor.execute(excerpt_query('extra_txt'), (fts_query(keyword, ['extra_txt']), limit))
+        else:
+            # too short for the trigram index: cut the excerpt with instr() instead
+            cursor.execute("""SELECT id, substr(extra_txt, max(pos - 20, 1), pos - max(pos - 20, 1)) || char(2) || ? || char(3)
+                                     || substr(extra_txt, pos + length(?), 20)
+                              FROM (SELECT id, date, extra_txt, instr(extra_txt, ?) AS pos FROM entries)
+                              WHERE pos > 0 ORDER BY date DESC LIMIT ?""",
+                           (keyword, keyword, keyword, limit))
+        rows = cursor.fetchall()
+    except Exception as e:
+        utils.error_log(e)
+        rows = []
+
+    return jsonify([{'id': row[0], 'excerpt': strip_highlight(row[1]), 'highlight': highlight_html(row[1])}
+                    for row in rows])
 
 def keyword_search_in_db(conn, keyword):
+    keyword = keyword or ''
+    where, params = match_clause(keyword, KEYWORD_COLUMNS)
     cursor = conn.cursor()
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT DISTINCT entry_name FROM entries 
-        WHERE entry_name LIKE ? OR tags LIKE ? OR conditions LIKE ? OR extra_txt LIKE ? 
+        WHERE {where} 
         LIMIT 10
-    """, (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%', f'%{keyword}%'))
+    """, params)
     results = cursor.fetchall()
     # Convert SQLite Row objects to dictionaries
     results = [dict(zip([column[0] for column in cursor.description], row)) for row in results] if results else []
     return flask.jsonify(results)
 
-def filter_entries(conn, post_request_form):
-    # Handle case sensitivity in parameter names
-    Authors = post_request_form.get('Author', post_request_form.get('author', ''))
-    Hash_ID = post_request_form.get('Hash_ID', post_request_form.get('hash_id', ''))
-    Text = post_request_form.get('Text', post_request_form.get('text', ''))
-    Tags = post_request_form.get('Tags', post_request_form.get('tags', ''))
-    Title = post_request_form.get('Title', post_request_form.get('title', ''))
-    Keyword = post_request_form.get('Keyword', post_request_form.get('keyword', ''))
-    
-    if 'date_bool' not in post_request_form:
-        date_bool = False
-    else:
-        date_bool = True
-    if not date_bool:
-        date_start = '0001-01-01'
-        date_end = '9999-12-31'
-    else:
-        date_start = post_request_form['date_start']
-        date_end = post_request_form['date_end']
-    
-    # We're no longer processing conditions as per requirements
-    conditions = []
-    
-    rows = []
-    if Hash_ID != '':
-        sql_command = 'SELECT * FROM entries WHERE id_hash like ? AND ' 
-        rows.append(f'%{Hash_ID}%')
-    else:
-        sql_command = 'SELECT * FROM entries WHERE '
-        if Authors != '':
-            sql_command += 'author == ? AND '
-            rows.append(Authors)
-        
-        # Handle the new Keyword field that searches across multiple columns
-        if Keyword != '':
-            sql_command += '('
-            sql_command += 'entry_name like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'tags like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'conditions like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'extra_txt like ?'
-            rows.append(f'%{Keyword}%')
-            sql_command += ') AND '
-        
-        # Handle individual field searches from advanced search
-        if Title != '':
-            sql_command += 'entry_name like ? AND '
-            rows.append(f'%{Title}%')
-        if Text != '':
-            sql_command += 'extra_txt like ? AND '
-            rows.append(f'%{Text}%')
-        if date_start != '':
-            sql_command += 'date >= ? AND '
-            rows.append(date_start)
-        if date_end != '':
-            sql_command += 'date <= ? AND '
-            rows.append(date_end)
-        if Tags != '':
-            Tags = Tags.split(',')
-            for tag in Tags:
-                if tag != '':
-                    sql_command += 'tags like ? AND '
-                    rows.append(f'%{tag}%')
-    
-    sql_command = sql_command + '1'
-    rows = tuple(rows)
-    cursor = conn.cursor()
-    cursor.execute(sql_command, rows)
-    entries_list = cursor.fetchall()
+def fetch_all(conn, sql_command, params, cache=None, key=None):
+    """Run a search statement, or return its rows from ``cache`` when it holds ``key``."""
+    def run():
+        cursor = conn.cursor()
+        cursor.execute(sql_command, params)
+        return query_guard.fetch(cursor)
+    if cache is None:
+        return run()
+    return cached(conn, cache, key, run)
+
+def cached(conn, cache, key, run):
+    """``cache.get_or_compute(key, run)``, waiting on an identical search only as long as the budget allows."""
+    try:
+        return cache.get_or_compute(key, run, query_guard.time_left(conn))
+    except single_flight.WaitTimeout as e:
+        raise query_guard.waited_out(conn) from e
+
+def filter_entries(conn, post_request_form, cache=None):
+    rank = post_request_form.get('sort') == 'relevance'
+    query = search_query.from_form(post_request_form)
+    sql_command, params = query.compile(rank=rank)
+    entries_list = fetch_all(conn, sql_command, params, cache, ('entries', query.key(), rank))
     entries_list = utils.entry_list_maker(entries_list)
     return entries_list
 
-def realtime_filter_entries(conn, search_params, offset=0, limit=10):
+def encode_cursor(after=None, total_count=None, offset=None):
+    """Return an opaque page token for the next page.
+
+    Chronological searches seek past ``after``, the ``(date, id)`` of the last
+    entry shown; relevance-ranked searches continue at ``offset``. The total
+    count of the query rides along so later pages need not recount.
+    """
+    payload = json.dumps([list(after) if after else None, offset, total_count], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(token):
+    """Return ``(after, offset, total_count)`` from a token made by encode_cursor."""
+    try:
+        after, offset, total_count = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if after is not None:
+            date, entry_id = after
+            if not isinstance(date, str) or not isinstance(entry_id, int):
+                raise ValueError
+            after = (date, entry_id)
+        if not all(isinstance(value, (int, type(None))) for value in (offset, total_count)):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise ValueError('Invalid pagination cursor')
+    return after, offset, total_count
+
+def realtime_filter_entries(conn, search_params, offset=0, limit=10, after=None, cache=None):
     """
     Filter entries based on search parameters for real-time search.
-    Returns a limited number of entries for pagination.
+    Returns a limited number of entries for pagination, newest first or, with
+    ``sort=relevance``, most relevant first.
+    ``after`` is the ``(date, id)`` of the last entry of the previous page;
+    seeking past it through the date index keeps deep pages as cheap as the first.
     """
-    Authors = search_params.get('Author', '')
-    Hash_ID = search_params.get('Hash_ID', '')
-    Text = search_params.get('Text', '')
-    Tags = search_params.get('Tags', '')
-    Title = search_params.get('Title', '')
-    Keyword = search_params.get('Keyword', '')
-    
-    # Handle date range
-    if 'date_bool' not in search_params or search_params.get('date_bool') != 'on':
-        date_start = '0001-01-01'
-        date_end = '9999-12-31'
-    else:
-        date_start = search_params.get('date_start', '0001-01-01')
-        date_end = search_params.get('date_end', '9999-12-31')
-    
-    rows = []
-    if Hash_ID != '':
-        sql_command = 'SELECT * FROM entries WHERE id_hash like ? AND ' 
-        rows.append(f'%{Hash_ID}%')
-    else:
-        sql_command = 'SELECT * FROM entries WHERE '
-        if Authors != '':
-            Authors = Authors.split(',')
-            for author in Authors:
-                if author.replace(' ', '') != '':
-                    sql_command += 'author like ? OR '
-                    rows.append(f'%{author}%')
-            sql_command = sql_command[:-4]
-            sql_command += ' AND '
-        
-        # Handle the Keyword field that searches across multiple columns
-        if Keyword != '':
-            sql_command += '('
-            sql_command += 'entry_name like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'tags like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'conditions like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'extra_txt like ?'
-            rows.append(f'%{Keyword}%')
-            sql_command += ') AND '
-        
-        # Handle individual field searches from advanced search
-        if Title != '':
-            sql_command += 'entry_name like ? AND '
-            rows.append(f'%{Title}%')
-        if Text != '':
-            sql_command += 'extra_txt like ? AND '
-            rows.append(f'%{Text}%')
-        if date_start != '':
-            sql_command += 'date >= ? AND '
-            rows.append(date_start)
-        if date_end != '':
-            sql_command += 'date <= ? AND '
-            rows.append(date_end)
-        if Tags != '':
-            Tags = Tags.split(',')
-            for tag in Tags:
-                if tag != '':
-                    sql_command += 'tags like ? AND '
-                    rows.append(f'%{tag}%')
-    
-    sql_command = sql_command + '1 ORDER BY date DESC LIMIT ? OFFSET ?'
-    rows.append(limit)
-    rows.append(offset)
-    
-    rows = tuple(rows)
-    cursor = conn.cursor()
-    cursor.execute(sql_command, rows)
-    entries_list = cursor.fetchall()
+    rank = search_params.get('sort') == 'relevance'
+    query = search_query.from_form(search_params)
+    sql_command, params = query.compile(after=after, limit=limit, offset=offset, rank=rank)
+    entries_list = fetch_all(conn, sql_command, params, cache, ('page', query.key(), rank, after, offset, limit))
     entries_list = utils.entry_list_maker(entries_list)
     return entries_list
 
-def count_matching_entries(conn, search_params):
+def count_matching_entries(conn, search_params, cache=None):
     """
     Count the total number of entries matching the search parameters.
     Used for pagination in real-time search.
     """
-    Authors = search_params.get('Author', '')
-    Hash_ID = search_params.get('Hash_ID', '')
-    Text = search_params.get('Text', '')
-    Tags = search_params.get('Tags', '')
-    Title = search_params.get('Title', '')
-    Keyword = search_params.get('Keyword', '')
-    
-    # Handle date range
-    if 'date_bool' not in search_params or search_params.get('date_bool') != 'on':
-        date_start = '0001-01-01'
-        date_end = '9999-12-31'
-    else:
-        date_start = search_params.get('date_start', '0001-01-01')
-        date_end = search_params.get('date_end', '9999-12-31')
-    
-    rows = []
-    if Hash_ID != '':
-        sql_command = 'SELECT COUNT(*) FROM entries WHERE id_hash like ? AND ' 
-        rows.append(f'%{Hash_ID}%')
-    else:
-        sql_command = 'SELECT COUNT(*) FROM entries WHERE '
-        if Authors != '':
-            sql_command += 'author like ? AND '
-            rows.append(f'%{Authors}%')
-        
-        # Handle the Keyword field that searches across multiple columns
-        if Keyword != '':
-            sql_command += '('
-            sql_command += 'entry_name like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'tags like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'conditions like ? OR '
-            rows.append(f'%{Keyword}%')
-            sql_command += 'extra_txt like ?'
-            rows.append(f'%{Keyword}%')
-            sql_command += ') AND '
-        
-        # Handle individual field searches from advanced search
-        if Title != '':
-            sql_command += 'entry_name like ? AND '
-            rows.append(f'%{Title}%')
-        if Text != '':
-            sql_command += 'extra_txt like ? AND '
-            rows.append(f'%{Text}%')
-        if date_start != '':
-            sql_command += 'date >= ? AND '
-            rows.append(date_start)
-        if date_end != '':
-            sql_command += 'date <= ? AND '
-            rows.append(date_end)
-        if Tags != '':
-            Tags = Tags.split(',')
-            for tag in Tags:
-                if tag != '':
-                    sql_command += 'tags like ? AND '
-                    rows.append(f'%{tag}%')
-    
-    sql_command = sql_command + '1'
-    rows = tuple(rows)
-    cursor = conn.cursor()
-    print(sql_command, rows)
-    cursor.execute(sql_command, rows)
-    count = cursor.fetchone()[0]
-    return count
+    query = search_query.from_form(search_params)
+    sql_command, params = query.count()
+    return fetch_all(conn, sql_command, params, cache, ('count', query.key()))[0][0]
+
+def facet_counts(conn, search_params, top=10, cache=None):
+    """
+    Return ``(total_count, facets)`` for the entries matching the search parameters.
+    ``facets`` holds the ``top`` authors, tags and condition categories by number
+    of matches, and the matches per month oldest first, as ``{'value', 'count'}`` lists.
+    """
+    query = search_query.from_form(search_params)
+    sql_command, params = query.facets()
+    total_count = 0
+    facets = {'authors': [], 'tags': [], 'categories': [], 'months': []}
+    for facet, value, count in fetch_all(conn, sql_command, params, cache, ('facets', query.key())):
+        if facet == 'total':
+            total_count = count
+        else:
+            facets[facet].append({'value': value, 'count': count})
+    for facet in ('authors', 'tags', 'categories'):
+        facets[facet] = sorted(facets[facet], key=lambda row: (-row['count'], row['value']))[:top]
+    facets['months'].sort(key=lambda row: row['value'])
+    return total_count, facets
 
 def entries_time_line(conn):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM entries WHERE author == ? ORDER BY date DESC LIMIT 12", (flask.session['username'],))                              
+    cursor.execute(TIME_LINE_SQL, (flask.session['username'],))
     entries_list = cursor.fetchall()
     entries_list=  utils.entry_list_maker(entries_list)
     return entries_list
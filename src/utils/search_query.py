@@ -0,0 +1,248 @@
+"""Search AST and its compiler to SQL over ``entries``.
+
+The search form, realtime search, result counts and the LLM search all parse
+their input into a ``SearchQuery`` and compile it here, so a filter means the
+same thing wherever it is used. A query is a canonical tuple of
+``(kind, value)`` nodes. Queries of the same shape compile to the same SQL
+text, so sqlite3's per-connection statement cache is reused across searches.
+"""
+import re
+from full_text import match_clause, fts_query, bm25_expression, KEYWORD_COLUMNS, FTS_COLUMNS, FTS_TABLE, MIN_MATCH_LENGTH
+
+# node kinds, in the order they are compiled
+NODE_KINDS = ['hash_id', 'authors', 'keyword', 'any_text', 'title', 'text',
+              'date_start', 'date_end', 'tags', 'conditions', 'params']
+
+ORDER_BY = 'date DESC, id DESC'
+
+# full-text nodes and the columns their terms are ranked on
+RANKED_COLUMNS = {'keyword': KEYWORD_COLUMNS, 'title': ['entry_name'], 'text': ['extra_txt'], 'any_text': FTS_COLUMNS}
+
+def authors_clause(authors):
+    """Return ``(sql, params)`` matching entries written by any of ``authors``, compared exactly
+    so the filter is served by the (author, date) index."""
+    return f'author IN ({", ".join("?" * len(authors))})', list(authors)
+
+def any_text_clause(terms, id_column='id'):
+    """Return ``(sql, params)`` matching entries containing any of ``terms`` in any indexed column."""
+    clauses = []
+    params = []
+    for term in terms:
+        where, where_params = match_clause(term, FTS_COLUMNS, id_column)
+        clauses.append(where)
+        params.extend(where_params)
+    return f'({" OR ".join(clauses)})', params
+
+def tags_clause(tags, id_column='id'):
+    """Return ``(sql, params)`` restricting entries to those carrying every tag, ignoring case."""
+    subquery = 'SELECT entry_id FROM entry_tags WHERE tag_id IN (SELECT id FROM tags WHERE tag = ? COLLATE NOCASE)'
+    return f'{id_column} IN ({" INTERSECT ".join([subquery] * len(tags))})', list(tags)
+
+def condition_clause(conditions, id_column='id'):
+    """Return ``(sql, params)`` restricting entries to those having every condition.
+
+    Each condition is ``item``, ``category&item`` or ``category&subcategory&item``.
+    """
+    subqueries = []
+    params = []
+    for condition in conditions:
+        parts = [part.strip() for part in condition.split('&')]
+        if len(parts) >= 3:
+            subqueries.append('SELECT entry_id FROM entry_conditions WHERE category = ? AND item = ? AND subcategory = ?')
+            params.extend([parts[-3], parts[-1], parts[-2]])
+        elif len(parts) == 2:
+            subqueries.append('SELECT entry_id FROM entry_conditions WHERE category = ? AND item = ?')
+            params.extend(parts)
+        else:
+            subqueries.append('SELECT entry_id FROM entry_conditions WHERE item = ?')
+            params.append(parts[0])
+    return f'{id_column} IN ({" INTERSECT ".join(subqueries)})', params
+
+PARAM_OPERATORS = {'>=': '>=', '<=': '<=', '>': '>', '<': '<', '=': '=', '==': '=', '!=': '!=', '<>': '!='}
+_param_predicate = re.compile(
+    r'^(?P<name>.+?)\s*(?P<op>>=|<=|==|!=|<>|=|>|<)\s*(?P<value>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)$'
+)
+
+def parse_param_predicates(predicates):
+    """Parse ``'Temperature >= 30, Age < 8'`` into ``[(name, sql_operator, number), ...]``.
+
+    Raises ValueError for a predicate that is not ``name operator number``.
+    """
+    parsed = []
+    for predicate in predicates.split(','):
+        predicate = predicate.strip()
+        if predicate == '':
+            continue
+        match = _param_predicate.match(predicate)
+        if match is None:
+            raise ValueError(f'Invalid parameter filter "{predicate}", expected e.g. "Temperature >= 30"')
+        parsed.append((match.group('name'), PARAM_OPERATORS[match.group('op')], float(match.group('value'))))
+    return parsed
+
+def param_clause(predicates, id_column='id'):
+    """Return ``(sql, params)`` restricting entries to those whose PARAM values satisfy every predicate.
+
+    Predicates compare the numeric ``param_number`` column, served by the
+    (item, param_number) index.
+    """
+    subquery = 'SELECT entry_id FROM entry_conditions WHERE item = ? AND param_number {} ?'
+    subqueries = [subquery.format(operator) for _, operator, _ in predicates]
+    params = [value for name, _, number in predicates for value in (name, number)]
+    return f'{id_column} IN ({" INTERSECT ".join(subqueries)})', params
+
+_compilers = {
+    'hash_id': lambda term: match_clause(term, ['id_hash']),
+    'authors': authors_clause,
+    'keyword': lambda term: match_clause(term, KEYWORD_COLUMNS),
+    'any_text': any_text_clause,
+    'title': lambda term: match_clause(term, ['entry_name']),
+    'text': lambda term: match_clause(term, ['extra_txt']),
+    'date_start': lambda date: ('date >= ?', [date]),
+    'date_end': lambda date: ('date <= ?', [date]),
+    'tags': tags_clause,
+    'conditions': condition_clause,
+    'params': param_clause,
+}
+
+class SearchQuery():
+    def __init__(self, nodes=()) -> None:
+        self.nodes = tuple(sorted(nodes, key=lambda node: NODE_KINDS.index(node[0])))
+
+    def key(self):
+        """Hashable, canonical form of the query."""
+        return self.nodes
+
+    def where(self):
+        clauses = []
+        params = []
+        for kind, value in self.nodes:
+            clause, clause_params = _compilers[kind](value)
+            clauses.append(clause)
+            params.extend(clause_params)
+        return clauses, params
+
+    def rank_match(self):
+        """Return the FTS5 query ranking this search, or None if it has no full-text terms."""
+        terms = []
+        for kind, value in self.nodes:
+            if kind not in RANKED_COLUMNS:
+                continue
+            for term in (value if kind == 'any_text' else [value]):
+                if len(term) >= MIN_MATCH_LENGTH:
+                    terms.append(fts_query(term, RANKED_COLUMNS[kind]))
+        return ' OR '.join(terms) or None
+
+    def compile(self, columns='*', after=None, order=True, limit=None, offset=0, rank=False):
+        """Return ``(sql, params)`` selecting ``columns`` of the matching entries.
+
+        ``after`` is the ``(date, id)`` of the last row of the previous page.
+        With ``rank`` the results are ordered by BM25 relevance of the
+        full-text terms, newest first among equals.
+        """
+        clauses, params = self.where()
+        if after is not None:
+            clauses.append('(date, id) < (?, ?)')
+            params.extend(after)
+        rank_match = self.rank_match() if rank and order else None
+        if rank_match is not None:
+            sql = (f'SELECT {"entries.*" if columns == "*" else columns} FROM entries '
+                   f'JOIN (SELECT rowid, {bm25_expression()} AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?) AS ranked '
+                   f'ON ranked.rowid = entries.id WHERE {" AND ".join(clauses) or "1"} ORDER BY ranked.score, {ORDER_BY}')
+            params = [rank_match] + params
+        else:
+            sql = f'SELECT {columns} FROM entries WHERE {" AND ".join(clauses) or "1"}'
+            if order:
+                sql += f' ORDER BY {ORDER_BY}'
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([limit, offset])
+        return sql, params
+
+    def count(self):
+        return self.compile('COUNT(*)', order=False)
+
+    def facets(self):
+        """Return ``(sql, params)`` counting the matches per author, tag, condition
+        category and month in one pass over the matching set.
+
+        Rows are ``(facet, value, count)``; the ``total`` row carries the
+        number of matching entries.
+        """
+        matched, params = self.compile('id, author, date', order=False)
+        sql = (f'WITH matched AS MATERIALIZED ({matched}) '
+               "SELECT 'total', NULL, COUNT(*) FROM matched "
+               "UNION ALL SELECT 'authors', author, COUNT(*) FROM matched GROUP BY author "
+               "UNION ALL SELECT 'tags', tags.tag, COUNT(*) FROM matched "
+               'JOIN entry_tags ON entry_tags.entry_id = matched.id JOIN tags ON tags.id = entry_tags.tag_id GROUP BY tags.tag '
+               "UNION ALL SELECT 'categories', category, COUNT(DISTINCT entry_id) FROM matched "
+               'JOIN entry_conditions ON entry_conditions.entry_id = matched.id WHERE category IS NOT NULL GROUP BY category '
+               "UNION ALL SELECT 'months', substr(date, 1, 7), COUNT(*) FROM matched GROUP BY substr(date, 1, 7)")
+        return sql, params
+
+    def explain(self, conn, **compile_args):
+        """Return the EXPLAIN QUERY PLAN detail lines of the compiled query."""
+        sql, params = self.compile(**compile_args)
+        cursor = conn.cursor()
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[3] for row in cursor.fetchall()]
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip() != '']
+
+def _canonical(values):
+    return tuple(sorted(set(values)))
+
+def from_form(form):
+    """Parse the search form fields (Author, Hash_ID, Keyword, Title, Text, Tags,
+    Conditions, Params and the date range) into a SearchQuery."""
+    def get(name):
+        return (form.get(name) or form.get(name.lower()) or '').strip()
+
+    # a hash id identifies a single entry, every other field is ignored
+    hash_id = get('Hash_ID')
+    if hash_id != '':
+        return SearchQuery([('hash_id', hash_id)])
+
+    nodes = []
+    authors = _split(get('Author'))
+    if authors:
+        nodes.append(('authors', _canonical(authors)))
+    for kind, name in [('keyword', 'Keyword'), ('title', 'Title'), ('text', 'Text')]:
+        if get(name) != '':
+            nodes.append((kind, get(name)))
+    if form.get('date_bool') not in (None, '', 'off', 'false', '0'):
+        if get('date_start') != '':
+            nodes.append(('date_start', get('date_start')))
+        if get('date_end') != '':
+            nodes.append(('date_end', get('date_end')))
+    tags = _split(get('Tags'))
+    if tags:
+        nodes.append(('tags', _canonical(tags)))
+    conditions = _split(get('Conditions'))
+    if conditions:
+        nodes.append(('conditions', _canonical(conditions)))
+    predicates = parse_param_predicates(get('Params'))
+    if predicates:
+        nodes.append(('params', _canonical(predicates)))
+    return SearchQuery(nodes)
+
+def from_llm(search_params):
+    """Parse the parameters extracted by the LLM/keyword search into a SearchQuery."""
+    nodes = []
+    # comma separated keywords, any of which may match; short ones are too vague
+    keywords = [keyword for keyword in _split(search_params.get('text') or '') if len(keyword) >= 3]
+    if keywords:
+        nodes.append(('any_text', _canonical(keywords)))
+    if (search_params.get('title') or '').strip() != '':
+        nodes.append(('title', search_params['title'].strip()))
+    authors = _split(search_params.get('author') or '')
+    if authors:
+        nodes.append(('authors', _canonical(authors)))
+    tags = _split(search_params.get('tags') or '')
+    if tags:
+        nodes.append(('tags', _canonical(tags)))
+    if search_params.get('date_start'):
+        nodes.append(('date_start', search_params['date_start']))
+    if search_params.get('date_end'):
+        nodes.append(('date_end', search_params['date_end']))
+    return SearchQuery(nodes)
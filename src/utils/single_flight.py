@@ -0,0 +1,76 @@
+"""Coalescing of identical concurrent calls.
+
+When several worker threads ask for the same key at once, only the first
+runs the function; the others wait for it and share its result (or its
+exception). Nothing is kept once the call returns, so a later request runs
+again and sees current data. Errors for which ``retry_on`` is true concern
+only the caller that ran the function (e.g. its query was cancelled), and
+so do results for which ``share`` is false (e.g. rows cut off at the row
+budget of the caller's route); the callers sharing it run the function
+again instead of failing or getting them.
+
+A caller waits for the call in flight at most ``timeout`` seconds, then
+gets ``WaitTimeout``.
+"""
+import threading
+import time
+
+
+class WaitTimeout(TimeoutError):
+    """Raised to a caller that gave up waiting on the identical call in flight."""
+
+
+class _Call():
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight():
+    def __init__(self, retry_on=None, share=None) -> None:
+        self.retry_on = retry_on
+        self.share = share
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key, function, timeout=None):
+        """Return ``function()``, or the result of the identical call already in flight."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+        if not leader:
+            if not call.done.wait(timeout):
+                raise WaitTimeout(f'Gave up after {timeout:g} s waiting on the call in flight for {key!r}')
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            if call.error is not None and self.retry_on is not None and self.retry_on(call.error):
+                return self.do(key, function, remaining)
+            if call.error is not None:
+                raise call.error
+            if self.share is not None and not self.share(call.result):
+                return self.do(key, function, remaining)
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        return {'executions': self.executions, 'shared': self.shared, 'in_flight': len(self._calls)}
@@ -10,20 +10,29 @@ from markupsafe import Markup
 parent_parent_path = str(pathlib.Path(__file__).parent.parent.absolute())
 sys.path.append(os.path.join(parent_parent_path, 'database'))
 import operators
+import migrate
 import networkx as nx
 import zipfile
 import shutil
 import mailing
 import datetime as dt
 import logging
+import logging.handlers
 import csv
 import io
+import re
 from datetime import datetime, date
 
 from typing import Union
 
 # Define log directory
 log_dir = os.path.join(parent_parent_path, 'logs')
+logger = logging.getLogger(__name__)
+
+# hot statements, checked against full table scans by indexes.hot_queries
+AUTHOR_BY_NAME_SQL = 'SELECT * FROM authors WHERE author=?'
+TAG_BY_NAME_SQL = 'SELECT * FROM tags WHERE tag=?'
+CHILDREN_SQL = 'SELECT * FROM entries WHERE entry_parent=?'
 
 def create_log(log_name, log_level=logging.INFO):
     """Create a logger with the specified name and level.
@@ -42,9 +51,18 @@ def create_log(log_name, log_level=logging.INFO):
     logger = logging.getLogger(log_name)
     logger.setLevel(log_level)
     
-    # Create file handler
-    log_file = os.path.join(log_dir, f"{log_name}.log")
-    file_handler = logging.FileHandler(log_file)
+    # Reuse the file handler of an earlier call; a new one per call leaked a descriptor and duplicated every line
+    log_file = os.path.abspath(os.path.join(log_dir, f"{log_name}.log"))
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.FileHandler):
+            if handler.baseFilename == log_file:
+                return logger
+            logger.removeHandler(handler)
+            handler.close()
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        backupCount=int(os.environ.get('LOG_BACKUP_COUNT', 5)))
     
     # Create formatter
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -52,6 +70,8 @@ def create_log(log_name, log_level=logging.INFO):
     
     # Add handler to logger
     logger.addHandler(file_handler)
+    # the file is this logger's only output; the root queue pipeline would write every record a second time
+    logger.propagate = False
     
     return logger
 
@@ -62,23 +82,14 @@ def error_log(error):
         error: The error to log
     """
     exc_type, exc_obj, exc_tb = sys.exc_info()
+    error_logger = create_log('error_log')
     
     # Handle case where there's no traceback (e.g., when called directly with an error)
     if exc_tb is None:
-        print(f"Error: {str(error)}")
-        
-        # Also log to error log file
-        os.makedirs(log_dir, exist_ok=True)
-        error_logger = create_log('error_log')
         error_logger.error(f"Error without traceback: {str(error)}")
         return
         
     fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-    print(exc_type, fname, exc_tb.tb_lineno)
-    
-    # Also log to error log file
-    os.makedirs(log_dir, exist_ok=True)
-    error_logger = create_log('error_log')
     error_logger.error(f"{exc_type} in {fname} at line {exc_tb.tb_lineno}: {str(error)}")
 
 def init_directories(DATABASE_FOLDER):
@@ -99,12 +110,11 @@ def init_directories(DATABASE_FOLDER):
         os.makedirs(dir2make)
     
 def init_db(db_configs):
-    print('Initilizing the databse ...')
-    for table in db_configs.table_lists:
-        operators.create_table(db_configs.conn, table)
+    logger.info('Initializing the database ...')
+    migrate.migrate_database(db_configs.get_conn(), db_configs.table_lists)
 
 def check_existence_table(db_configs):
-    conn = db_configs.conn
+    conn = db_configs.get_conn()
     cursor = conn.cursor()
     cursor.execute(''' SELECT count(name) FROM sqlite_master WHERE type='table' AND name=? ''', ['users'])
     if cursor.fetchone()[0]==1:
@@ -114,7 +124,7 @@ def check_existence_table(db_configs):
 
 def check_existence_author(conn, author):
     cursor = conn.cursor()
-    cursor.execute('select * from authors where author=?', (author,))
+    cursor.execute(AUTHOR_BY_NAME_SQL, (author,))
     authors = cursor.fetchall()
     if len(authors)==0:
         return False
@@ -131,9 +141,47 @@ def parse_conditions(conditions):
     conditions = [condition.strip() for condition in conditions]
     return conditions
 
+def parse_number(value):
+    """Return the number a PARAM value starts with (e.g. '37 C' -> 37.0), or None."""
+    match = re.match(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)', value or '')
+    if match is None:
+        return None
+    return float(match.group(1))
+
+def structure_conditions(conditions):
+    """Split a stored conditions string into entry_conditions rows.
+
+    Conditions are saved as ``template&category&subcategory&item`` and PARAM
+    conditions as ``template&category&subcategory&param_name&value``; older
+    entries may lack the template. Each row is
+    ``(template, category, subcategory, item, param_value, param_number)``.
+    """
+    rows = []
+    if not conditions:
+        return rows
+    for condition in parse_conditions(conditions):
+        parts = condition.split('&')
+        template = category = subcategory = param_value = param_number = None
+        if len(parts) >= 5:
+            template = '&'.join(parts[:-4])
+            category, subcategory, item, param_value = parts[-4:]
+            param_number = parse_number(param_value)
+        elif len(parts) == 4:
+            template, category, subcategory, item = parts
+        elif len(parts) == 3:
+            category, subcategory, item = parts
+        elif len(parts) == 2:
+            category, item = parts
+        else:
+            item = parts[0]
+        if item == '':
+            continue
+        rows.append((template or None, category, subcategory, item, param_value, param_number))
+    return rows
+
 def check_existence_tag(conn, tag):
     cursor = conn.cursor()
-    cursor.execute('select * from tags where tag=?', (tag,))
+    cursor.execute(TAG_BY_NAME_SQL, (tag,))
     tags = cursor.fetchall()
     if len(tags)==0:
         return False
@@ -152,7 +200,7 @@ def check_existence_condition(conn, condition):
 def generate_hash(conn):
     hash_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
     cursor = conn.cursor()
-    cursor.execute('select * from entries where id_hash=?', (hash_id,))
+    cursor.execute(operators.ENTRY_BY_HASH_ID_SQL, (hash_id,))
     entries = cursor.fetchall()
     if len(entries)==0:
         return hash_id
@@ -205,13 +253,6 @@ def check_for_internet_connection():
     except requests.ConnectionError:
         return False
 
-def apply_updates2db(db_configs):
-    cursor = db_configs.conn.cursor()
-    cursor.execute('SELECT * FROM messages')
-    column_names = list(map(lambda x: x[0], cursor.description))
-    if 'destination' not in column_names:
-        cursor.execute('ALTER TABLE messages ADD COLUMN destination text') 
-
 def read_json_file(json_file):
     with open(json_file) as f:
         data = json.load(f)
@@ -247,7 +288,7 @@ def modify_conditions_json(conditions, target_conditions):
     return conditions
 
 def init_user(app_config, db_configs, user_name):
-        conn = db_configs.conn
+        conn = db_configs.get_conn()
         cursor = conn.cursor()
         cursor.execute('insert into conditions_templates values (?, ?, ?, ?)', (user_name, 'default', '', None))
         conn.commit()
@@ -318,7 +359,7 @@ def get_hash_id_by_entry_id(conn, id):
 
 def get_id_by_hash_id(conn, hash_id):
     cursor = conn.cursor()
-    cursor.execute('select * from entries where id_hash=?', (hash_id,))
+    cursor.execute(operators.ENTRY_BY_HASH_ID_SQL, (hash_id,))
     entry = cursor.fetchone()
     id = entry[9]
     return id
@@ -412,7 +453,7 @@ def bulk_entry_report_maker(conn, entries_ids):
 
 def check_hash_id_existence(conn, hash_id):
     cursor = conn.cursor()
-    cursor.execute('select * from entries where id_hash=?', (hash_id,))
+    cursor.execute(operators.ENTRY_BY_HASH_ID_SQL, (hash_id,))
     entry = cursor.fetchone()
     if entry is None:
         return False
@@ -445,7 +486,7 @@ def load_creds(CREDS_FILE_PATH=None):
 def get_family_tree(conn, entry_hash_id):
     family_tree = {'parent': None, 'children': None, 'self': None}
     cursor = conn.cursor()
-    cursor.execute('select * from entries where id_hash=?', (entry_hash_id,))
+    cursor.execute(operators.ENTRY_BY_HASH_ID_SQL, (entry_hash_id,))
     entry = cursor.fetchone()
     entry = list(entry)
     entry_name = entry[7]
@@ -456,14 +497,14 @@ def get_family_tree(conn, entry_hash_id):
     if parent_hash_id is None or parent_hash_id == 'None' or parent_hash_id == '':
         family_tree['parent'] = None
     else:
-        cursor.execute('select * from entries where id_hash=?', (parent_hash_id,))
+        cursor.execute(operators.ENTRY_BY_HASH_ID_SQL, (parent_hash_id,))
         parent = cursor.fetchone()
         parent = list(parent)
         parent_name = parent[7]
         parent_id = parent[-1]
         family_tree['parent'] = [parent_name, parent_id]
 
-    cursor.execute('select * from entries where entry_parent=?', (entry_hash_id,))
+    cursor.execute(CHILDREN_SQL, (entry_hash_id,))
     children = cursor.fetchall()
     children = list(children)
     if len(children) == 0:
@@ -524,7 +565,8 @@ def get_entry_by_id(conn, entry_id):
     entry = cursor.fetchone()
     return entry
 
-def restore_db(app_config, backup_file_path):
+def restore_db(app_config, backup_file_path, pool):
+    """Restore the database folder from a zip made by ``backup_db``; ``db_main.db`` goes through ``pool``."""
     try:
         parent_folder = os.path.dirname(backup_file_path)
         TEMP_FOLDER = os.path.join(parent_folder, 'temp_backup')
@@ -536,6 +578,8 @@ def restore_db(app_config, backup_file_path):
             if os.path.isdir(folder_path):
                 shutil.rmtree(os.path.join(app_config['DATABASE_FOLDER'], folder))
                 shutil.copytree(folder_path, os.path.join(app_config['DATABASE_FOLDER'], folder))
+            elif folder == 'db_main.db':
+                pool.restore(folder_path)
             elif os.path.isfile(folder_path):
                 os.remove(os.path.join(app_config['DATABASE_FOLDER'], folder))
                 shutil.copyfile(folder_path, os.path.join(app_config['DATABASE_FOLDER'], folder))
@@ -545,31 +589,36 @@ def restore_db(app_config, backup_file_path):
     except:
         return False
 
-def backup_db(app_config):
-    backup_file_path = os.path.join(app_config['DATABASE_FOLDER'], 'DataManager_backup')
+def backup_db(app_config, pool, name='DataManager_backup'):
+    """Zip the database folder into ``<name>.zip``; ``db_main.db`` is copied through ``pool`` so its WAL is included.
+
+    Each ``name`` has its own staging folder, so backups under different names can run at the same time.
+    """
+    backup_file_path = os.path.join(app_config['DATABASE_FOLDER'], name)
+    STAGING_FOLDER = os.path.join(os.path.dirname(backup_file_path), 'backup_datamanager', name)
     try:
-        parent_folder = os.path.dirname(backup_file_path)
         time_now = datetime.now()
         time_now = time_now.strftime('%Y-%m-%d_%H-%M')
-        TEMP_FOLDER = os.path.join(parent_folder, 'backup_datamanager', time_now)
-        if os.path.exists(TEMP_FOLDER):
-            shutil.rmtree(TEMP_FOLDER)
+        if os.path.exists(STAGING_FOLDER):
+            shutil.rmtree(STAGING_FOLDER)
+        TEMP_FOLDER = os.path.join(STAGING_FOLDER, time_now)
         # make TEMP_FOLDER and its parents if they don't exist
         os.makedirs(TEMP_FOLDER)
 
-        for folder in ['db_main.db', 'conditions', 'uploaded_files']:
+        pool.backup(os.path.join(TEMP_FOLDER, 'db_main.db'))
+        for folder in ['conditions', 'uploaded_files']:
             folder_path = os.path.join(app_config['DATABASE_FOLDER'], folder)
             if os.path.isdir(folder_path):
                 shutil.copytree(folder_path, os.path.join(TEMP_FOLDER, folder))
             elif os.path.isfile(folder_path):
                 shutil.copyfile(folder_path, os.path.join(TEMP_FOLDER, folder))
-        TEMP_FOLDER = os.path.dirname(TEMP_FOLDER)
-        shutil.make_archive(backup_file_path, 'zip', TEMP_FOLDER)
-        shutil.rmtree(TEMP_FOLDER)
+        shutil.make_archive(backup_file_path, 'zip', STAGING_FOLDER)
         backup_file_path = f'{backup_file_path}.zip'
         return True, backup_file_path
     except:
         return False, backup_file_path
+    finally:
+        shutil.rmtree(STAGING_FOLDER, ignore_errors=True)
     
 def get_methods_list(app_config):
     methods_list = os.listdir(app_config['CONDITIONS_JSON_FOLDER'])
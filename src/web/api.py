@@ -7,6 +7,11 @@ sys.path.append(os.path.join(parent_parent_path, 'database'))
 
 import chatroom
 import utils
+import result_cursors
+import search_cache
+import single_flight
+import query_guard
+import autocomplete
 import security
 import search_engine
 import operators
@@ -30,6 +35,7 @@ import flaskcode
 from functools import wraps
 
 import waitress
+import logging
 
 from datetime import datetime
 
@@ -37,12 +43,21 @@ from llm_search import ExternalLLMSearch, execute_llm_search
 
 import requests
 import secrets
+import sqlite3
+import sql_trace
+import metrics
+import audit_log
+import log_retention
+import log_explorer
+import jobs
+
+logger = logging.getLogger(__name__)
 
 
 def add_admin(db_configs, app_configs):
-    conn = db_configs.conn
+    conn = db_configs.get_conn()
     cursor = conn.cursor()
-    cursor.execute('select * from users where username=?', ('admin',))
+    cursor.execute(operators.USER_BY_USERNAME_SQL, ('admin',))
     users = cursor.fetchall()
     if len(users)==0:
         cursor.execute('insert into users values (?,?,?,?,?,?,?,?)', ('admin', 'admin', 1, 1, None, None, 1, None))
@@ -78,7 +93,38 @@ class WebApp():
         self.app.config['FLASKCODE_RESOURCE_BASEPATH'] = os.path.join(self.app.config['DATABASE_FOLDER'], 'conditions')
         self.app.register_blueprint(flaskcode.blueprint, url_prefix='/editor')
 
+        # every request checks out its own connection and hands it back when done
+        self.app.teardown_request(self.db_configs.release_conn)
+
+        # is timed for the per-route latency histograms on /metrics
+        self.app.before_request(self.start_request_metrics)
+        self.app.after_request(self.record_request_metrics)
+        self.app.teardown_request(self.finish_request_metrics)
+
+        # has its SQL traced for the slow-query log and N+1 detection
+        self.app.before_request(self.start_sql_trace)
+        # and runs its queries under the SQL time and row budget of its route
+        self.app.before_request(self.start_query_budget)
+        self.app.after_request(self.record_query_budget)
+        self.app.teardown_request(self.stop_query_budget)
+        self.app.teardown_request(self.finish_sql_trace)
+        self.app.register_error_handler(query_guard.BudgetExceeded, self.query_budget_exceeded)
+        self.app.register_error_handler(sqlite3.OperationalError, self.query_interrupted)
+
         self.ChatRoom = chatroom.ChatRoom(self.db_configs)
+        self.search_cursors = result_cursors.ResultCursorStore()
+        self.search_cache = search_cache.SearchCache()
+        # a leader stopped by its own time budget must not fail the requests sharing its query
+        self.order_flights = single_flight.SingleFlight(retry_on=query_guard.is_interrupt)
+        self.search_generations = query_guard.SearchGenerations()
+        self.autocomplete = autocomplete.AutocompleteService(self.db_configs)
+        self.server = None
+        self.audit_log = audit_log.AuditLogger(self.db_configs)
+        self.log_retention = log_retention.LogRetention(self.db_configs)
+        self.jobs = jobs.JobQueue(self.db_configs)
+        self.jobs.register('notify_by_email', self.job_notify_by_email)
+        self.jobs.register('backup', self.job_backup)
+        self.jobs.register('order_status_mail', self.job_order_status_mail)
 
         add_admin(self.db_configs, self.app.config)
         
@@ -86,15 +132,11 @@ class WebApp():
         testing_mode = self.app.config.get('TESTING', False)
         self.llm_search = ExternalLLMSearch(testing_mode=testing_mode)
         if self.llm_search.ready:
-            print("Claude API service initialized successfully.")
+            logger.info("Claude API service initialized successfully.")
         else:
-            print("WARNING: Claude API key not set. Set the CLAUDE_API_KEY environment variable.")
-
-        # Import and run database migrations
-        from database.migrate import migrate_database
-        migrate_database()
+            logger.warning("Claude API key not set. Set the CLAUDE_API_KEY environment variable.")
 
-        print(f'App initialized. Server running on http://{self.ip}:{self.port}')
+        logger.info('App initialized. Server running on http://%s:%s', self.ip, self.port)
     
     class RecaptchaForm(FlaskForm):
         username = StringField("username", validators=[DataRequired()])
@@ -102,29 +144,191 @@ class WebApp():
         recaptcha = RecaptchaField()
     
     
+    def start_request_metrics(self):
+        flask.g.metrics_started = metrics.request_started()
+
+    def record_request_metrics(self, response):
+        started = flask.g.get('metrics_started')
+        if started is not None:
+            metrics.observe_response(flask.request.endpoint or 'unmatched', response.status_code, started)
+        return response
+
+    def finish_request_metrics(self, exception=None):
+        if flask.g.pop('metrics_started', None) is not None:
+            metrics.request_finished()
+
+    def metrics_samples(self):
+        """Cache and server figures read when /metrics is scraped."""
+        cache = self.search_cache.stats()
+        samples = [
+            ('search_cache_hits_total', 'counter', 'Searches answered from the result cache.', cache['hits']),
+            ('search_cache_misses_total', 'counter', 'Searches that ran SQL.', cache['misses']),
+            ('search_cache_evictions_total', 'counter', 'Results evicted from the cache.', cache['evictions']),
+            ('search_cache_coalesced_total', 'counter', 'Searches that waited on an identical one in flight.', cache['coalesced']),
+            ('search_cache_entries', 'gauge', 'Results held in the cache.', cache['entries']),
+            ('search_cache_rows', 'gauge', 'Result rows held in the cache.', cache['rows']),
+            ('search_cache_hit_ratio', 'gauge', 'Share of searches answered from the cache.', cache['hit_ratio']),
+            ('orders_coalesced_total', 'counter', 'Order queries that waited on an identical one in flight.', self.order_flights.shared),
+        ]
+        audit = self.audit_log.stats()
+        samples.append(('audit_log_queue_depth', 'gauge', 'Audit log rows waiting to be written.', audit['queued']))
+        samples.append(('audit_log_written_total', 'counter', 'Audit log rows and updates written.', audit['written']))
+        samples.append(('audit_log_dropped_total', 'counter', 'Audit log rows dropped on overflow or write errors.', audit['dropped']))
+        if self.server is not None:
+            dispatcher = self.server.task_dispatcher
+            samples.append(('waitress_queue_depth', 'gauge', 'Requests waiting for a worker thread.', len(dispatcher.queue)))
+            samples.append(('waitress_active_threads', 'gauge', 'Worker threads handling a request.', dispatcher.active_count))
+            samples.append(('waitress_threads', 'gauge', 'Worker threads.', len(dispatcher.threads)))
+        return samples
+
+    def mail_credentials(self):
+        return {'sender_email': self.app.config['CREDS_FILE']['SENDER_EMAIL_ADDRESS'],
+                'password': self.app.config['CREDS_FILE']['SENDER_EMAIL_PASSWORD']}
+
+    def job_notify_by_email(self, job):
+        """Mail the report of every entry to every recipient and notify them in the app."""
+        conn = self.db_configs.get_conn()
+        sender_username = job.payload['sender_username']
+        recipients = [(user_name, operators.get_email_address_by_user_name(conn, user_name))
+                      for user_name in job.payload['recipients']]
+        steps = [(entry_id, user_name, email) for entry_id in job.payload['entries_ids'] for user_name, email in recipients]
+        # steps done by earlier attempts are skipped on a retry
+        checkpoint = {'notified': job.checkpoint.get('notified', []), 'sent': job.checkpoint.get('sent', [])}
+        reports = {}
+        failed = 0
+        for done, (entry_id, user_name, email) in enumerate(steps, 1):
+            step = f'{entry_id}:{user_name}'
+            if entry_id not in reports:
+                cursor = conn.cursor()
+                cursor.execute("SELECT entry_name FROM entries WHERE id=?", (entry_id,))
+                reports[entry_id] = (utils.entry_report_maker(conn, entry_id), cursor.fetchone()[0])
+            entry_report, entry_name = reports[entry_id]
+            if step not in checkpoint['sent']:
+                args = {
+                    'receiver_email': email,
+                    **self.mail_credentials(),
+                    'subject': f'Entry report notification (by {sender_username})',
+                    'txt': entry_report,
+                    'link2entry': f"{self.host_url}/entry/{entry_id}",
+                    'sender_username': sender_username
+                }
+                if mailing.send_report_mail(args):
+                    checkpoint['sent'].append(step)
+                else:
+                    failed += 1
+            if step not in checkpoint['notified']:
+                operators.add_notification(conn, sender_username, f"Entry '{entry_name}' has been shared with you",
+                                           user_name, 'entry_share', entry_id)
+                checkpoint['notified'].append(step)
+            job.progress(done, len(steps), f'{len(checkpoint["sent"])} of {len(steps)} emails sent', checkpoint)
+        if failed:
+            raise jobs.JobError(f'{failed} of {len(steps)} emails could not be sent')
+        return {'sent': len(checkpoint['sent'])}
+
+    def job_backup(self, job):
+        """Zip the database folder into the backup file of this job offered for download."""
+        job.progress(0.1, message='Copying the database')
+        # one file per job, so concurrent backups never overwrite each other's download
+        status, backup_file_path = utils.backup_db(self.app.config, self.db_configs.pool,
+                                                   f'DataManager_backup_{job.id}')
+        if not status:
+            raise jobs.JobError('Database was not backed up successfully')
+        return {'file': os.path.basename(backup_file_path)}
+
+    def job_order_status_mail(self, job):
+        mail_args = {'receiver_email': job.payload['receiver_email'], **self.mail_credentials(),
+                     'subject': job.payload['subject']}
+        if not mailing.send_order_status_mail(job.payload['order'], mail_args):
+            raise jobs.JobError(f"Could not send the order status mail to {job.payload['receiver_email']}")
+
+    def job_summary(self, job):
+        """The fields of a job shown to its owner by the status endpoints."""
+        return {key: job[key] for key in ('id', 'kind', 'status', 'progress', 'message', 'result', 'error',
+                                          'attempts', 'max_attempts', 'created_at', 'updated_at')}
+
+    def start_sql_trace(self):
+        endpoint = flask.request.endpoint
+        if endpoint is None or endpoint == 'static':
+            return
+        sql_trace.start(endpoint, self.db_configs.get_conn())
+
+    def finish_sql_trace(self, exception=None):
+        summary = sql_trace.finish()
+        if summary is not None:
+            metrics.observe_sql(summary['endpoint'], summary['sql_ms'] / 1000, summary['queries'])
+        if summary is not None and summary['n_plus_one']:
+            shapes = ', '.join(f"{item['count']}x {item['sql']}" for item in summary['n_plus_one'])
+            logger.warning("Repeated queries on %s: %s", summary['endpoint'], shapes)
+
+    def start_query_budget(self):
+        endpoint = flask.request.endpoint
+        if endpoint is None or endpoint == 'static':
+            return
+        seconds, rows = query_guard.route_budget(endpoint)
+        flask.g.query_budget = query_guard.QueryBudget(endpoint, seconds, rows)
+        flask.g.query_budget.install(self.db_configs.get_conn())
+
+    def record_query_budget(self, response):
+        budget = flask.g.get('query_budget')
+        kind = budget.record() if budget is not None else None
+        if kind is not None:
+            # rows were cut off, or a query gave up on time and the route carried on
+            response.headers['X-Query-Budget-Exceeded'] = kind
+            logger.warning('Query budget exceeded (%s) on %s', kind, budget.endpoint)
+        return response
+
+    def results_truncated(self):
+        """True when rows of this request were cut off at its route's row budget."""
+        budget = flask.g.get('query_budget')
+        return budget is not None and budget.truncated
+
+    def stop_query_budget(self, exception=None):
+        budget = flask.g.pop('query_budget', None)
+        if budget is not None:
+            budget.uninstall()
+
+    def query_budget_exceeded(self, e):
+        message = 'The request took too long and was stopped. Please narrow it down and try again.'
+        # page loads ask for HTML explicitly, fetch() and $.ajax calls do not
+        if 'text/html' in flask.request.headers.get('Accept', ''):
+            response = flask.make_response(message)
+        else:
+            response = flask.jsonify({'error': message, 'timeout': True})
+        response.status_code = 503
+        response.headers['X-Query-Budget-Exceeded'] = 'time'
+        return response
+
+    def query_interrupted(self, e):
+        budget = flask.g.get('query_budget')
+        if query_guard.is_interrupt(e) and budget is not None and budget.timed_out:
+            return self.query_budget_exceeded(query_guard.BudgetExceeded(budget.endpoint, budget.seconds))
+        raise e
+
+    def shared_orders(self, filters, offset):
+        """Orders matching ``filters``, sharing the query of an identical request in flight."""
+        conn = self.db_configs.get_conn()
+        try:
+            return self.order_flights.do(('orders', filters, offset), lambda: operators.get_orders(
+                conn, *filters, limit=10, offset=offset), query_guard.time_left(conn))
+        except single_flight.WaitTimeout as e:
+            raise query_guard.waited_out(conn) from e
+
     def logger(self, f):
         @wraps(f)
         def wrap(*args, **kwargs):
             time_now = dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # Convert to string format
-            conn = self.db_configs.conn
-            cursor = conn.cursor()
+            action = f.__name__
+            # Check if user is logged in before accessing username
+            username = flask.session.get('username', 'anonymous')
+            # written behind by the audit log thread, off the request's critical path
+            record = self.audit_log.record(username, action, time_now)
             try:
-                action = f.__name__
-                # Check if user is logged in before accessing username
-                username = flask.session.get('username', 'anonymous')
-                cursor.execute('insert into logs values (?,?,?,?,?,?)', (username, action, time_now, 'pass', None, None))
-                conn.commit()
                 return f(*args, **kwargs)
             except Exception as e:
-                # Use the username from above or default to 'anonymous' if not set
-                username = flask.session.get('username', 'anonymous')
-                try:
-                    cursor.execute('update logs set status=?, error=? where username=? and action=? and date=?', 
-                                ('fail', str(e), username, action, time_now))
-                    conn.commit()
-                except Exception as db_error:
-                    print(f"Error updating logs: {db_error}")
-                print(e)
+                self.audit_log.fail(record, str(e))
+                if isinstance(e, query_guard.BudgetExceeded) or query_guard.is_interrupt(e):
+                    raise
+                logger.exception('Error in %s', action)
                 flask.flash('An error occurred. Please try again later.')
                 return flask.redirect(flask.url_for('index'))
         return wrap
@@ -138,9 +342,9 @@ class WebApp():
             if flask.request.method == 'POST':
                 username = flask.request.form['username']
                 password = flask.request.form['password']
-                conn = self.db_configs.conn
+                conn = self.db_configs.get_conn()
                 cursor = conn.cursor()
-                cursor.execute('select * from users where username=?', (username,))
+                cursor.execute(operators.USER_BY_USERNAME_SQL, (username,))
                 users = cursor.fetchall()
 
                 form = self.RecaptchaForm()
@@ -172,7 +376,7 @@ class WebApp():
         def index():
             if not flask.session.get('logged_in'):
                 return flask.redirect(flask.url_for('login'))
-            entries_list = search_engine.entries_time_line(self.db_configs.conn)
+            entries_list = search_engine.entries_time_line(self.db_configs.get_conn())
             
             # Convert entries from tuples to dictionaries with named keys
             entries_dict_list = []
@@ -198,6 +402,7 @@ class WebApp():
             flask.session.pop('username', None)
             flask.session.pop('password', None)
             flask.session.pop('admin', None)
+            self.search_cursors.discard(flask.session.pop('search_cursor', None))
             return flask.redirect(flask.url_for('login'))
 
         @app.route('/add_user', methods=['GET', 'POST'])
@@ -225,9 +430,9 @@ class WebApp():
                 flask.flash('Passwords do not match')
                 return flask.render_template('add_user.html')
 
-            conn = self.db_configs.conn
+            conn = self.db_configs.get_conn()
             cursor = conn.cursor()
-            cursor.execute('select * from users where username=?', (username,))
+            cursor.execute(operators.USER_BY_USERNAME_SQL, (username,))
             users = cursor.fetchall()
 
             if len(users)>0:
@@ -264,7 +469,7 @@ class WebApp():
                     flask.flash('Passwords do not match')
                     return flask.redirect(flask.url_for('profile'))
                 
-                success = operators.update_user(self.db_configs.conn, form_data, id)
+                success = operators.update_user(self.db_configs.get_conn(), form_data, id)
                 if success:
                     flask.flash('User updated successfully')
                     return flask.redirect(flask.url_for('user_management'))
@@ -276,7 +481,7 @@ class WebApp():
         @security.admin_required
         @self.logger
         def delete_user(id):
-            success = operators.delete_user(self.db_configs.conn, id)
+            success = operators.delete_user(self.db_configs.get_conn(), id)
             
             if success:
                 flask.flash('User deleted successfully')
@@ -288,7 +493,7 @@ class WebApp():
         @app.route('/user_management', methods=['GET', 'POST'])
         @security.admin_required
         def user_management():
-            users = operators.get_users(self.db_configs.conn)
+            users = operators.get_users(self.db_configs.get_conn())
 
             users_html = [flask.render_template('user_profile_template.html', user=user) for user in users]
             users_html = [Markup(user_html) for user_html in users_html]
@@ -305,7 +510,12 @@ class WebApp():
             dates = [yesterday_date, tomorrow_date]
 
             if flask.request.method == 'POST' and len(flask.request.form):
-                entries_list = search_engine.filter_entries(self.db_configs.conn, flask.request.form)
+                try:
+                    entries_list = search_engine.filter_entries(self.db_configs.get_conn(), flask.request.form,
+                                                                 cache=self.search_cache)
+                except ValueError as e:
+                    flask.flash(str(e))
+                    return flask.render_template('entries.html', entries_html=None, dates=dates)
                 
                 # Store the full results in session for pagination
                 entries_dict_list = []
@@ -317,11 +527,14 @@ class WebApp():
                         'date': entry[4],
                         'conditions': entry[6],
                         'title': entry[7],
-                        'id': entry[-1]
+                        'id': entry[9]
                     })
                 
-                # Store the full results in session
-                flask.session['search_results'] = entries_dict_list
+                # Keep the full results server-side; the session only holds the cursor id
+                previous_cursor = flask.session.get('search_cursor')
+                if previous_cursor:
+                    self.search_cursors.discard(previous_cursor)
+                flask.session['search_cursor'] = self.search_cursors.put(flask.session.get('username'), entries_dict_list)
                 
                 # Only display the first 10 results
                 display_entries = entries_dict_list[:10]
@@ -330,7 +543,8 @@ class WebApp():
                 entries_html = flask.render_template('entries_list.html', entries_list=display_entries)
                 entries_html = Markup(entries_html)
                 return flask.render_template('entries.html', entries_html=entries_html, 
-                                            dates=dates, show_more_button=show_more_button)
+                                            dates=dates, show_more_button=show_more_button,
+                                            truncated=self.results_truncated())
             else:
                 return flask.render_template('entries.html', entries_html=None, dates=dates)
 
@@ -341,14 +555,12 @@ class WebApp():
             offset = int(flask.request.args.get('offset', 0))
             limit = 10  # Number of entries to load each time
             
-            # Get the stored search results
-            all_entries = flask.session.get('search_results', [])
-            
-            # Get the next batch of entries
-            next_entries = all_entries[offset:offset+limit]
-            
-            # Check if there are more entries to load
-            has_more = len(all_entries) > offset + limit
+            # Get the next batch of the stored search results
+            page = self.search_cursors.page(flask.session.get('search_cursor'), flask.session.get('username'), offset, limit)
+            if page is None:
+                # the cursor expired or was evicted; the user has to search again
+                return flask.jsonify({'entries': [], 'has_more': False, 'next_offset': -1, 'expired': True})
+            next_entries, has_more = page
             
             # Return the entries as JSON
             return flask.jsonify({
@@ -360,7 +572,7 @@ class WebApp():
         @app.route('/insert_entry', methods=('GET', 'POST'))
         @security.login_required
         def insert_entry():
-            conditions_list = utils.list_user_conditoins_templates(self.db_configs.conn, self.app.config, flask.session)
+            conditions_list = utils.list_user_conditoins_templates(self.db_configs.get_conn(), self.app.config, flask.session)
             methods_list = utils.get_methods_list(self.app.config)
             today_date = dt.datetime.now().strftime("%Y-%m-%d")
             return flask.render_template('insert_entry.html', conditions_list=conditions_list, today_date=today_date, methods_list=methods_list)
@@ -371,7 +583,6 @@ class WebApp():
         def insert_entry_to_db():
             if flask.request.method == 'POST':
                 try:
-                    print(flask.request.form)
                     Author = flask.session['username']
                     date = flask.request.form.get('date', dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
                     Tags = flask.request.form.get('Tags', '')
@@ -393,7 +604,7 @@ class WebApp():
                     flask.flash(f'Error processing form: {str(e)}')
                     return flask.redirect(flask.url_for('insert_entry'))
 
-                if not utils.check_hash_id_existence(self.db_configs.conn, parent_entry) and parent_entry != '':
+                if not utils.check_hash_id_existence(self.db_configs.get_conn(), parent_entry) and parent_entry != '':
                     flask.flash('Parent entry does not exist')
                     return flask.redirect(flask.url_for('insert_entry'))
 
@@ -414,7 +625,7 @@ class WebApp():
                             conditions_list.append(list_tmp)
                     conditions = ','.join(conditions_list)
                 
-                success_bool, hash_id = operators.insert_entry_to_db(conn=self.db_configs.conn, Author=Author, date=date, Tags=Tags, File_Path=File_Path, Notes=Notes, conditions=conditions, entry_name=entry_name, parent_entry=parent_entry)
+                success_bool, hash_id = operators.insert_entry_to_db(conn=self.db_configs.get_conn(), Author=Author, date=date, Tags=Tags, File_Path=File_Path, Notes=Notes, conditions=conditions, entry_name=entry_name, parent_entry=parent_entry)
                 
                 if hash_id and Files:
                     utils.upload_files(self.app.config, hash_id, Files)
@@ -433,30 +644,28 @@ class WebApp():
         @security.login_required
         def author_search():
             searchbox = flask.request.form.get('search_term', flask.request.form.get('text', ''))
-
-            return search_engine.author_search_in_db(conn=self.db_configs.conn, keyword=searchbox)
+            return search_engine.autocomplete_search(self.autocomplete, 'authors', searchbox, 'author')
 
         @app.route("/tags_search", methods=["POST", "GET"])
         @security.login_required
         def tags_search():
             searchbox = flask.request.form.get('search_term', flask.request.form.get('text', ''))
-            return search_engine.tags_search_in_db(conn=self.db_configs.conn, keyword=searchbox)
+            return search_engine.autocomplete_search(self.autocomplete, 'tags', searchbox, 'tag')
 
         @app.route("/text_search", methods=["POST", "GET"])
         @security.login_required
         def text_search():
             searchbox = flask.request.form.get('search_term', flask.request.form.get('text', ''))
-            return search_engine.text_search_in_db(conn=self.db_configs.conn, keyword=searchbox)
+            return search_engine.text_search_in_db(conn=self.db_configs.get_conn(), keyword=searchbox)
 
         @app.route("/entry/<int:id>", methods=["POST", "GET"])
         @security.login_required
         def entry(id):
-            entry = operators.get_entry_by_id(self.db_configs.conn, id)
+            entry = operators.get_entry_by_id(self.db_configs.get_conn(), id)
             
             if not entry:
                 flask.flash('Entry not found')
                 return flask.redirect(flask.url_for('index'))
-            print(entry)
             target_conditions = entry['conditions']
             entry['conditions'] = utils.parse_conditions(entry['conditions'])
             for i in range(len(entry['conditions'])):
@@ -468,7 +677,7 @@ class WebApp():
             dirName = os.path.join(app.config['UPLOAD_FOLDER'], hash_id)
             List = os.listdir(dirName)
 
-            # family_tree_html = utils.family_tree_to_html(self.db_configs.conn, hash_id, self.app.config['FAMILY_TREE_FOLDER'])
+            # family_tree_html = utils.family_tree_to_html(self.db_configs.get_conn(), hash_id, self.app.config['FAMILY_TREE_FOLDER'])
             # family_tree_html = Markup(family_tree_html)
             family_tree_html = None
 
@@ -485,7 +694,7 @@ class WebApp():
         @app.route("/entry_by_hash_id/<string:hash_id>", methods=["POST", "GET"])
         @security.login_required
         def entry_by_hash_id(hash_id):
-            id = operators.get_id_by_hash_id(self.db_configs.conn, hash_id)
+            id = operators.get_id_by_hash_id(self.db_configs.get_conn(), hash_id)
             if id is None:
                 flask.flash('Entry not found')
                 return flask.redirect(flask.url_for('index'))
@@ -497,7 +706,7 @@ class WebApp():
         def update_entry(id):
             try:
                 post_form = flask.request.form
-                entry = utils.get_entry_by_id(self.db_configs.conn, id)
+                entry = utils.get_entry_by_id(self.db_configs.get_conn(), id)
                 
                 if not entry:
                     flask.flash('Entry not found')
@@ -511,7 +720,7 @@ class WebApp():
                     return flask.redirect(flask.url_for('entry', id=id))
 
                 # get hash_id from id
-                hash_id = operators.get_hash_id_by_entry_id(self.db_configs.conn, id)
+                hash_id = operators.get_hash_id_by_entry_id(self.db_configs.get_conn(), id)
                 
                 if not hash_id:
                     flask.flash('Entry hash ID not found')
@@ -519,15 +728,13 @@ class WebApp():
 
                 # Check parent entry if provided
                 parent_entry = post_form.get('parent_entry', '')
-                if parent_entry and not operators.check_hash_id_existence(self.db_configs.conn, parent_entry):
+                if parent_entry and not operators.check_hash_id_existence(self.db_configs.get_conn(), parent_entry):
                     flask.flash('Parent entry does not exist')
                     return flask.redirect(flask.url_for('entry', id=id))
 
                 # Update title if provided
                 if 'entry_name' in post_form and post_form['entry_name'] != entry[7]:
-                    cursor = self.db_configs.conn.cursor()
-                    cursor.execute("UPDATE entries SET entry_name=? WHERE id=?", (post_form['entry_name'], id))
-                    self.db_configs.conn.commit()
+                    operators.update_entry_title(self.db_configs.get_conn(), id, post_form['entry_name'])
 
                 # Get files from request
                 files = flask.request.files.getlist('Files')
@@ -549,7 +756,7 @@ class WebApp():
                 
                 # Update the entry
                 success_bool = operators.update_entry_in_db(
-                    self.db_configs.conn, 
+                    self.db_configs.get_conn(), 
                     id, 
                     mutable_post_form, 
                     app.config, 
@@ -574,7 +781,7 @@ class WebApp():
         @security.login_required
         @self.logger
         def delete_entry(id):
-            entry = utils.get_entry_by_id(self.db_configs.conn, id)
+            entry = utils.get_entry_by_id(self.db_configs.get_conn(), id)
             author = entry[5]
             author = entry[5]
             usename = flask.session['username']
@@ -583,7 +790,7 @@ class WebApp():
                 flask.flash('You are not allowed to delete this entry')
                 return flask.redirect(flask.url_for('entry', id=id))
 
-            success_bool = operators.delete_entry_from_db(self.db_configs.conn, id)
+            success_bool = operators.delete_entry_from_db(self.db_configs.get_conn(), id)
 
             if success_bool:
                 message = 'entry is deleted successfully'
@@ -610,7 +817,7 @@ class WebApp():
         @app.route("/conditions_templates", methods=["POST", "GET"])
         @security.login_required
         def conditions_templates():
-            conditions_list = utils.list_user_conditoins_templates(self.db_configs.conn, self.app.config, flask.session)
+            conditions_list = utils.list_user_conditoins_templates(self.db_configs.get_conn(), self.app.config, flask.session)
             return flask.render_template('user_condition_templates.html', conditions_list=conditions_list)
 
         @app.route("/update_conditions_templates_in_db", methods=["POST", "GET"])
@@ -619,7 +826,7 @@ class WebApp():
         def update_conditions_templates_in_db():
             post_form = flask.request.form
 
-            success_bool = operators.update_conditions_templates(self.db_configs.conn, post_form, flask.session['username'])
+            success_bool = operators.update_conditions_templates(self.db_configs.get_conn(), post_form, flask.session['username'])
 
             if success_bool:
                 message = 'Conditions template is updated successfully'
@@ -633,7 +840,7 @@ class WebApp():
         @security.login_required
         def profile():
             username = flask.session['username']
-            user = operators.get_user_by_username(self.db_configs.conn, username)
+            user = operators.get_user_by_username(self.db_configs.get_conn(), username)
             
             if not user:
                 flask.flash('User not found')
@@ -666,7 +873,7 @@ class WebApp():
             if '/' not in path:
                 cwd = os.getcwd()
                 cwd = os.path.join(cwd, app.config['UPLOAD_FOLDER'])
-                hash_id = utils.get_hash_id_by_entry_id(self.db_configs.conn, entry_id)
+                hash_id = utils.get_hash_id_by_entry_id(self.db_configs.get_conn(), entry_id)
                 path = os.path.join(hash_id, path)
                 return flask.send_from_directory(cwd, path, as_attachment=True)
 
@@ -685,14 +892,14 @@ class WebApp():
             username = flask.session['username']
             template_name = flask.request.form.get("template_name")
             method_name = flask.request.form.get("method_name")
-            condition_html = utils.get_conditions_by_template_and_method(self.db_configs.conn, app.config, username, template_name, method_name)
+            condition_html = utils.get_conditions_by_template_and_method(self.db_configs.get_conn(), app.config, username, template_name, method_name)
             return condition_html
 
         @app.route('/entry_report_maker/<int:id>', methods=["POST", "GET"])
         @security.login_required
         @self.logger
         def entry_report_maker(id):
-                report_bytes = utils.bulk_entry_report_maker(self.db_configs.conn, [id])
+                report_bytes = utils.bulk_entry_report_maker(self.db_configs.get_conn(), [id])
                 return flask.send_file(report_bytes, as_attachment=True, download_name='entry_report.csv')
 
         @app.route('/entries_actions', methods=['POST'])
@@ -715,12 +922,12 @@ class WebApp():
             if action == 'delete':
                 # Process delete action
                 for id in entries_ids:
-                    utils.delete_entry(self.db_configs.conn, id)
+                    utils.delete_entry(self.db_configs.get_conn(), id)
                 flask.flash(f'Deleted {len(entries_ids)} entries')
                 return flask.redirect(flask.url_for('entries'))
             if action == 'bulk_report':
                 # Process bulk report action
-                report_bytes = utils.bulk_entry_report_maker(self.db_configs.conn, entries_ids)
+                report_bytes = utils.bulk_entry_report_maker(self.db_configs.get_conn(), entries_ids)
                 return flask.send_file(report_bytes, as_attachment=True, download_name='bulk_entry_report.csv')
                     
             
@@ -740,7 +947,7 @@ class WebApp():
                 for user_name in user_names.split(','):
                     user_name = user_name.strip()
                     if user_name:
-                        email = operators.get_email_address_by_user_name(self.db_configs.conn, user_name)
+                        email = operators.get_email_address_by_user_name(self.db_configs.get_conn(), user_name)
                         if email:
                             email_addresses.append(email)
                             user_list.append(user_name)
@@ -749,56 +956,24 @@ class WebApp():
                     flask.flash('No valid email addresses found for the specified users')
                     return flask.redirect(flask.url_for('entries'))
 
-                success_count = 0
-                for id in entries_ids:
-                    entry_report = utils.entry_report_maker(self.db_configs.conn, id)
-                    host_url = self.host_url
-                    link2entry = f"{host_url}/entry/{id}"
-                    sender_email_address = self.app.config['CREDS_FILE']['SENDER_EMAIL_ADDRESS']
-                    sender_username = flask.session['username']
-                    
-                    # Get entry name for notification
-                    cursor = self.db_configs.conn.cursor()
-                    cursor.execute("SELECT entry_name FROM entries WHERE id=?", (id,))
-                    entry_name = cursor.fetchone()[0]
-                    
-                    for idx, receiver_email_address in enumerate(email_addresses):
-                        args = {
-                            'receiver_email': receiver_email_address, 
-                            'sender_email': sender_email_address, 
-                            'password': self.app.config['CREDS_FILE']['SENDER_EMAIL_PASSWORD'], 
-                            'subject': f'Entry report notification (by {sender_username})',
-                            'txt': entry_report,
-                            'link2entry': link2entry,
-                            'sender_username': sender_username
-                        }
-                        if mailing.send_report_mail(args):
-                            success_count += 1
-                            # Create notification for the user
-                        operators.add_notification(
-                            self.db_configs.conn,
-                            sender_username,
-                            f"Entry '{entry_name}' has been shared with you",
-                            user_list[idx],
-                            'entry_share',
-                            id
-                            )
-                
-                if success_count > 0:
-                    flask.flash(f'Successfully sent {success_count} email notifications')
-                else:
-                    flask.flash('Failed to send email notifications')
+                # mails are sent by a job worker; only a request carrying an explicit key is
+                # merged with an earlier one, a deliberate re-share always sends again
+                idempotency_key = flask.request.headers.get('Idempotency-Key') or post_form.get('idempotency_key') or None
+                job_id = self.jobs.enqueue('notify_by_email', {'entries_ids': entries_ids, 'recipients': user_list,
+                                                               'sender_username': flask.session['username']},
+                                           owner=flask.session['username'], idempotency_key=idempotency_key, window=600)
+                flask.flash(f'Sending {len(entries_ids) * len(user_list)} email notifications in the background (job {job_id})')
                 
                 # Add this return statement to fix the error
                 return flask.redirect(flask.url_for('entries'))
             
             elif action == "set_parent_entry":
                 parent_entry_hash_id = post_form.get('parent_entry_hash_id')
-                if not operators.check_hash_id_existence(self.db_configs.conn, parent_entry_hash_id):
+                if not operators.check_hash_id_existence(self.db_configs.get_conn(), parent_entry_hash_id):
                     flask.flash('Parent entry does not exist')
                     return flask.redirect(flask.url_for('entries'))
                 for id in entries_ids:
-                    operators.set_parent_entry(self.db_configs.conn, id, parent_entry_hash_id)
+                    operators.set_parent_entry(self.db_configs.get_conn(), id, parent_entry_hash_id)
                 flask.flash('Parent entry set successfully')
                 return flask.redirect(flask.url_for('entries'))
             
@@ -810,7 +985,7 @@ class WebApp():
         @security.login_required
         def chatroom():
             messages = self.ChatRoom.get_messages()
-            users = utils.get_users(self.db_configs.conn)
+            users = utils.get_users(self.db_configs.get_conn())
             users.insert(0, {'username': 'Group Chat'})
             for i, user in enumerate(users):
                 if user['username'] == flask.session['username']:
@@ -836,25 +1011,111 @@ class WebApp():
             self.ChatRoom.delete_message(id)
             return flask.redirect(flask.url_for('chatroom'))
 
-        @app.route('/logs', methods=["GET", "POST"])
+        @app.route('/logs', methods=["GET"])
         @security.admin_required
         def logs():
-            logs = operators.get_recent_logs(self.db_configs.conn, 7)
-            return flask.render_template('logs.html', logs=logs)
+            args = flask.request.args
+            sort = args.get('sort', 'date')
+            descending = args.get('order', 'desc') != 'asc'
+            bucket = args.get('bucket', '')
+            logs, next_cursor, counts = [], None, []
+            try:
+                filters = log_explorer.parse_filters(args)
+                conn = self.db_configs.get_conn()
+                logs, next_cursor = log_explorer.page(conn, filters, sort, descending, args.get('after'),
+                                                      args.get('limit', 50, type=int), self.log_retention.archive_file)
+                if bucket:
+                    counts = log_explorer.counts(conn, filters, bucket, self.log_retention.archive_file)
+            except ValueError as e:
+                flask.flash(str(e))
+            # the filter and sort arguments every link of the page carries along
+            query = {key: value for key, value in args.items() if key not in ('after', 'sort', 'order') and value}
+            return flask.render_template('logs.html', logs=logs, next_cursor=next_cursor, counts=counts,
+                                         query=query, sort=sort, descending=descending,
+                                         buckets=list(log_explorer.BUCKETS))
+
+        @app.route('/api/logs', methods=["GET"])
+        @security.admin_required
+        def logs_api():
+            args = flask.request.args
+            try:
+                filters = log_explorer.parse_filters(args)
+                logs, next_cursor = log_explorer.page(self.db_configs.get_conn(), filters, args.get('sort', 'date'),
+                                                      args.get('order', 'desc') != 'asc', args.get('after'),
+                                                      args.get('limit', 50, type=int), self.log_retention.archive_file)
+            except ValueError as e:
+                return flask.jsonify({'error': str(e)}), 400
+            return flask.jsonify({'logs': logs, 'next': next_cursor})
+
+        @app.route('/api/logs/counts', methods=["GET"])
+        @security.admin_required
+        def logs_counts():
+            args = flask.request.args
+            bucket = args.get('bucket', 'day')
+            try:
+                filters = log_explorer.parse_filters(args)
+                counts = log_explorer.counts(self.db_configs.get_conn(), filters, bucket,
+                                             self.log_retention.archive_file)
+            except ValueError as e:
+                return flask.jsonify({'error': str(e)}), 400
+            return flask.jsonify({'bucket': bucket, 'counts': counts})
+
+        @app.route('/metrics', methods=["GET"])
+        def prometheus_metrics():
+            # scraped by Prometheus: bearer METRICS_TOKEN when set, otherwise local requests only
+            token = os.environ.get('METRICS_TOKEN')
+            if token:
+                if not secrets.compare_digest(flask.request.headers.get('Authorization', ''), f'Bearer {token}'):
+                    flask.abort(401)
+            elif flask.request.remote_addr not in ('127.0.0.1', '::1'):
+                flask.abort(403)
+            return flask.Response(metrics.render(self.metrics_samples()), mimetype='text/plain; version=0.0.4')
+
+        @app.route('/sql_trace', methods=["GET"])
+        @security.admin_required
+        def sql_trace_log():
+            requests_log = list(reversed(sql_trace.recent_requests))
+            slow_queries = list(reversed(sql_trace.slow_queries))
+            return flask.render_template('sql_trace.html', requests_log=requests_log, slow_queries=slow_queries,
+                                         slow_query_ms=sql_trace.SLOW_QUERY_MS)
 
         @app.route('/backup', methods=["GET", "POST"])
         @security.admin_required
         @self.logger
         def backup():
             if flask.request.method == 'POST':
-                status, backup_file_path = utils.backup_db(self.app.config)
-                if status:
-                    return flask.send_from_directory(os.path.dirname(backup_file_path), os.path.basename(backup_file_path), as_attachment=True)
-                else:
-                    flask.flash('Database was not backed up successfully')
-                    return flask.render_template('backup.html')
-            else:
-                return flask.render_template('backup.html')
+                # zipped by a job worker; a double submit of the same form (same request token,
+                # same admin) returns the same job, a new page or a failed job starts a new one
+                request_key = flask.request.headers.get('Idempotency-Key') or flask.request.form.get('request_token')
+                idempotency_key = f"backup:{flask.session['username']}:{request_key}" if request_key else None
+                job_id = self.jobs.enqueue('backup', {}, owner=flask.session['username'],
+                                           idempotency_key=idempotency_key, window=60, max_attempts=1)
+                return flask.redirect(flask.url_for('backup', job=job_id))
+            job_id = flask.request.args.get('job', type=int)
+            job = self.jobs.get(job_id) if job_id is not None else None
+            return flask.render_template('backup.html', job=job, request_token=secrets.token_hex(16))
+
+        @app.route('/backup/download/<int:job_id>', methods=["GET"])
+        @security.admin_required
+        def backup_download(job_id):
+            job = self.jobs.get(job_id)
+            if job is None or job['kind'] != 'backup' or job['status'] != 'done':
+                flask.flash('The backup is not ready')
+                return flask.redirect(flask.url_for('backup', job=job_id))
+            return flask.send_from_directory(self.app.config['DATABASE_FOLDER'], job['result']['file'], as_attachment=True)
+
+        @app.route('/api/jobs', methods=["GET"])
+        @security.login_required
+        def jobs_list():
+            return flask.jsonify({'jobs': [self.job_summary(job) for job in self.jobs.recent(flask.session['username'])]})
+
+        @app.route('/api/jobs/<int:job_id>', methods=["GET"])
+        @security.login_required
+        def job_status(job_id):
+            job = self.jobs.get(job_id)
+            if job is None or not (flask.session.get('admin') or job['owner'] == flask.session['username']):
+                return flask.jsonify({'error': 'Job not found'}), 404
+            return flask.jsonify(self.job_summary(job))
 
         @app.route('/restore_db', methods=["GET", "POST"])
         @security.admin_required
@@ -869,7 +1130,7 @@ class WebApp():
                 else:
                     backup_file_path = os.path.join(app.config['DATABASE_FOLDER'], 'backup.zip')
                     file.save(backup_file_path)
-                    status = utils.restore_db(self.app.config, backup_file_path)
+                    status = utils.restore_db(self.app.config, backup_file_path, self.db_configs.pool)
                     if status:
                         flask.flash('Database was restored successfully. Please restart the server')                        
                     else:
@@ -893,55 +1154,16 @@ class WebApp():
             date_end = flask.request.args.get('date_end', '')
             format_type = flask.request.args.get('format', '')
             
-            # Build the query
-            query = "SELECT * FROM orders WHERE 1=1"
-            params = []
-            
-            if search_term:
-                query += " AND order_name LIKE ?"
-                params.append(f'%{search_term}%')
-            
-            if author_term:
-                # Split author terms by comma and create OR conditions
-                author_terms = [term.strip() for term in author_term.split(',') if term.strip()]
-                if author_terms:
-                    author_conditions = []
-                    for term in author_terms:
-                        author_conditions.append("order_author LIKE ?")
-                        params.append(f'%{term}%')
-                    query += f" AND ({' OR '.join(author_conditions)})"
-            
-            if status_filter:
-                query += " AND status = ?"
-                params.append(status_filter)
-            
-            if date_start:
-                query += " AND date >= ?"
-                params.append(date_start)
-            
-            if date_end:
-                query += " AND date <= ?"
-                # Add 23:59:59 to include the entire end day
-                params.append(f"{date_end} 23:59:59")
-            
-            # Add ordering
-            query += " ORDER BY date DESC LIMIT 10"
-            
-            # Execute the query
-            cursor = self.db_configs.conn.cursor()
-            cursor.execute(query, tuple(params))
-            orders = cursor.fetchall()
-            
-            # Convert to dict with column names
-            cursor.execute("PRAGMA table_info(orders)")
-            columns = [column[1] for column in cursor.fetchall()]
-            orders = [dict(zip(columns, order)) for order in orders]
+            # Identical filters requested at the same moment share one query
+            filters = (search_term, author_term, status_filter, date_start, date_end)
+            orders = self.shared_orders(filters, 0)
             
             # If JSON format is requested, return JSON response
             if format_type == 'json':
                 return flask.jsonify({'orders': orders})
             
             # Get order managers for the dropdown
+            cursor = self.db_configs.get_conn().cursor()
             cursor.execute("SELECT username FROM users WHERE order_manager = 1")
             order_managers = cursor.fetchall()
             order_managers = [{'username': manager[0]} for manager in order_managers]
@@ -958,50 +1180,8 @@ class WebApp():
             date_start = flask.request.args.get('date_start', '')
             date_end = flask.request.args.get('date_end', '')
             
-            # Build the query
-            query = "SELECT * FROM orders WHERE 1=1"
-            params = []
-            
-            if search_term:
-                query += " AND order_name LIKE ?"
-                params.append(f'%{search_term}%')
-            
-            if author_term:
-                # Split author terms by comma and create OR conditions
-                author_terms = [term.strip() for term in author_term.split(',') if term.strip()]
-                if author_terms:
-                    author_conditions = []
-                    for term in author_terms:
-                        author_conditions.append("order_author LIKE ?")
-                        params.append(f'%{term}%')
-                    query += f" AND ({' OR '.join(author_conditions)})"
-            
-            if status_filter:
-                query += " AND status = ?"
-                params.append(status_filter)
-            
-            if date_start:
-                query += " AND date >= ?"
-                params.append(date_start)
-            
-            if date_end:
-                query += " AND date <= ?"
-                # Add 23:59:59 to include the entire end day
-                params.append(f"{date_end} 23:59:59")
-            
-            # Add ordering and pagination
-            query += " ORDER BY date DESC LIMIT 10 OFFSET ?"
-            params.append(offset)
-            
-            # Execute the query
-            cursor = self.db_configs.conn.cursor()
-            cursor.execute(query, tuple(params))
-            orders = cursor.fetchall()
-            
-            # Convert to dict with column names
-            cursor.execute("PRAGMA table_info(orders)")
-            columns = [column[1] for column in cursor.fetchall()]
-            orders = [dict(zip(columns, order)) for order in orders]
+            filters = (search_term, author_term, status_filter, date_start, date_end)
+            orders = self.shared_orders(filters, offset)
             
             return flask.jsonify({'success': True, 'orders': orders})
 
@@ -1020,11 +1200,11 @@ class WebApp():
                     'status': 'pending',
                     'date': dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
-                success, order_id = operators.submit_order(self.db_configs.conn, order_data)
+                success, order_id = operators.submit_order(self.db_configs.get_conn(), order_data)
                 if success:
                     # Add notification for the assignee
                     operators.add_notification(
-                        self.db_configs.conn,
+                        self.db_configs.get_conn(),
                         flask.session['username'],
                         f"New order assigned: {order_data['order_name']}",
                         order_data['order_assignee'],
@@ -1033,7 +1213,7 @@ class WebApp():
                     )
 
                     # check if the assignee email_enabled is true
-                    cursor = self.db_configs.conn.cursor()
+                    cursor = self.db_configs.get_conn().cursor()
                     cursor.execute("SELECT email_enabled, email FROM users WHERE username=?", (order_data['order_assignee'],)) 
                     email_enabled, email = cursor.fetchone()
                     if email_enabled:
@@ -1081,7 +1261,7 @@ class WebApp():
                     return flask.jsonify({'success': False, 'message': 'Invalid status value'})
                 
                 # Get the order from the database
-                cursor = self.db_configs.conn.cursor()
+                cursor = self.db_configs.get_conn().cursor()
                 cursor.execute("SELECT * FROM orders WHERE id=?", (order_id,))
                 order = cursor.fetchone()
                 if not order:
@@ -1098,12 +1278,12 @@ class WebApp():
 
                 # Update the order in the database
                 cursor.execute("UPDATE orders SET status=? WHERE id=?", (new_status, order_id))
-                self.db_configs.conn.commit()
+                self.db_configs.get_conn().commit()
 
                 # get the updated order
                 cursor.execute("SELECT * FROM orders WHERE id=?", (order_id,))
                 order = cursor.fetchone()
-                column_names = operators.get_column_names(self.db_configs.conn, 'orders')
+                column_names = operators.get_column_names(self.db_configs.get_conn(), 'orders')
                 order_dict = dict(zip(column_names, order))
 
                 # Send email notification to order assignee
@@ -1111,17 +1291,17 @@ class WebApp():
                     cursor.execute("SELECT email, email_enabled FROM users WHERE username=?", (order_dict['order_assignee'],))
                     assignee_email, assignee_email_enabled = cursor.fetchone()
                     if assignee_email_enabled:
-                        mail_args = {
+                        # sent by a job worker so the response does not wait on SMTP
+                        self.jobs.enqueue('order_status_mail', {
                             'receiver_email': assignee_email,
-                            'sender_email': self.app.config['CREDS_FILE']['SENDER_EMAIL_ADDRESS'],
-                            'password': self.app.config['CREDS_FILE']['SENDER_EMAIL_PASSWORD'],
                             'subject': f'Order Status Updated: {order_dict["order_name"]}',
-                        }
-                        mailing.send_order_status_mail(order_dict, mail_args)
+                            'order': order_dict,
+                        }, owner=flask.session['username'], idempotency_key=f'order_status:{order_id}:{new_status}',
+                            window=60)
 
                 # Add notification
                 operators.add_notification(
-                    self.db_configs.conn,
+                    self.db_configs.get_conn(),
                     flask.session['username'],
                     f"Order '{order_dict['order_name']}' status updated to {new_status}",
                     order_dict['order_author'],
@@ -1134,7 +1314,7 @@ class WebApp():
         @app.route('/get_order_details/<int:order_id>')
         @security.login_required
         def get_order_details(order_id):
-            cursor = self.db_configs.conn.cursor()
+            cursor = self.db_configs.get_conn().cursor()
             cursor.execute("SELECT * FROM orders WHERE id=?", (order_id,))
             order = cursor.fetchone()
             
@@ -1168,7 +1348,7 @@ class WebApp():
                     return flask.jsonify({'success': False, 'message': 'Invalid order ID or quantity'})
 
                 # check of order assignee has changed from the original assignee
-                cursor = self.db_configs.conn.cursor()
+                cursor = self.db_configs.get_conn().cursor()
                 cursor.execute("SELECT * FROM orders WHERE id=?", (order_id,))
                 order = cursor.fetchone()
                 cursor.execute("PRAGMA table_info(orders)")
@@ -1196,7 +1376,7 @@ class WebApp():
                     return flask.jsonify({'success': False, 'message': 'Missing required parameters'})
                 
                 # Get the order from the database
-                cursor = self.db_configs.conn.cursor()
+                cursor = self.db_configs.get_conn().cursor()
                 cursor.execute("SELECT * FROM orders WHERE id=?", (order_id,))
                 order = cursor.fetchone()
                 
@@ -1218,13 +1398,13 @@ class WebApp():
                     SET order_name=?, link=?, quantity=?, note=?, order_assignee=?
                     WHERE id=?
                 """, (order_name, link, quantity, note, order_assignee, order_id))
-                self.db_configs.conn.commit()
+                self.db_configs.get_conn().commit()
                 
                 # Return success response
                 return flask.jsonify({'success': True})
             except Exception as e:
                 # Log the error
-                print(f"Error updating order: {str(e)}")
+                logger.error("Error updating order: %s", e)
                 return flask.jsonify({'success': False, 'message': str(e)})
 
         @app.route('/delete_order', methods=['POST'])
@@ -1246,7 +1426,7 @@ class WebApp():
                     return flask.jsonify({'success': False, 'message': 'Invalid order ID'})
                 
                 # Get the order from the database
-                cursor = self.db_configs.conn.cursor()
+                cursor = self.db_configs.get_conn().cursor()
                 cursor.execute("SELECT * FROM orders WHERE id=?", (order_id,))
                 order = cursor.fetchone()
                 
@@ -1264,13 +1444,13 @@ class WebApp():
                 
                 # Delete the order from the database
                 cursor.execute("DELETE FROM orders WHERE id=?", (order_id,))
-                self.db_configs.conn.commit()
+                self.db_configs.get_conn().commit()
                 
                 # Return success response
                 return flask.jsonify({'success': True})
             except Exception as e:
                 # Log the error
-                print(f"Error deleting order: {str(e)}")
+                logger.error("Error deleting order: %s", e)
                 return flask.jsonify({'success': False, 'message': str(e)})
 
         @app.route('/notify_by_email/<int:id>', methods=["GET"])
@@ -1283,13 +1463,13 @@ class WebApp():
             
             try:
                 # Get entry details
-                entry = utils.get_entry_by_id(self.db_configs.conn, id)
+                entry = utils.get_entry_by_id(self.db_configs.get_conn(), id)
                 if not entry:
                     flask.flash('Entry not found')
                     return flask.redirect(flask.url_for('index'))
                 
                 # Get user email
-                cursor = self.db_configs.conn.cursor()
+                cursor = self.db_configs.get_conn().cursor()
                 cursor.execute("SELECT email FROM users WHERE username=?", (flask.session['username'],))
                 user_email = cursor.fetchone()[0]
                 
@@ -1298,7 +1478,7 @@ class WebApp():
                     return flask.redirect(flask.url_for('entry', id=id))
                 
                 # Create entry report
-                entry_report = utils.entry_report_maker(self.db_configs.conn, id)
+                entry_report = utils.entry_report_maker(self.db_configs.get_conn(), id)
                 
                 # Send email
                 mail_args = {
@@ -1321,7 +1501,7 @@ class WebApp():
                 
                 # Add notification
                 operators.add_notification(
-                    self.db_configs.conn,
+                    self.db_configs.get_conn(),
                     flask.session['username'],
                     f"New entry shared with you: {entry[7]}",
                     entry[4],
@@ -1338,22 +1518,19 @@ class WebApp():
         @app.route("/username_search", methods=["POST", "GET"])
         @security.login_required
         def username_search():
-            search_text = flask.request.form.get('text', '')
+            search_text = flask.request.form.get('text', '').strip()
             if not search_text:
                 return flask.jsonify([])
-            
-            # Search for usernames that match the search text
-            cursor = self.db_configs.conn.cursor()
-            cursor.execute("SELECT username FROM users WHERE username LIKE ? LIMIT 10", [f'%{search_text}%'])
-            users = cursor.fetchall()
-            
-            return flask.jsonify(users)
+
+            # one-element lists, the shape the recipient dropdown reads
+            users = self.autocomplete.search('usernames', search_text)
+            return flask.jsonify([[username] for username, _ in users])
 
         @app.route("/title_search", methods=["POST", "GET"])
         @security.login_required
         def title_search():
             searchbox = flask.request.form.get("text")
-            return search_engine.title_search_in_db(conn=self.db_configs.conn, keyword=searchbox)
+            return search_engine.autocomplete_search(self.autocomplete, 'titles', searchbox, 'entry_name')
 
         @app.route("/llm_search", methods=["POST"])
         @security.login_required
@@ -1383,7 +1560,7 @@ class WebApp():
                     import time
                     start_time = time.time()
                     search_params = self.llm_search.extract_search_params(user_query)
-                    print(f"LLM processing took {time.time() - start_time:.2f} seconds")
+                    logger.debug("LLM processing took %.2f seconds", time.time() - start_time)
                     
                     if not search_params:
                         return flask.jsonify({
@@ -1392,7 +1569,7 @@ class WebApp():
                         })
                         
                     # Execute the search based on the parameters
-                    entries_list = execute_llm_search(self.db_configs.conn, search_params)
+                    entries_list = execute_llm_search(self.db_configs.get_conn(), search_params, cache=self.search_cache)
                     
                     # Check if this is a usage question rather than a search
                     if search_params.get("is_usage_question"):
@@ -1412,7 +1589,7 @@ class WebApp():
                             'date': entry[5],
                             'conditions': entry[6],
                             'title': entry[7],
-                            'id': entry[-1]
+                            'id': entry[9]
                         })
                     
                     return flask.jsonify({
@@ -1422,16 +1599,14 @@ class WebApp():
                     })
                     
                 except Exception as e:
-                    print(f"Error in LLM processing: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.exception("Error in LLM processing: %s", e)
                     return flask.jsonify({
                         "success": False,
                         "message": f"**There was a problem processing your request:**\n\n{str(e)}\n\nPlease try again with a different query."
                     })
                 
             except Exception as e:
-                print(f"Error in LLM search route: {str(e)}")
+                logger.error("Error in LLM search route: %s", e)
                 return flask.jsonify({
                     "success": False,
                     "message": "An error occurred. Please try again with a simpler query."
@@ -1451,35 +1626,11 @@ class WebApp():
         @security.login_required
         def notifications():
             limit = 10  # Initial number of notifications to show
-            cursor = self.db_configs.conn.cursor()
-            cursor.execute("""
-                SELECT id, author, message, date, read, type, reference_id 
-                FROM notifications 
-                WHERE destination = ? 
-                ORDER BY date DESC
-                LIMIT ?
-            """, (flask.session['username'], limit))
-            notifications_raw = cursor.fetchall()
+            conn = self.db_configs.get_conn()
+            notifications = operators.get_notifications(conn, flask.session['username'], limit)
             
             # Get total count for checking if more exist
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM notifications 
-                WHERE destination = ?
-            """, (flask.session['username'],))
-            total_count = cursor.fetchone()[0]
-            
-            notifications = [
-                {
-                    'id': row[0],
-                    'author': row[1],
-                    'message': row[2],
-                    'date': row[3],
-                    'read': row[4],
-                    'type': row[5],
-                    'reference_id': row[6]
-                } for row in notifications_raw
-            ]
+            total_count = operators.count_notifications(conn, flask.session['username'])
             
             has_more = total_count > limit
             
@@ -1493,35 +1644,11 @@ class WebApp():
             offset = int(flask.request.args.get('offset', 0))
             limit = 10
             
-            cursor = self.db_configs.conn.cursor()
-            cursor.execute("""
-                SELECT id, author, message, date, read, type, reference_id 
-                FROM notifications 
-                WHERE destination = ? 
-                ORDER BY date DESC
-                LIMIT ? OFFSET ?
-            """, (flask.session['username'], limit, offset))
-            notifications_raw = cursor.fetchall()
+            conn = self.db_configs.get_conn()
+            notifications = operators.get_notifications(conn, flask.session['username'], limit, offset)
             
             # Get total count for checking if more exist
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM notifications 
-                WHERE destination = ?
-            """, (flask.session['username'],))
-            total_count = cursor.fetchone()[0]
-            
-            notifications = [
-                {
-                    'id': row[0],
-                    'author': row[1],
-                    'message': row[2],
-                    'date': row[3],
-                    'read': row[4],
-                    'type': row[5],
-                    'reference_id': row[6]
-                } for row in notifications_raw
-            ]
+            total_count = operators.count_notifications(conn, flask.session['username'])
             
             return flask.jsonify({
                 'notifications': notifications,
@@ -1536,12 +1663,7 @@ class WebApp():
                 if not username:
                     return flask.jsonify({'error': 'User not authenticated properly', 'notifications': []}), 401
 
-                cursor = self.db_configs.conn.cursor()
-                cursor.execute(""" SELECT * FROM notifications WHERE destination = ? AND read = 0 """, (username,))
-
-                notifications = cursor.fetchall()
-                columns = [column[0] for column in cursor.description]
-                notifications_dict = [dict(zip(columns, row)) for row in notifications]
+                notifications_dict = operators.get_unread_notifications(self.db_configs.get_conn(), username)
 
                 return flask.jsonify({'notifications': notifications_dict})
             except Exception as e:
@@ -1560,13 +1682,13 @@ class WebApp():
             if not notification_id:
                 return flask.jsonify({'error': 'Missing notification id'}), 400
             
-            cursor = self.db_configs.conn.cursor()
+            cursor = self.db_configs.get_conn().cursor()
             cursor.execute("""
                 UPDATE notifications 
                 SET read = 1 
                 WHERE id = ? AND destination = ?
             """, (notification_id, flask.session['username']))
-            self.db_configs.conn.commit()
+            self.db_configs.get_conn().commit()
             
             if cursor.rowcount == 0:
                 return flask.jsonify({'error': 'No notification found with given id'}), 404
@@ -1578,7 +1700,7 @@ class WebApp():
         def keyword_search():
             searchbox = flask.request.form.get("text")
 
-            return search_engine.keyword_search_in_db(conn=self.db_configs.conn, keyword=searchbox)
+            return search_engine.keyword_search_in_db(conn=self.db_configs.get_conn(), keyword=searchbox)
             
         @app.route("/realtime_search", methods=["POST"])
         @security.login_required
@@ -1586,23 +1708,58 @@ class WebApp():
             # Get search parameters from the request
             search_params = flask.request.form.to_dict()
             
-            # Get the offset for pagination
+            # Pagination: an opaque cursor from the previous page, or an offset
             offset = int(search_params.get('offset', 0))
             limit = int(search_params.get('limit', 10))
             
-            # Perform the search
-            entries_list = search_engine.realtime_filter_entries(
-                self.db_configs.conn, 
-                search_params,
-                offset=offset,
-                limit=limit
-            )
+            # Relevance-ranked searches page by offset, chronological ones seek by (date, id)
+            rank = search_params.get('sort') == 'relevance'
+            
+            # A newer search from the same session aborts this one mid-query
+            session_key = flask.session.setdefault('search_session', secrets.token_urlsafe(8))
+            generation = self.search_generations.start(session_key)
+            superseded = lambda: not self.search_generations.is_current(session_key, generation)
             
-            # Count total results for pagination
-            total_count = search_engine.count_matching_entries(
-                self.db_configs.conn,
-                search_params
-            )
+            # Perform the search, fetching one extra row to know if there is a next page
+            try:
+                with query_guard.interruptible(self.db_configs.get_conn(), superseded):
+                    try:
+                        after, total_count = None, None
+                        if search_params.get('cursor'):
+                            after, cursor_offset, total_count = search_engine.decode_cursor(search_params['cursor'])
+                            offset = cursor_offset or 0
+                        entries_list = search_engine.realtime_filter_entries(
+                            self.db_configs.get_conn(), 
+                            search_params,
+                            offset=offset,
+                            limit=limit + 1,
+                            after=None if rank else after,
+                            cache=self.search_cache
+                        )
+                    except ValueError as e:
+                        return flask.jsonify({'error': str(e)}), 400
+                    has_more = len(entries_list) > limit
+                    entries_list = entries_list[:limit]
+            
+                    # Count total results and facets once per query; later pages carry the count in the cursor
+                    facets = None
+                    if total_count is None and search_params.get('with_count', '1') != '0':
+                        if search_params.get('with_facets', '1') != '0':
+                            total_count, facets = search_engine.facet_counts(
+                                self.db_configs.get_conn(),
+                                search_params,
+                                cache=self.search_cache
+                            )
+                        else:
+                            total_count = search_engine.count_matching_entries(
+                                self.db_configs.get_conn(),
+                                search_params,
+                                cache=self.search_cache
+                            )
+            except query_guard.QueryCancelled:
+                return flask.jsonify({'cancelled': True}), 409
+            finally:
+                self.search_generations.finish(session_key, generation)
             
             # Format entries for display
             entries_dict_list = []
@@ -1617,11 +1774,21 @@ class WebApp():
                     'id': entry[9]
                 })
             
+            next_cursor = None
+            if has_more and rank:
+                next_cursor = search_engine.encode_cursor(total_count=total_count, offset=offset + limit)
+            elif has_more:
+                next_cursor = search_engine.encode_cursor((entries_list[-1][4], entries_list[-1][9]), total_count)
+            
             # Return the results as JSON
             return flask.jsonify({
                 'entries': entries_dict_list,
                 'total_count': total_count,
-                'has_more': total_count > (offset + limit)
+                'has_more': has_more,
+                'next_cursor': next_cursor,
+                'facets': facets,
+                # rows were cut off at the route's row budget, so the search must be narrowed
+                'partial': self.results_truncated()
             })
 
         @app.route('/forgot_password', methods=['GET', 'POST'])
@@ -1641,7 +1808,7 @@ class WebApp():
             identifier = flask.request.form.get('identifier', '')
             
             # Look up user by username or email
-            cursor = self.db_configs.conn.cursor()
+            cursor = self.db_configs.get_conn().cursor()
             cursor.execute("SELECT id, username, email FROM users WHERE username=? OR email=?", 
                           (identifier, identifier))
             user = cursor.fetchone()
@@ -1669,7 +1836,7 @@ class WebApp():
                 """)
                 cursor.execute("INSERT INTO password_reset_tokens VALUES (?, ?, ?, 0)", 
                               (token, user_id, expiry_str))
-                self.db_configs.conn.commit()
+                self.db_configs.get_conn().commit()
                 
                 # Send email with reset link
                 reset_link = f"{self.host_url}/reset_password/{token}"
@@ -1699,9 +1866,8 @@ class WebApp():
         @app.route('/reset_password/<string:token>', methods=['GET', 'POST'])
         # @self.logger
         def reset_password(token):
-            print(f"Resetting password for token: {token}")
             # Verify token
-            cursor = self.db_configs.conn.cursor()
+            cursor = self.db_configs.get_conn().cursor()
             cursor.execute("""
                 SELECT user_id, expiry, used FROM password_reset_tokens 
                 WHERE token = ?
@@ -1739,7 +1905,7 @@ class WebApp():
                 # Mark token as used
                 cursor.execute("UPDATE password_reset_tokens SET used = 1 WHERE token = ?", 
                               (token,))
-                self.db_configs.conn.commit()
+                self.db_configs.get_conn().commit()
                 
                 flask.flash('Your password has been updated successfully')
                 return flask.redirect(flask.url_for('login'))
@@ -1749,5 +1915,11 @@ class WebApp():
         # Check if we're in testing mode
         if not self.app.config.get('TESTING', False):
             # Only start the waitress server if not in testing mode
-            t = Thread(target=waitress.serve, args=([self.app]), kwargs={'host':self.ip, 'port':self.port, 'threads':self.num_threads})
+            # created here rather than by waitress.serve so /metrics can read its task queue
+            self.server = waitress.create_server(self.app, host=self.ip, port=self.port, threads=self.num_threads)
+            self.server.print_listen("Serving on http://{}:{}")
+            # moves old months of the logs table into the archive database
+            self.log_retention.start()
+            self.jobs.start()
+            t = Thread(target=self.server.run)
             t.start()        
\ No newline at end of file
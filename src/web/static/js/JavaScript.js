@@ -215,7 +215,7 @@ $(document).ready(function(){
               var data = "";
               $.each(res, function(index, value){
                   data += "<a class='search dropdown-item' onclick='put_text(`text_search_datalist`, `text_search`, `"+value['excerpt']+"`)'>";
-                  data += value['excerpt']+"</a>";
+                  data += value['highlight']+"</a>";
               });
               data += "</ul>";
               $("#text_search_datalist").html(data);
@@ -326,7 +326,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Real-time search functionality
     let searchTimeout;
     const searchDelay = 300; // milliseconds
-    let currentOffset = 0;
+    let nextCursor = null;
+    // The in-flight search, aborted when a newer keystroke supersedes it
+    let searchController = null;
     
     // Function to perform real-time search
     function performRealTimeSearch() {
@@ -338,9 +340,6 @@ document.addEventListener('DOMContentLoaded', function() {
       
       const formData = new FormData(searchForm);
       
-      // Add offset for pagination
-      formData.append('offset', currentOffset);
-      
       // Show loading indicator
       const resultsContainer = document.getElementById('resultsContainer');
       if (resultsContainer) {
@@ -361,22 +360,46 @@ document.addEventListener('DOMContentLoaded', function() {
       }
       
       // Reset pagination
-      currentOffset = 0;
+      nextCursor = null;
+      
+      // Drop the previous search; the server also stops its query
+      if (searchController) {
+        searchController.abort();
+      }
+      searchController = new AbortController();
       
       // Send AJAX request
       fetch('/realtime_search', {
         method: 'POST',
-        body: formData
+        body: formData,
+        signal: searchController.signal
       })
       .then(response => response.json())
       .then(data => {
+        if (data.cancelled) {
+          return;
+        }
+        if (data.error) {
+          const resultsContainer = document.getElementById('resultsContainer');
+          if (resultsContainer) {
+            const alert = document.createElement('div');
+            alert.className = 'alert alert-warning m-3';
+            alert.textContent = data.error;
+            resultsContainer.replaceChildren(alert);
+          }
+          return;
+        }
+        
         // Update results container
         updateResultsTable(data.entries);
+        updateFacets(data.facets);
+        showTruncated(data.partial);
+        nextCursor = data.next_cursor;
         
         // Update pagination
         const loadMoreContainer = document.getElementById('loadMoreContainer');
         if (loadMoreContainer) {
-          if (data.has_more) {
+          if (data.next_cursor) {
             loadMoreContainer.style.display = 'block';
           } else {
             loadMoreContainer.style.display = 'none';
@@ -384,6 +407,9 @@ document.addEventListener('DOMContentLoaded', function() {
         }
       })
       .catch(error => {
+        if (error.name === 'AbortError') {
+          return;
+        }
         console.error('Error performing real-time search:', error);
         const resultsContainer = document.getElementById('resultsContainer');
         if (resultsContainer) {
@@ -396,6 +422,66 @@ document.addEventListener('DOMContentLoaded', function() {
       });
     }
     
+    // Function to show or hide the notice that results were cut off at the row budget
+    function showTruncated(partial) {
+      const truncatedNotice = document.getElementById('truncatedNotice');
+      if (truncatedNotice) {
+        truncatedNotice.style.display = partial ? 'block' : 'none';
+      }
+    }
+    
+    // Function to show the facet counts of the matching entries
+    function updateFacets(facets) {
+      const facetsContainer = document.getElementById('facetsContainer');
+      if (!facetsContainer) {
+        return;
+      }
+      facetsContainer.replaceChildren();
+      if (!facets) {
+        facetsContainer.style.display = 'none';
+        return;
+      }
+      
+      // Clicking an author or tag adds it to the matching search field
+      const groups = [
+        ['Authors', facets.authors, document.getElementById('author_search')],
+        ['Tags', facets.tags, document.getElementById('tags_search')],
+        ['Categories', facets.categories, null],
+        ['Months', facets.months, null]
+      ];
+      groups.forEach(([label, values, input]) => {
+        if (!values || values.length === 0) {
+          return;
+        }
+        const row = document.createElement('div');
+        row.className = 'mb-1';
+        const title = document.createElement('span');
+        title.className = 'fw-bold me-2';
+        title.textContent = label + ':';
+        row.appendChild(title);
+        values.forEach(facet => {
+          const badge = document.createElement(input ? 'a' : 'span');
+          badge.className = 'badge bg-light text-dark border me-1';
+          badge.textContent = `${facet.value} (${facet.count})`;
+          if (input) {
+            badge.href = '#';
+            badge.addEventListener('click', function(e) {
+              e.preventDefault();
+              const parts = input.value.split(',').map(part => part.trim()).filter(part => part !== '');
+              if (!parts.includes(facet.value)) {
+                parts.push(facet.value);
+              }
+              input.value = parts.join(', ');
+              performRealTimeSearch();
+            });
+          }
+          row.appendChild(badge);
+        });
+        facetsContainer.appendChild(row);
+      });
+      facetsContainer.style.display = facetsContainer.children.length > 0 ? 'block' : 'none';
+    }
+    
     // Function to update results table
     function updateResultsTable(entries) {
       if (entries.length === 0) {
@@ -557,14 +643,23 @@ document.addEventListener('DOMContentLoaded', function() {
     // Load more results functionality
     const loadMoreResults = document.getElementById('loadMoreResults');
     if (loadMoreResults) {
+      const hideLoadMore = function() {
+        const loadMoreContainer = document.getElementById('loadMoreContainer');
+        if (loadMoreContainer) {
+          loadMoreContainer.style.display = 'none';
+        }
+      };
+      
       loadMoreResults.addEventListener('click', function() {
         const button = this;
+        // The last page has no cursor: there is nothing more to request
+        if (!nextCursor) {
+          hideLoadMore();
+          return;
+        }
         button.disabled = true;
         button.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Loading...';
         
-        // Increment offset for pagination
-        currentOffset += 10;
-        
         // Get form data
         const searchForm = document.getElementById('searchForm');
         if (!searchForm) {
@@ -574,7 +669,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         const formData = new FormData(searchForm);
-        formData.append('offset', currentOffset);
+        formData.append('cursor', nextCursor);
         formData.append('limit', 10);
         
         // Send AJAX request
@@ -584,6 +679,30 @@ document.addEventListener('DOMContentLoaded', function() {
         })
         .then(response => response.json())
         .then(data => {
+          if (data.cancelled) {
+            button.disabled = false;
+            button.innerHTML = '<i class="bi bi-arrow-down-circle me-1"></i> Show More Results';
+            return;
+          }
+          if (data.error) {
+            // Show the error below the results and stop paging instead of retrying the same cursor
+            const resultsContainer = document.getElementById('resultsContainer');
+            if (resultsContainer) {
+              const alert = document.createElement('div');
+              alert.className = 'alert alert-warning m-3';
+              alert.textContent = data.error;
+              resultsContainer.appendChild(alert);
+            }
+            nextCursor = null;
+            button.innerHTML = '<i class="bi bi-arrow-down-circle me-1"></i> Show More Results';
+            hideLoadMore();
+            return;
+          }
+          nextCursor = data.next_cursor;
+          if (data.partial) {
+            showTruncated(true);
+          }
+          
           // Get table body
           const tbody = document.querySelector('.table tbody');
           
@@ -620,12 +739,9 @@ document.addEventListener('DOMContentLoaded', function() {
           button.disabled = false;
           button.innerHTML = '<i class="bi bi-arrow-down-circle me-1"></i> Show More Results';
           
-          // Hide button if no more results
-          if (!data.has_more) {
-            const loadMoreContainer = document.getElementById('loadMoreContainer');
-            if (loadMoreContainer) {
-              loadMoreContainer.style.display = 'none';
-            }
+          // Hide button after the last page
+          if (!nextCursor) {
+            hideLoadMore();
           }
           
           // Re-apply sorting if a column is already sorted
@@ -30,11 +30,14 @@ from src.utils import utils
 @pytest.fixture
 def db_config():
     """Create a test database configuration with an in-memory SQLite database."""
+    from connection_pool import ConnectionPool
+
     class TestConfig:
         def __init__(self):
-            self.conn = sqlite3.connect(':memory:')
-            self.conn.row_factory = sqlite3.Row
             self.db_file = ':memory:'
+            # the same pool database_configs uses; in memory every caller shares its one connection
+            self.pool = ConnectionPool(self.db_file)
+            self.pool.thread_conn().row_factory = sqlite3.Row
             # Add table_lists attribute to match what init_db expects
             self.table_lists = [
                 """ CREATE TABLE IF NOT EXISTS entries (
@@ -92,6 +95,28 @@ def db_config():
                                         type text NOT NULL,
                                         reference_id integer
                                     ); """,
+                """ CREATE TABLE IF NOT EXISTS conditions_templates (
+                                        author text NOT NULL,
+                                        template_name text NOT NULL,
+                                        conditions text NOT NULL,
+                                        id integer primary key autoincrement
+                                    ); """,
+                """ CREATE TABLE IF NOT EXISTS messages (
+                                        id integer primary key autoincrement,
+                                        author text NOT NULL,
+                                        message text NOT NULL,
+                                        date text NOT NULL,
+                                        destination text NOT NULL,
+                                        read integer DEFAULT 0
+                                    ); """,
+                """ CREATE TABLE IF NOT EXISTS logs (
+                                        username text NOT NULL,
+                                        action text NOT NULL,
+                                        date text NOT NULL,
+                                        status text NOT NULL,
+                                        error text,
+                                        id integer primary key autoincrement
+                                    ); """,
                 """ CREATE TABLE IF NOT EXISTS password_resets (
                                         username TEXT NOT NULL,
                                         token TEXT PRIMARY KEY,
@@ -99,6 +124,9 @@ def db_config():
                                         used INTEGER DEFAULT 0
                                     ); """
             ]
+
+        def get_conn(self):
+            return self.pool.thread_conn()
     
     config = TestConfig()
     
@@ -108,7 +136,7 @@ def db_config():
     yield config
     
     # Clean up
-    config.conn.close()
+    config.pool.close_all()
 
 @pytest.fixture
 def temp_dir():
@@ -117,6 +145,31 @@ def temp_dir():
     yield temp_dir
     shutil.rmtree(temp_dir)
 
+@pytest.fixture
+def file_db_configs(temp_dir):
+    """Return a factory of db_configs stand-ins backed by a WAL database file in temp_dir.
+
+    ``file_db_configs(name, setup)`` opens ``name`` through a ConnectionPool and
+    runs ``setup(conn)`` once; the pools are closed after the test.
+    """
+    from connection_pool import ConnectionPool
+    pools = []
+
+    class FileConfigs:
+        def __init__(self, name, setup):
+            self.pool = ConnectionPool(os.path.join(temp_dir, name))
+            pools.append(self.pool)
+            conn = self.pool.thread_conn()
+            setup(conn)
+            conn.commit()
+
+        def get_conn(self):
+            return self.pool.thread_conn()
+
+    yield FileConfigs
+    for pool in pools:
+        pool.close_all()
+
 @pytest.fixture
 def app_client():
     """Create a test Flask client for API testing."""
@@ -149,7 +202,7 @@ def app_client():
     webapp.app.config['WTF_CSRF_ENABLED'] = False
     webapp.app.config['SECRET_KEY'] = 'test-key'
     webapp.app.config['db_configs'] = db_configs  # Store db_configs in app.config for tests
-    webapp.app.config['conn'] = db_configs.conn  # Store conn directly in app.config for tests
+    webapp.app.config['conn'] = db_configs.get_conn()  # Store conn directly in app.config for tests
     webapp.app.config['SERVER_NAME'] = 'localhost'  # Required for url_for to work in tests
     webapp.app.config['USERNAME'] = 'admin'  # Set default username for tests
     
@@ -165,7 +218,7 @@ def app_client():
     
     # Add a test admin user
     operators.add_user(
-        db_configs.conn, 
+        db_configs.get_conn(), 
         'admin', 
         'admin123', 
         1, 
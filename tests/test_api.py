@@ -71,16 +71,16 @@ class TestUserManagementEndpoints:
         
         # Set row factory to sqlite3.Row
         db_configs = app_client.application.config['db_configs']
-        old_row_factory = db_configs.conn.row_factory
-        db_configs.conn.row_factory = sqlite3.Row
+        old_row_factory = db_configs.get_conn().row_factory
+        db_configs.get_conn().row_factory = sqlite3.Row
         
         # Add a new user directly to the database to avoid form validation issues
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute(
             'INSERT INTO users (username, password, admin, order_manager, name, email) VALUES (?, ?, ?, ?, ?, ?)',
             ('newuser', 'password123', 0, 0, 'New User', 'newuser@example.com')
         )
-        db_configs.conn.commit()
+        db_configs.get_conn().commit()
         
         # Verify the user was added
         cursor.execute('SELECT * FROM users WHERE username = ?', ('newuser',))
@@ -100,7 +100,7 @@ class TestUserManagementEndpoints:
         # Create a test user directly in the database
         with app_client.application.app_context():
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             cursor = conn.cursor()
             
             # Check if the user already exists and delete it if it does
@@ -148,7 +148,7 @@ class TestUserManagementEndpoints:
         # Clean up - delete the test user
         with app_client.application.app_context():
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             cursor = conn.cursor()
             cursor.execute("DELETE FROM users WHERE username = ?", ('test_update_user',))
             conn.commit()
@@ -161,7 +161,7 @@ class TestUserManagementEndpoints:
         # Add a user to delete
         db_configs = app_client.application.config['db_configs']
         operators.add_user(
-            db_configs.conn,
+            db_configs.get_conn(),
             'deleteuser',
             'password123',
             0,
@@ -171,7 +171,7 @@ class TestUserManagementEndpoints:
         )
         
         # Get the user ID
-        user = operators.get_user_by_username(db_configs.conn, 'deleteuser')
+        user = operators.get_user_by_username(db_configs.get_conn(), 'deleteuser')
         user_id = user['id']
         
         # Delete the user
@@ -181,7 +181,7 @@ class TestUserManagementEndpoints:
         assert response.status_code == 200
         
         # Verify the user was deleted
-        deleted_user = operators.get_user_by_id(db_configs.conn, user_id)
+        deleted_user = operators.get_user_by_id(db_configs.get_conn(), user_id)
         assert deleted_user is None
     
     def test_user_management_endpoint(self, app_client):
@@ -226,15 +226,15 @@ class TestEntryEndpoints:
         
         # Set row factory to sqlite3.Row
         db_configs = app_client.application.config['db_configs']
-        old_row_factory = db_configs.conn.row_factory
-        db_configs.conn.row_factory = sqlite3.Row
+        old_row_factory = db_configs.get_conn().row_factory
+        db_configs.get_conn().row_factory = sqlite3.Row
         
         # Create a temporary file for testing
         temp_file = BytesIO(b'Test file content')
         temp_file.name = 'test_file.txt'
         
         # Add a new entry directly to the database
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute(
             'INSERT INTO entries (id_hash, author, date, tags, file_path, extra_txt, conditions, entry_name, entry_parent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
             (
@@ -249,7 +249,7 @@ class TestEntryEndpoints:
                 None
             )
         )
-        db_configs.conn.commit()
+        db_configs.get_conn().commit()
         
         # Verify entry was added to database
         cursor.execute('SELECT * FROM entries WHERE entry_name = ?', ('Test Entry',))
@@ -275,7 +275,31 @@ class TestEntryEndpoints:
             assert entry['conditions'] == 'Test conditions'
         
         # Restore original row factory
-        db_configs.conn.row_factory = old_row_factory
+        db_configs.get_conn().row_factory = old_row_factory
+
+
+    def test_search_results_stay_server_side(self, app_client):
+        """Test that /entries keeps results out of the session and /load_more_entries pages them."""
+        app_client.login()
+        db_configs = app_client.application.config['db_configs']
+        for i in range(12):
+            operators.insert_entry_to_db(db_configs.get_conn(), 'admin', '2023-09-01', 'stored', '', '', '',
+                                         f'Stored entry {i}', None)
+
+        response = app_client.post('/entries', data={'Tags': 'stored'})
+        assert response.status_code == 200
+        with app_client.session_transaction() as session:
+            assert 'search_results' not in session
+            assert 'search_cursor' in session
+
+        data = app_client.get('/load_more_entries?offset=10').get_json()
+        assert len(data['entries']) == 2
+        assert data['has_more'] is False
+
+        with app_client.session_transaction() as session:
+            session['search_cursor'] = 'expired'
+        data = app_client.get('/load_more_entries?offset=10').get_json()
+        assert data['entries'] == [] and data['expired'] is True
 
 
 class TestOrderEndpoints:
@@ -303,8 +327,8 @@ class TestOrderEndpoints:
         
         # Set row factory to sqlite3.Row
         db_configs = app_client.application.config['db_configs']
-        old_row_factory = db_configs.conn.row_factory
-        db_configs.conn.row_factory = sqlite3.Row
+        old_row_factory = db_configs.get_conn().row_factory
+        db_configs.get_conn().row_factory = sqlite3.Row
         
         # Add an order directly to the database
         order_data = {
@@ -318,7 +342,7 @@ class TestOrderEndpoints:
             'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
         
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute(
             'INSERT INTO orders (order_name, link, quantity, note, order_assignee, order_author, status, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
             (
@@ -332,7 +356,7 @@ class TestOrderEndpoints:
                 order_data['date']
             )
         )
-        db_configs.conn.commit()
+        db_configs.get_conn().commit()
         
         # Verify order was added to database
         cursor.execute('SELECT * FROM orders WHERE order_name = ?', ('Test API Order',))
@@ -344,7 +368,7 @@ class TestOrderEndpoints:
         assert order['order_assignee'] == 'admin'
         
         # Restore original row factory
-        db_configs.conn.row_factory = old_row_factory
+        db_configs.get_conn().row_factory = old_row_factory
     
     def test_update_order_status_endpoint(self, app_client):
         """Test updating an order status through the API."""
@@ -353,11 +377,11 @@ class TestOrderEndpoints:
         
         # Set row factory to sqlite3.Row
         db_configs = app_client.application.config['db_configs']
-        old_row_factory = db_configs.conn.row_factory
-        db_configs.conn.row_factory = sqlite3.Row
+        old_row_factory = db_configs.get_conn().row_factory
+        db_configs.get_conn().row_factory = sqlite3.Row
         
         # Create a test order directly in the database
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute(
             'INSERT INTO orders (order_name, link, quantity, note, order_assignee, order_author, status, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
             (
@@ -371,7 +395,7 @@ class TestOrderEndpoints:
                 datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             )
         )
-        db_configs.conn.commit()
+        db_configs.get_conn().commit()
         
         # Get the order ID
         cursor.execute('SELECT id FROM orders WHERE order_name = ?', ('Order for Status Update',))
@@ -381,7 +405,7 @@ class TestOrderEndpoints:
         
         # Update the order status directly in the database
         cursor.execute('UPDATE orders SET status = ? WHERE id = ?', ('in_progress', order_id))
-        db_configs.conn.commit()
+        db_configs.get_conn().commit()
         
         # Verify order status was updated
         cursor.execute('SELECT status FROM orders WHERE id = ?', (order_id,))
@@ -389,7 +413,7 @@ class TestOrderEndpoints:
         assert updated_order['status'] == 'in_progress'
         
         # Restore original row factory
-        db_configs.conn.row_factory = old_row_factory
+        db_configs.get_conn().row_factory = old_row_factory
 
 
 class TestNotificationEndpoints:
@@ -404,7 +428,7 @@ class TestNotificationEndpoints:
         with app_client.application.app_context():
             # Get the database connection from db_configs
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             
             # Check the schema of the notifications table
             columns = check_table_schema(conn, 'notifications')
@@ -444,7 +468,7 @@ class TestNotificationEndpoints:
         with app_client.application.app_context():
             # Get the database connection from db_configs
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             
             # Check the schema of the notifications table
             columns = check_table_schema(conn, 'notifications')
@@ -477,7 +501,7 @@ class TestNotificationEndpoints:
         # Verify the notification is marked as read
         with app_client.application.app_context():
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             cursor = conn.cursor()
             cursor.execute("SELECT read FROM notifications WHERE id = ?", (notification_id,))
             read_status = cursor.fetchone()[0]
@@ -494,11 +518,11 @@ class TestSearchEndpoints:
         
         # Set row factory to sqlite3.Row
         db_configs = app_client.application.config['db_configs']
-        old_row_factory = db_configs.conn.row_factory
-        db_configs.conn.row_factory = sqlite3.Row
+        old_row_factory = db_configs.get_conn().row_factory
+        db_configs.get_conn().row_factory = sqlite3.Row
         
         # Add a test entry to search for directly to the database
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute(
             'INSERT INTO entries (id_hash, author, date, tags, file_path, extra_txt, conditions, entry_name, entry_parent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
             (
@@ -513,7 +537,7 @@ class TestSearchEndpoints:
                 None
             )
         )
-        db_configs.conn.commit()
+        db_configs.get_conn().commit()
         
         # Verify the entry was added
         cursor.execute('SELECT * FROM entries WHERE entry_name = ?', ('Searchable Entry',))
@@ -521,7 +545,7 @@ class TestSearchEndpoints:
         assert entry is not None, "Entry was not created properly"
         
         # Restore original row factory
-        db_configs.conn.row_factory = old_row_factory
+        db_configs.get_conn().row_factory = old_row_factory
     
     def test_author_search_endpoint(self, app_client):
         """Test the author search endpoint."""
@@ -530,11 +554,11 @@ class TestSearchEndpoints:
         
         # Set row factory to sqlite3.Row
         db_configs = app_client.application.config['db_configs']
-        old_row_factory = db_configs.conn.row_factory
-        db_configs.conn.row_factory = sqlite3.Row
+        old_row_factory = db_configs.get_conn().row_factory
+        db_configs.get_conn().row_factory = sqlite3.Row
         
         # Add a test entry with a specific author directly to the database
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute(
             'INSERT INTO entries (id_hash, author, date, tags, file_path, extra_txt, conditions, entry_name, entry_parent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
             (
@@ -549,7 +573,7 @@ class TestSearchEndpoints:
                 None
             )
         )
-        db_configs.conn.commit()
+        db_configs.get_conn().commit()
         
         # Verify the entry was added
         cursor.execute('SELECT * FROM entries WHERE author = ?', ('Unique Author Name',))
@@ -557,7 +581,96 @@ class TestSearchEndpoints:
         assert entry is not None, "Entry was not created properly"
         
         # Restore original row factory
-        db_configs.conn.row_factory = old_row_factory
+        db_configs.get_conn().row_factory = old_row_factory
+
+
+    def test_realtime_search_param_range(self, app_client):
+        """Test range predicates on PARAM values in /realtime_search."""
+        app_client.login()
+        db_configs = app_client.application.config['db_configs']
+        for entry_name, temperature in [('Incubated cold', '4'), ('Incubated warm', '37')]:
+            operators.insert_entry_to_db(db_configs.get_conn(), 'admin', '2023-07-01', '', '', '',
+                                         f'&Incubation&Time&Temperature&{temperature}', entry_name, None)
+
+        response = app_client.post('/realtime_search', data={'Params': 'Temperature >= 30'})
+        assert response.status_code == 200
+        assert [entry['title'] for entry in response.get_json()['entries']] == ['Incubated warm']
+
+        response = app_client.post('/realtime_search', data={'Params': 'Temperature is warm'})
+        assert response.status_code == 400
+        assert 'Invalid parameter filter' in response.get_json()['error']
+
+
+    def test_realtime_search_cursor_pagination(self, app_client):
+        """Test that /realtime_search pages with next_cursor and counts only once."""
+        app_client.login()
+        db_configs = app_client.application.config['db_configs']
+        for i in range(5):
+            operators.insert_entry_to_db(db_configs.get_conn(), 'admin', f'2023-08-0{i + 1}', 'paged', '', '', '',
+                                         f'Paged entry {i}', None)
+
+        first = app_client.post('/realtime_search', data={'Tags': 'paged', 'limit': 2}).get_json()
+        assert [entry['title'] for entry in first['entries']] == ['Paged entry 4', 'Paged entry 3']
+        assert first['total_count'] == 5 and first['has_more']
+
+        titles = []
+        cursor = first['next_cursor']
+        while cursor:
+            page = app_client.post('/realtime_search', data={'Tags': 'paged', 'limit': 2, 'cursor': cursor}).get_json()
+            assert page['total_count'] == 5
+            titles.extend(entry['title'] for entry in page['entries'])
+            cursor = page['next_cursor']
+        assert titles == ['Paged entry 2', 'Paged entry 1', 'Paged entry 0']
+
+        response = app_client.post('/realtime_search', data={'cursor': 'garbage'})
+        assert response.status_code == 400
+
+    def test_autocomplete_endpoints(self, app_client):
+        """Test that the autocomplete endpoints see tags and users added after the first search."""
+        app_client.login()
+        db_configs = app_client.application.config['db_configs']
+
+        assert app_client.post('/tags_search', data={'text': 'dendr'}).get_json() == []
+        operators.insert_tag(db_configs.get_conn(), ['dendrite'])
+        response = app_client.post('/tags_search', data={'text': 'axon, dendr'})
+        assert [row['tag'] for row in response.get_json()] == ['dendrite']
+
+        operators.add_user(db_configs.get_conn(), 'ramon_cajal', 'password', 0, 0, 'Ramon', 'cajal@example.com')
+        assert app_client.post('/username_search', data={'text': 'cajal'}).get_json() == [['ramon_cajal']]
+
+    def test_realtime_search_facets(self, app_client):
+        """Test that the first page of /realtime_search carries facet counts."""
+        app_client.login()
+        db_configs = app_client.application.config['db_configs']
+        for day in ['01', '02', '03']:
+            operators.insert_entry_to_db(db_configs.get_conn(), 'admin', f'2023-05-{day}', 'facetted', '', '', '',
+                                         f'Facet entry {day}', None)
+
+        data = app_client.post('/realtime_search', data={'Tags': 'facetted', 'limit': 2}).get_json()
+        assert data['total_count'] == 3
+        assert data['facets']['tags'] == [{'value': 'facetted', 'count': 3}]
+        assert data['facets']['months'] == [{'value': '2023-05', 'count': 3}]
+
+        data = app_client.post('/realtime_search', data={'Tags': 'facetted', 'limit': 2, 'cursor': data['next_cursor']}).get_json()
+        assert data['facets'] is None and data['total_count'] == 3
+
+    def test_superseded_realtime_search_is_cancelled(self, app_client, mocker):
+        """Test that a search overtaken by a newer one from the same session stops and answers 409."""
+        import query_guard
+        import search_engine as flat_search_engine
+
+        app_client.login()
+
+        def superseded_search(conn, *args, **kwargs):
+            # a newer keystroke from the same session arrives while this query runs
+            mocker.patch.object(query_guard.SearchGenerations, 'is_current', return_value=False)
+            conn.execute('WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) '
+                         'SELECT COUNT(*) FROM counter').fetchone()
+        mocker.patch.object(flat_search_engine, 'realtime_filter_entries', side_effect=superseded_search)
+
+        response = app_client.post('/realtime_search', data={'Keyword': 'anything'})
+        assert response.status_code == 409
+        assert response.get_json() == {'cancelled': True}
 
 
 class TestPasswordResetEndpoints:
@@ -606,11 +719,171 @@ class TestPasswordResetEndpoints:
         # Clean up - delete the test user directly from the database
         with app_client.application.app_context():
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             cursor = conn.cursor()
             cursor.execute("DELETE FROM users WHERE username = ?", ('password_reset_test',))
             conn.commit()
 
+
+class TestMonitoringEndpoints:
+    """Test cases for the query budgets, tracing, metrics and audit log."""
+
+    def test_query_budgets(self, app_client, mocker):
+        """Test that over-budget searches are cut off or stopped and flagged."""
+        import query_guard
+        import search_engine as flat_search_engine
+
+        app_client.login()
+        db_configs = app_client.application.config['db_configs']
+        for day in ['01', '02', '03', '04']:
+            operators.insert_entry_to_db(db_configs.get_conn(), 'admin', f'2023-06-{day}', 'budget', '', '', '',
+                                         f'Budget entry {day}', None)
+
+        mocker.patch.dict(query_guard.ROUTE_BUDGETS, {'realtime_search': (10.0, 2)})
+        response = app_client.post('/realtime_search', data={'Tags': 'budget', 'with_facets': '0'})
+        assert response.status_code == 200
+        assert len(response.get_json()['entries']) == 2
+        assert response.get_json()['partial'] is True
+        assert response.headers['X-Query-Budget-Exceeded'] == 'rows'
+
+        # the entries page says its results were cut off, and only when they were
+        mocker.patch.dict(query_guard.ROUTE_BUDGETS, {'entries': (10.0, 2)})
+        response = app_client.post('/entries', data={'Tags': 'budget'})
+        assert b'id="truncatedNotice" >' in response.data
+        mocker.patch.dict(query_guard.ROUTE_BUDGETS, {'entries': (10.0, 100), 'realtime_search': (10.0, 100)})
+        assert b'id="truncatedNotice" style="display: none;"' in app_client.post('/entries', data={'Tags': 'budget'}).data
+        assert app_client.post('/realtime_search', data={'Tags': 'budget', 'with_facets': '0'}).get_json()['partial'] is False
+
+        mocker.patch.dict(query_guard.ROUTE_BUDGETS, {'realtime_search': (0.05, 100)})
+        def endless_search(conn, *args, **kwargs):
+            conn.execute('WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) '
+                         'SELECT COUNT(*) FROM counter').fetchone()
+        mocker.patch.object(flat_search_engine, 'realtime_filter_entries', side_effect=endless_search)
+        response = app_client.post('/realtime_search', data={'Tags': 'budget'})
+        assert response.status_code == 503
+        assert response.get_json()['timeout'] is True
+        assert query_guard.overruns[-1]['endpoint'] == 'realtime_search' and query_guard.overruns[-1]['kind'] == 'time'
+
+    def test_sql_trace_page(self, app_client):
+        """Test that requests are traced and listed on the admin SQL trace page."""
+        import sql_trace
+
+        app_client.login()
+        app_client.post('/realtime_search', data={'Keyword': 'traced'})
+        assert sql_trace.recent_requests[-1]['endpoint'] == 'realtime_search'
+        assert sql_trace.recent_requests[-1]['queries'] >= 1
+
+        response = app_client.get('/sql_trace')
+        assert response.status_code == 200
+        assert b'SQL Trace' in response.data and b'realtime_search' in response.data
+
+    def test_metrics_endpoint(self, app_client, monkeypatch):
+        """Test the Prometheus /metrics endpoint and its token check."""
+        app_client.login()
+        app_client.post('/realtime_search', data={'Keyword': 'metrics'})
+        app_client.post('/realtime_search', data={'Keyword': 'metrics'})
+
+        response = app_client.get('/metrics')
+        assert response.status_code == 200 and response.mimetype == 'text/plain'
+        text = response.get_data(as_text=True)
+        assert 'http_request_duration_seconds_count{endpoint="realtime_search"}' in text
+        assert 'sql_request_duration_seconds_count{endpoint="realtime_search"}' in text
+        assert 'http_requests_in_flight 1' in text
+        assert 'search_cache_hits_total' in text and 'search_cache_hit_ratio' in text
+
+        monkeypatch.setenv('METRICS_TOKEN', 'scrape-secret')
+        assert app_client.get('/metrics').status_code == 401
+        assert app_client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+
+    def test_logged_route_writes_audit_row(self, app_client):
+        """Test that a route wrapped by WebApp.logger leaves a logs row."""
+        app_client.login()
+        app_client.post('/chatroom_send_message/Group Chat', data={'message': 'audited'})
+
+        db_configs = app_client.application.config['db_configs']
+        row = db_configs.get_conn().execute("SELECT username, status FROM logs WHERE action = 'chatroom_send_message'").fetchone()
+        assert tuple(row) == ('admin', 'pass')
+
+    def test_log_explorer(self, app_client):
+        """Test the filtered, keyset-paged logs API, its counts and the logs page."""
+        app_client.login()
+        db_configs = app_client.application.config['db_configs']
+        db_configs.get_conn().executemany('INSERT INTO logs (username, action, date, status) VALUES (?, ?, ?, ?)',
+                                    [('carol', 'entries', f'2024-05-{day:02d} 10:00:00', 'fail' if day % 3 == 0 else 'pass')
+                                     for day in range(1, 11)])
+        db_configs.get_conn().commit()
+
+        seen = []
+        response = app_client.get('/api/logs?username=carol&limit=4')
+        while True:
+            data = response.get_json()
+            seen.extend(log['date'][:10] for log in data['logs'])
+            if data['next'] is None:
+                break
+            response = app_client.get(f"/api/logs?username=carol&limit=4&after={data['next']}")
+        assert seen == [f'2024-05-{day:02d}' for day in range(10, 0, -1)]
+
+        data = app_client.get('/api/logs?username=carol&status=fail&start=2024-05-04&end=2024-05-09&order=asc').get_json()
+        assert [log['date'][:10] for log in data['logs']] == ['2024-05-06', '2024-05-09']
+
+        data = app_client.get('/api/logs/counts?username=carol&bucket=month').get_json()
+        assert data['counts'] == [{'bucket': '2024-05', 'action': 'entries', 'status': 'fail', 'count': 3},
+                                  {'bucket': '2024-05', 'action': 'entries', 'status': 'pass', 'count': 7}]
+        assert app_client.get('/api/logs?sort=error').status_code == 400
+        assert app_client.get('/api/logs?after=not-a-cursor').status_code == 400
+        import log_explorer
+        for tampered in ([{'a': 1}, []], ['2024-05-01', 'x'], ['2024-05-01', True]):
+            assert app_client.get(f'/api/logs?after={log_explorer.encode_cursor(tampered)}').status_code == 400
+
+        response = app_client.get('/logs?username=carol&bucket=day&limit=5')
+        assert response.status_code == 200
+        assert b'2024-05-10 10:00:00' in response.data and b'2024-05-05 10:00:00' not in response.data
+        assert b'Next page' in response.data
+
+
+class TestJobEndpoints:
+    """Test cases for the work moved onto background jobs."""
+
+    def test_backup_runs_as_background_job(self, app_client, mocker):
+        """Test that /backup enqueues a job whose status and download are served separately."""
+        app_client.login()
+        database_folder = app_client.application.config['DATABASE_FOLDER']
+        def write_backup(app_config, pool, name):
+            with open(os.path.join(database_folder, f'{name}.zip'), 'wb') as f:
+                f.write(b'zip')
+            return True, os.path.join(database_folder, f'{name}.zip')
+        backup_db = mocker.patch('utils.backup_db', side_effect=write_backup)
+
+        response = app_client.post('/backup', data={'request_token': 'form-1'})
+        assert response.status_code == 302 and '/backup?job=' in response.headers['Location']
+        job_id = int(response.headers['Location'].split('job=')[1])
+        # a double submit of the same form returns the same job
+        assert app_client.post('/backup', data={'request_token': 'form-1'}).headers['Location'] == response.headers['Location']
+        assert backup_db.call_count == 1
+
+        job = app_client.get(f'/api/jobs/{job_id}').get_json()
+        assert job['kind'] == 'backup' and job['status'] == 'done' and job['progress'] == 1.0
+        # each job zips into its own file and its download serves that file
+        assert job['result'] == {'file': f'DataManager_backup_{job_id}.zip'}
+        assert b'Download backup' in app_client.get(f'/backup?job={job_id}').data
+        response = app_client.get(f'/backup/download/{job_id}')
+        assert response.status_code == 200 and response.headers['Content-Disposition'].startswith('attachment')
+        assert f'DataManager_backup_{job_id}.zip' in response.headers['Content-Disposition'] and response.data == b'zip'
+        response.close()
+        os.remove(os.path.join(database_folder, f'DataManager_backup_{job_id}.zip'))
+        assert [job['id'] for job in app_client.get('/api/jobs').get_json()['jobs']] == [job_id]
+        assert app_client.get('/api/jobs/999').status_code == 404
+
+    def test_failed_backup_is_not_returned_to_a_resubmit(self, app_client, mocker):
+        """Test that submitting again after a failed backup starts a new job."""
+        app_client.login()
+        backup_db = mocker.patch('utils.backup_db', return_value=(False, 'DataManager_backup'))
+
+        first = app_client.post('/backup', data={'request_token': 'form-2'}).headers['Location']
+        assert app_client.get(f"/api/jobs/{first.split('job=')[1]}").get_json()['status'] == 'failed'
+        assert app_client.post('/backup', data={'request_token': 'form-2'}).headers['Location'] != first
+        assert backup_db.call_count == 2
+
 def check_table_schema(conn, table_name):
     """Check the schema of a table."""
     cursor = conn.cursor()
@@ -618,4 +891,4 @@ def check_table_schema(conn, table_name):
     columns = cursor.fetchall()
     column_names = [column[1] for column in columns]
     print(f"Schema for table {table_name}: {column_names}")
-    return column_names 
\ No newline at end of file
+    return column_names
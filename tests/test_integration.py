@@ -23,7 +23,7 @@ class TestUserWorkflows:
         user_management_response = app_client.get('/user_management')
         assert user_management_response.status_code == 200
         # delete the user if it exists
-        operators.delete_user(db_configs.conn, 'workflow_user')
+        operators.delete_user(db_configs.get_conn(), 'workflow_user')
         # Add a new user
         add_user_response = app_client.post('/add_user_to_db', data={
             'username': 'workflow_user',
@@ -39,10 +39,10 @@ class TestUserWorkflows:
         assert add_user_response.status_code == 200
         html = add_user_response.data.decode('utf-8')
         # check that the user was added to the database
-        user = operators.get_user_by_username(db_configs.conn, 'workflow_user')
+        user = operators.get_user_by_username(db_configs.get_conn(), 'workflow_user')
         assert user is not None
         
-        user = operators.get_user_by_username(db_configs.conn, 'workflow_user')
+        user = operators.get_user_by_username(db_configs.get_conn(), 'workflow_user')
         user_id = user['id']
         
         # Update the user
@@ -98,7 +98,7 @@ class TestUserWorkflows:
 
         # check if the entry was added to the database
         assert add_entry_response.status_code == 200
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute('SELECT * FROM entries WHERE entry_name = ?', ('Workflow Test Entry',))
         entry = cursor.fetchone()
         columns = [column[0] for column in cursor.description]
@@ -121,7 +121,7 @@ class TestUserWorkflows:
     
         # Get the entry ID
         db_configs = app_client.application.config['db_configs']
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute('SELECT id FROM entries WHERE entry_name = ?', ('Workflow Test Entry',))
         entry = cursor.fetchone()
         columns = [column[0] for column in cursor.description]
@@ -182,7 +182,7 @@ class TestUserWorkflows:
 
         # check if the order was added to the databse
         db_configs = app_client.application.config['db_configs']
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute('SELECT * FROM orders WHERE order_name = ?', ('Workflow Test Order',))
         order = cursor.fetchone()
         columns = [column[0] for column in cursor.description]
@@ -198,7 +198,7 @@ class TestUserWorkflows:
         
         # Get the order ID
         db_configs = app_client.application.config['db_configs']
-        cursor = db_configs.conn.cursor()
+        cursor = db_configs.get_conn().cursor()
         cursor.execute('SELECT * FROM orders WHERE order_name = ?', ('Workflow Test Order',))
         order = cursor.fetchone()
         columns = [column[0] for column in cursor.description]
@@ -226,7 +226,7 @@ class TestUserWorkflows:
         assert result['success'] is True
         
         # Verify status was updated in database
-        updated_order = operators.get_order_by_id(db_configs.conn, order_id)
+        updated_order = operators.get_order_by_id(db_configs.get_conn(), order_id)
         assert updated_order['status'] == 'pending'
         
         # Update the order details
@@ -246,7 +246,7 @@ class TestUserWorkflows:
         assert result['success'] is True
         
         # Verify updates in database
-        updated_order = operators.get_order_by_id(db_configs.conn, order_id)
+        updated_order = operators.get_order_by_id(db_configs.get_conn(), order_id)
         assert updated_order['order_name'] == 'Updated Workflow Order'
         assert updated_order['note'] == 'Updated description for workflow order'
         assert updated_order['order_assignee'] == 'admin'
@@ -266,7 +266,7 @@ class TestUserWorkflows:
         assert result['success'] is True
         
         # Verify status in database
-        completed_order = operators.get_order_by_id(db_configs.conn, order_id)
+        completed_order = operators.get_order_by_id(db_configs.get_conn(), order_id)
         assert completed_order['status'] == 'ordered'
         
         # Delete the order
@@ -280,7 +280,7 @@ class TestUserWorkflows:
         assert result['success'] is True
         
         # Verify order was deleted from database
-        deleted_order = operators.get_order_by_id(db_configs.conn, order_id)
+        deleted_order = operators.get_order_by_id(db_configs.get_conn(), order_id)
         assert deleted_order is None
     
     def test_notification_workflow(self, app_client):
@@ -291,7 +291,7 @@ class TestUserWorkflows:
         # Add a test notification via database
         db_configs = app_client.application.config['db_configs']
         operators.add_notification(
-            db_configs.conn,
+            db_configs.get_conn(),
             'admin',
             'Workflow test notification',
             'admin',
@@ -300,7 +300,7 @@ class TestUserWorkflows:
         )
 
         # check if the notification was added to the database
-        notifications = operators.get_notifications(db_configs.conn, 'admin')
+        notifications = operators.get_notifications(db_configs.get_conn(), 'admin')
         print(notifications)
         assert len(notifications) == 1
         assert notifications[0]['message'] == 'Workflow test notification'
@@ -312,7 +312,7 @@ class TestUserWorkflows:
         assert 'Workflow test notification' in html
         
         # Get the notification ID
-        notifications = operators.get_notifications(db_configs.conn, 'admin')
+        notifications = operators.get_notifications(db_configs.get_conn(), 'admin')
         notification_id = next(n['id'] for n in notifications if n['message'] == 'Workflow test notification')
         
         # Mark notification as read
@@ -326,6 +326,6 @@ class TestUserWorkflows:
         assert result['success'] is True
         
         # Verify in database
-        updated_notifications = operators.get_notifications(db_configs.conn, 'admin')
+        updated_notifications = operators.get_notifications(db_configs.get_conn(), 'admin')
         updated_notification = next(n for n in updated_notifications if n['id'] == notification_id)
         assert updated_notification['read'] == 1
\ No newline at end of file
@@ -20,7 +20,7 @@ class TestUserOperations:
         """Test adding a user to the database."""
         # Add a test user
         result = operators.add_user(
-            db_config.conn,
+            db_config.get_conn(),
             'testuser',
             'password123',
             0,
@@ -33,7 +33,7 @@ class TestUserOperations:
         assert result is True
         
         # Verify user exists in database
-        cursor = db_config.conn.cursor()
+        cursor = db_config.get_conn().cursor()
         cursor.execute('SELECT * FROM users WHERE username = ?', ('testuser',))
         user = cursor.fetchone()
         
@@ -52,7 +52,7 @@ class TestUserOperations:
         """Test retrieving a user by username."""
         # Add a test user
         operators.add_user(
-            db_config.conn,
+            db_config.get_conn(),
             'testuser2',
             'password123',
             0,
@@ -62,7 +62,7 @@ class TestUserOperations:
         )
         
         # Retrieve the user
-        user = operators.get_user_by_username(db_config.conn, 'testuser2')
+        user = operators.get_user_by_username(db_config.get_conn(), 'testuser2')
         
         # Verify user data
         assert user is not None
@@ -74,7 +74,7 @@ class TestUserOperations:
         """Test updating user information."""
         # Add a test user
         operators.add_user(
-            db_config.conn,
+            db_config.get_conn(),
             'testuser3',
             'password123',
             0,
@@ -84,7 +84,7 @@ class TestUserOperations:
         )
         
         # Get user ID
-        user = operators.get_user_by_username(db_config.conn, 'testuser3')
+        user = operators.get_user_by_username(db_config.get_conn(), 'testuser3')
         user_id = user['id']
         
         # Update user information
@@ -95,11 +95,11 @@ class TestUserOperations:
             'order_manager': 1
         }
         
-        result = operators.update_user(db_config.conn, form_data, user_id)
+        result = operators.update_user(db_config.get_conn(), form_data, user_id)
         assert result is True
         
         # Verify user was updated
-        updated_user = operators.get_user_by_id(db_config.conn, user_id)
+        updated_user = operators.get_user_by_id(db_config.get_conn(), user_id)
         assert updated_user['name'] == 'Updated Name'
         assert updated_user['email'] == 'updated@example.com'
         assert updated_user['admin'] == 1
@@ -109,7 +109,7 @@ class TestUserOperations:
         """Test deleting a user."""
         # Add a test user
         operators.add_user(
-            db_config.conn,
+            db_config.get_conn(),
             'testuser4',
             'password123',
             0,
@@ -119,14 +119,14 @@ class TestUserOperations:
         )
         
         # Get user ID
-        user = operators.get_user_by_username(db_config.conn, 'testuser4')
+        user = operators.get_user_by_username(db_config.get_conn(), 'testuser4')
         user_id = user['id']
         
         # Delete the user
-        operators.delete_user(db_config.conn, user_id)
+        operators.delete_user(db_config.get_conn(), user_id)
         
         # Verify user no longer exists
-        deleted_user = operators.get_user_by_id(db_config.conn, user_id)
+        deleted_user = operators.get_user_by_id(db_config.get_conn(), user_id)
         assert deleted_user is None
 
 
@@ -147,7 +147,7 @@ class TestEntryOperations:
         
         # Insert the entry
         entry_id = operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             author,
             date,
             tags,
@@ -162,7 +162,7 @@ class TestEntryOperations:
         assert entry_id is not None
         
         # Get the entry and verify its data
-        entry = operators.get_entry_by_id(db_config.conn, entry_id)
+        entry = operators.get_entry_by_id(db_config.get_conn(), entry_id)
         assert entry is not None
         assert entry['entry_name'] == entry_name
         assert entry['author'] == author
@@ -175,7 +175,7 @@ class TestEntryOperations:
         """Test updating an entry in the database."""
         # Add a test entry
         entry_id = operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             "Original Author",
             dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "original,tags",
@@ -187,7 +187,7 @@ class TestEntryOperations:
         )
     
         # Get the hash_id
-        hash_id = operators.get_hash_id_by_entry_id(db_config.conn, entry_id)
+        hash_id = operators.get_hash_id_by_entry_id(db_config.get_conn(), entry_id)
     
         # Create update form data with the correct keys
         current_date = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -207,10 +207,10 @@ class TestEntryOperations:
         files = {}
     
         # Update the entry
-        operators.update_entry_in_db(db_config.conn, entry_id[0], post_form, app_config, hash_id, files)
+        operators.update_entry_in_db(db_config.get_conn(), entry_id[0], post_form, app_config, hash_id, files)
     
         # Get the updated entry
-        updated_entry = operators.get_entry_by_id(db_config.conn, entry_id)
+        updated_entry = operators.get_entry_by_id(db_config.get_conn(), entry_id)
     
         # Verify updates
         assert updated_entry['entry_name'] == 'Updated Entry Name'
@@ -223,7 +223,7 @@ class TestEntryOperations:
         """Test deleting an entry from the database."""
         # Add a test entry
         entry_id = operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             "Test Author",
             dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "test,tags",
@@ -235,14 +235,14 @@ class TestEntryOperations:
         )
     
         # Verify entry exists
-        entry = operators.get_entry_by_id(db_config.conn, entry_id)
+        entry = operators.get_entry_by_id(db_config.get_conn(), entry_id)
         assert entry is not None
         
         # Delete the entry
-        operators.delete_entry_from_db(db_config.conn, entry_id[0])
+        operators.delete_entry_from_db(db_config.get_conn(), entry_id[0])
         
         # Verify entry no longer exists
-        deleted_entry = operators.get_entry_by_id(db_config.conn, entry_id)
+        deleted_entry = operators.get_entry_by_id(db_config.get_conn(), entry_id)
         assert deleted_entry is None
 
 
@@ -264,14 +264,14 @@ class TestOrderOperations:
         }
         
         # Submit the order
-        result, order_id = operators.submit_order(db_config.conn, order_data)
+        result, order_id = operators.submit_order(db_config.get_conn(), order_data)
         
         # Verify order was created
         assert result is True
         assert order_id is not None
         
         # Retrieve the order
-        order = operators.get_order_by_id(db_config.conn, order_id)
+        order = operators.get_order_by_id(db_config.get_conn(), order_id)
         
         # Verify order data
         assert order is not None
@@ -297,7 +297,7 @@ class TestOrderOperations:
             'date': dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        result, order_id = operators.submit_order(db_config.conn, order_data)
+        result, order_id = operators.submit_order(db_config.get_conn(), order_data)
         assert result is True
         
         # Update order data
@@ -311,11 +311,11 @@ class TestOrderOperations:
         }
         
         # Update the order
-        result = operators.update_order(db_config.conn, order_id, updated_data)
+        result = operators.update_order(db_config.get_conn(), order_id, updated_data)
         assert result is True
         
         # Verify the order was updated
-        updated_order = operators.get_order_by_id(db_config.conn, order_id)
+        updated_order = operators.get_order_by_id(db_config.get_conn(), order_id)
         assert updated_order is not None
         assert updated_order['order_name'] == 'Updated Order'
         assert updated_order['link'] == 'http://updated.com'
@@ -339,19 +339,19 @@ class TestOrderOperations:
             'date': dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        result, order_id = operators.submit_order(db_config.conn, order_data)
+        result, order_id = operators.submit_order(db_config.get_conn(), order_data)
         assert result is True
         
         # Verify order exists
-        order = operators.get_order_by_id(db_config.conn, order_id)
+        order = operators.get_order_by_id(db_config.get_conn(), order_id)
         assert order is not None
         
         # Delete the order
-        result = operators.delete_order(db_config.conn, order_id)
+        result = operators.delete_order(db_config.get_conn(), order_id)
         assert result is True
         
         # Verify order no longer exists
-        deleted_order = operators.get_order_by_id(db_config.conn, order_id)
+        deleted_order = operators.get_order_by_id(db_config.get_conn(), order_id)
         assert deleted_order is None
 
 
@@ -368,7 +368,7 @@ class TestNotificationOperations:
         reference_id = 123
         
         operators.add_notification(
-            db_config.conn,
+            db_config.get_conn(),
             author,
             message,
             recipient,
@@ -377,7 +377,7 @@ class TestNotificationOperations:
         )
         
         # Retrieve notifications for the recipient
-        notifications = operators.get_notifications(db_config.conn, recipient)
+        notifications = operators.get_notifications(db_config.get_conn(), recipient)
         
         # Verify notification was added
         assert len(notifications) > 0
@@ -393,7 +393,7 @@ class TestNotificationOperations:
         """Test marking a notification as read."""
         # Add a notification
         operators.add_notification(
-            db_config.conn,
+            db_config.get_conn(),
             "admin",
             "Another test notification",
             "testuser",
@@ -401,7 +401,7 @@ class TestNotificationOperations:
         )
         
         # Get the notification
-        notifications = operators.get_notifications(db_config.conn, "testuser")
+        notifications = operators.get_notifications(db_config.get_conn(), "testuser")
         print(notifications)
         notification_id = notifications[0]['id']
         
@@ -409,10 +409,10 @@ class TestNotificationOperations:
         assert notifications[0]['read'] == 0
         
         # Mark as read
-        operators.mark_notification_read(db_config.conn, notification_id)
+        operators.mark_notification_read(db_config.get_conn(), notification_id)
         
         # Verify it's now read
-        updated_notifications = operators.get_notifications(db_config.conn, "testuser")
+        updated_notifications = operators.get_notifications(db_config.get_conn(), "testuser")
         updated_notification = next(n for n in updated_notifications if n['id'] == notification_id)
         assert updated_notification['read'] == 1
     
@@ -420,7 +420,7 @@ class TestNotificationOperations:
         """Test counting unread notifications."""
         # Add multiple notifications
         operators.add_notification(
-            db_config.conn,
+            db_config.get_conn(),
             "admin",
             "Notification 1",
             "testuser2",
@@ -428,7 +428,7 @@ class TestNotificationOperations:
         )
         
         operators.add_notification(
-            db_config.conn,
+            db_config.get_conn(),
             "admin",
             "Notification 2",
             "testuser2",
@@ -436,7 +436,7 @@ class TestNotificationOperations:
         )
         
         operators.add_notification(
-            db_config.conn,
+            db_config.get_conn(),
             "admin",
             "Notification 3",
             "testuser2",
@@ -444,15 +444,15 @@ class TestNotificationOperations:
         )
         
         # Get the count of unread notifications
-        count = operators.get_unread_notification_count(db_config.conn, "testuser2")
+        count = operators.get_unread_notification_count(db_config.get_conn(), "testuser2")
         assert count == 3
         
         # Mark one as read
-        notifications = operators.get_notifications(db_config.conn, "testuser2")
-        operators.mark_notification_read(db_config.conn, notifications[0]['id'])
+        notifications = operators.get_notifications(db_config.get_conn(), "testuser2")
+        operators.mark_notification_read(db_config.get_conn(), notifications[0]['id'])
         
         # Check count again
-        updated_count = operators.get_unread_notification_count(db_config.conn, "testuser2")
+        updated_count = operators.get_unread_notification_count(db_config.get_conn(), "testuser2")
         assert updated_count == 2
 
 
@@ -463,7 +463,7 @@ class TestPasswordResetOperations:
         """Test creating and retrieving a password reset token."""
         # Create a test user
         operators.add_user(
-            db_config.conn,
+            db_config.get_conn(),
             'resetuser',
             'password123',
             0,
@@ -477,10 +477,10 @@ class TestPasswordResetOperations:
         expiry = (dt.datetime.now() + dt.timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
         
         # Add the token
-        operators.create_password_reset_token(db_config.conn, 'resetuser', token, expiry)
+        operators.create_password_reset_token(db_config.get_conn(), 'resetuser', token, expiry)
         
         # Retrieve the token
-        token_data = operators.get_password_reset_token(db_config.conn, token)
+        token_data = operators.get_password_reset_token(db_config.get_conn(), token)
         
         # Verify token data
         assert token_data is not None
@@ -488,10 +488,10 @@ class TestPasswordResetOperations:
         assert token_data['token'] == token
         
         # Delete the token
-        operators.delete_password_reset_token(db_config.conn, token)
+        operators.delete_password_reset_token(db_config.get_conn(), token)
         
         # Verify token is gone
-        deleted_token = operators.get_password_reset_token(db_config.conn, token)
+        deleted_token = operators.get_password_reset_token(db_config.get_conn(), token)
         assert deleted_token is None
 
 
@@ -519,4 +519,128 @@ class TestPasswordHashingFunctions:
         another_hash = operators.hash_password(another_password)
         
         # Verify hashes are different
-        assert hashed_password != another_hash 
\ No newline at end of file
+        assert hashed_password != another_hash 
+
+class TestConnectionPool:
+    """Test cases for the SQLite connection pool."""
+
+    def test_threads_get_separate_wal_connections(self, temp_dir):
+        """Test that each thread gets its own connection to a WAL database."""
+        import threading
+        from src.database.connection_pool import ConnectionPool
+
+        pool = ConnectionPool(os.path.join(temp_dir, 'pool.db'), busy_timeout=2000)
+        try:
+            main_conn = pool.thread_conn()
+            assert pool.thread_conn() is main_conn
+            assert main_conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            assert main_conn.execute('PRAGMA busy_timeout').fetchone()[0] == 2000
+
+            other = []
+            thread = threading.Thread(target=lambda: other.append(pool.thread_conn()))
+            thread.start()
+            thread.join()
+            assert other[0] is not main_conn
+        finally:
+            pool.close_all()
+
+    def test_release_discards_uncommitted_work(self, temp_dir):
+        """Test that a released connection does not leak a half-done transaction."""
+        from src.database.connection_pool import ConnectionPool
+
+        pool = ConnectionPool(os.path.join(temp_dir, 'pool.db'))
+        try:
+            conn = pool.acquire()
+            conn.execute('CREATE TABLE items (name text)')
+            conn.commit()
+            conn.execute("INSERT INTO items VALUES ('half-done')")
+            pool.release(conn)
+
+            reused = pool.acquire()
+            assert reused is conn
+            assert reused.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+        finally:
+            pool.close_all()
+
+    def test_memory_database_is_shared(self):
+        """Test that an in-memory database hands out a single shared connection."""
+        from src.database.connection_pool import ConnectionPool
+
+        pool = ConnectionPool(':memory:')
+        assert pool.acquire() is pool.thread_conn()
+        pool.close_all()
+
+    def test_backup_and_restore_include_the_wal(self, temp_dir):
+        """Test that a backup holds transactions still in the WAL and a restore drops the old WAL."""
+        import sqlite3
+        from src.database.connection_pool import ConnectionPool
+
+        pool = ConnectionPool(os.path.join(temp_dir, 'pool.db'))
+        backup_file = os.path.join(temp_dir, 'backup.db')
+        try:
+            conn = pool.thread_conn()
+            conn.execute('PRAGMA wal_autocheckpoint = 0')
+            conn.execute('CREATE TABLE items (name text)')
+            conn.execute("INSERT INTO items VALUES ('kept')")
+            conn.commit()
+            assert os.path.getsize(pool.db_file + '-wal') > 0
+
+            pool.backup(backup_file)
+            with sqlite3.connect(backup_file) as copy:
+                assert copy.execute('SELECT name FROM items').fetchall() == [('kept',)]
+
+            conn.execute("INSERT INTO items VALUES ('after backup')")
+            conn.commit()
+            idle = pool.acquire()
+            pool.release(idle)
+            pool.restore(backup_file)
+            assert not os.path.exists(pool.db_file + '-wal')
+            assert pool.acquire() is not idle
+            assert pool.thread_conn().execute('SELECT name FROM items').fetchall() == [('kept',)]
+        finally:
+            pool.close_all()
+
+    def test_restore_waits_for_checked_out_connections(self, temp_dir):
+        """Test that a restore waits until other requests hand back their connections."""
+        import threading
+        from src.database.connection_pool import ConnectionPool
+
+        pool = ConnectionPool(os.path.join(temp_dir, 'pool.db'), restore_timeout=5)
+        backup_file = os.path.join(temp_dir, 'backup.db')
+        try:
+            conn = pool.thread_conn()
+            conn.execute('CREATE TABLE items (name text)')
+            conn.execute("INSERT INTO items VALUES ('kept')")
+            conn.commit()
+            pool.backup(backup_file)
+
+            held = pool.acquire()
+            restore = threading.Thread(target=pool.restore, args=(backup_file,))
+            restore.start()
+            restore.join(0.2)
+            # the restore has not closed the connection a request still holds
+            assert restore.is_alive()
+            assert held.execute('SELECT count(*) FROM items').fetchone() == (1,)
+            pool.release(held)
+            restore.join(5)
+            assert not restore.is_alive()
+            assert pool.thread_conn().execute('SELECT name FROM items').fetchall() == [('kept',)]
+
+            pool.restore_timeout = 0.1
+            held = pool.acquire()
+            errors = []
+
+            def restore_in_other_request():
+                try:
+                    pool.restore(backup_file)
+                except TimeoutError as e:
+                    errors.append(e)
+
+            restore = threading.Thread(target=restore_in_other_request)
+            restore.start()
+            restore.join(5)
+            assert len(errors) == 1
+            assert held.execute('SELECT count(*) FROM items').fetchone() == (1,)
+            pool.release(held)
+        finally:
+            pool.close_all()
@@ -9,8 +9,14 @@ import tempfile
 import shutil
 
 # Import search engine modules
-from src.utils import search_engine
-from src.database import operators
+from src.utils import search_engine, search_query
+from src.database import operators, full_text
+
+
+def insert_entry(db_config, entry_name, tags='', notes='notes', conditions='', date='2023-05-01'):
+    """Insert an entry by 'search-author' and return what insert_entry_to_db returns."""
+    return operators.insert_entry_to_db(db_config.get_conn(), 'search-author', date, tags, '', notes, conditions,
+                                        entry_name, None)
 
 
 class TestBasicSearchFunctionality:
@@ -20,7 +26,7 @@ class TestBasicSearchFunctionality:
         """Test searching entries by text content."""
         # Add test entries with different content
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Author 1',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'test,search,apple',
@@ -32,7 +38,7 @@ class TestBasicSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Author 2',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'test,search,banana',
@@ -44,7 +50,7 @@ class TestBasicSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Author 3',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'test,search,orange',
@@ -60,7 +66,7 @@ class TestBasicSearchFunctionality:
         import flask
         app = flask.Flask(__name__)
         with app.test_request_context():
-            response = search_engine.text_search_in_db(db_config.conn, 'apple')
+            response = search_engine.text_search_in_db(db_config.get_conn(), 'apple')
             # The response is a jsonify object, so we need to get the data
             results = response.get_json()
             
@@ -75,7 +81,7 @@ class TestBasicSearchFunctionality:
         """Test searching entries by author."""
         # Add test entries with different authors
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Unique Author X',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'test,author',
@@ -87,7 +93,7 @@ class TestBasicSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Unique Author Y',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'test,author',
@@ -99,7 +105,7 @@ class TestBasicSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Unique Author Z',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'test,author',
@@ -114,8 +120,10 @@ class TestBasicSearchFunctionality:
         # Use the Flask test_client to call the API endpoint
         import flask
         app = flask.Flask(__name__)
+        from src.utils import autocomplete
+        service = autocomplete.AutocompleteService(db_config)
         with app.test_request_context():
-            response = search_engine.author_search_in_db(db_config.conn, 'Unique Author X')
+            response = search_engine.autocomplete_search(service, 'authors', 'Unique Author X', 'author')
             # Get results from the response
             results = response.get_json()
             
@@ -130,7 +138,7 @@ class TestBasicSearchFunctionality:
         """Test searching entries by tags."""
         # Add test entries with different tags
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Tags Test Author 1',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'red,blue,green',
@@ -142,7 +150,7 @@ class TestBasicSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Tags Test Author 2',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'orange,purple,pink',
@@ -154,7 +162,7 @@ class TestBasicSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Tags Test Author 3',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'red,yellow,green,purple',
@@ -169,8 +177,10 @@ class TestBasicSearchFunctionality:
         # Use the Flask test_client to call the API endpoint
         import flask
         app = flask.Flask(__name__)
+        from src.utils import autocomplete
+        service = autocomplete.AutocompleteService(db_config)
         with app.test_request_context():
-            response = search_engine.tags_search_in_db(db_config.conn, 'red')
+            response = search_engine.autocomplete_search(service, 'tags', 'red', 'tag')
             # Get results from the response
             results = response.get_json()
             
@@ -189,7 +199,7 @@ class TestAdvancedSearchFunctionality:
         """Test searching entries with combined criteria using filter_entries."""
         # Add test entries
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Combined Author A',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'combined,test,alpha',
@@ -201,7 +211,7 @@ class TestAdvancedSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Combined Author B',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'combined,test,beta',
@@ -213,7 +223,7 @@ class TestAdvancedSearchFunctionality:
         )
         
         operators.insert_entry_to_db(
-            db_config.conn,
+            db_config.get_conn(),
             'Combined Author C',
             datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
             'combined,test,gamma',
@@ -242,7 +252,7 @@ class TestAdvancedSearchFunctionality:
         app = flask.Flask(__name__)
         with app.test_request_context():
             # Use filter_entries which returns a list of results
-            results = search_engine.filter_entries(db_config.conn, search_form)
+            results = search_engine.filter_entries(db_config.get_conn(), search_form)
             
             # Skip further assertions if search doesn't work as expected
             if results is not None and isinstance(results, list):
@@ -257,8 +267,7 @@ class TestSearchEngine:
         """Test initializing the search engine functions."""
         # Test that the search engine module has the required functions
         assert hasattr(search_engine, 'text_search_in_db')
-        assert hasattr(search_engine, 'author_search_in_db')
-        assert hasattr(search_engine, 'tags_search_in_db')
+        assert hasattr(search_engine, 'autocomplete_search')
         assert hasattr(search_engine, 'filter_entries')
         assert hasattr(search_engine, 'realtime_filter_entries')
     
@@ -267,7 +276,7 @@ class TestSearchEngine:
         # Set up some test data
         for i in range(15):
             operators.insert_entry_to_db(
-                db_config.conn,
+                db_config.get_conn(),
                 'pagination-author',  # Author
                 '2023-05-01',  # date
                 f'tag{i}',  # Tags
@@ -289,7 +298,7 @@ class TestSearchEngine:
         
         # Get first page (limit 5)
         results_page1 = search_engine.realtime_filter_entries(
-            db_config.conn,
+            db_config.get_conn(),
             search_params,
             offset=0,
             limit=5
@@ -297,7 +306,7 @@ class TestSearchEngine:
         
         # Get second page (limit 5)
         results_page2 = search_engine.realtime_filter_entries(
-            db_config.conn,
+            db_config.get_conn(),
             search_params,
             offset=5,
             limit=5
@@ -309,7 +318,7 @@ class TestSearchEngine:
         
         # Check total count
         total_count = search_engine.count_matching_entries(
-            db_config.conn,
+            db_config.get_conn(),
             search_params
         )
         assert total_count == 15
@@ -371,4 +380,507 @@ class TestLLMSearchFunctionality:
             
             # Follow the redirect
             response = app_client.get(redirect_location)
-            assert response.status_code == 200 
\ No newline at end of file
+            assert response.status_code == 200 
+
+class TestFullTextIndex:
+    """Test cases for the FTS5 index behind the entry searches."""
+
+    def test_index_follows_inserts_updates_and_deletes(self, db_config):
+        """Test that the triggers keep entries_fts in sync with entries."""
+        insert_entry(db_config, 'Western blot', 'EGFP,protein', 'membrane was blocked overnight')
+        insert_entry(db_config, 'Cell culture', 'HEK293', 'cells passaged at 80 percent')
+
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Keyword': 'overnight'})
+        assert [entry['entry_name'] for entry in results] == ['Western blot']
+
+        # Substring matches still work, as they did with LIKE
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Keyword': 'GFP'})
+        assert [entry['entry_name'] for entry in results] == ['Western blot']
+
+        cursor = db_config.get_conn().cursor()
+        cursor.execute("UPDATE entries SET extra_txt='stained overnight' WHERE entry_name='Cell culture'")
+        cursor.execute("DELETE FROM entries WHERE entry_name='Western blot'")
+        db_config.get_conn().commit()
+
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Keyword': 'overnight'})
+        assert [entry['entry_name'] for entry in results] == ['Cell culture']
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Text': 'membrane'}) == 0
+
+    def test_short_terms_fall_back_to_like(self, db_config):
+        """Test that terms shorter than a trigram still match."""
+        insert_entry(db_config, 'Ai9 cross', 'mouse', 'notes')
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Title': 'i9'}) == 1
+
+    def test_searches_use_the_index(self, db_config):
+        """Test that keyword searches are answered from entries_fts."""
+        where, params = full_text.match_clause('blot', full_text.KEYWORD_COLUMNS)
+        cursor = db_config.get_conn().cursor()
+        cursor.execute(f'EXPLAIN QUERY PLAN SELECT * FROM entries WHERE {where}', params)
+        plan = ' '.join(row[3] for row in cursor.fetchall())
+        assert 'entries_fts VIRTUAL TABLE' in plan
+
+    def test_rebuild_backfills_existing_entries(self, db_config):
+        """Test that a rebuild indexes rows written while the index was missing."""
+        cursor = db_config.get_conn().cursor()
+        cursor.execute("INSERT INTO entries_fts(entries_fts) VALUES ('delete-all')")
+        db_config.get_conn().commit()
+        insert_entry(db_config, 'Plasmid prep', 'DNA', 'miniprep kit')
+        cursor.execute("INSERT INTO entries_fts(entries_fts) VALUES ('delete-all')")
+        db_config.get_conn().commit()
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Keyword': 'miniprep'}) == 0
+
+        full_text.rebuild_fts(db_config.get_conn())
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Keyword': 'miniprep'}) == 1
+
+
+class TestEntryTags:
+    """Test cases for exact tag filtering through entry_tags."""
+
+    def test_tag_filter_is_exact(self, db_config):
+        """Test that a tag no longer matches tags that merely contain it."""
+        insert_entry(db_config, 'Reporter', 'EGFP, mouse')
+        insert_entry(db_config, 'Antibody', 'GFP')
+
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Tags': 'GFP'})
+        assert [entry['entry_name'] for entry in results] == ['Antibody']
+
+    def test_tag_filter_ignores_case(self, db_config):
+        """Test that a tag matches whatever case it was written in, like the former LIKE filter."""
+        insert_entry(db_config, 'Lower', 'protein')
+        insert_entry(db_config, 'Capitalized', 'Protein, mouse')
+        insert_entry(db_config, 'Other', 'proteins')
+
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Tags': 'PROTEIN'})
+        assert sorted(entry['entry_name'] for entry in results) == ['Capitalized', 'Lower']
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Tags': 'protein,MOUSE'}) == 1
+
+    def test_multiple_tags_are_intersected(self, db_config):
+        """Test that every requested tag must be present."""
+        insert_entry(db_config, 'Both', 'mouse,brain')
+        insert_entry(db_config, 'Mouse only', 'mouse')
+        insert_entry(db_config, 'Brain only', 'brain')
+
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Tags': 'mouse,brain'}) == 1
+        results = search_engine.filter_entries(db_config.get_conn(), {'Tags': 'brain, mouse'})
+        assert [entry['entry_name'] for entry in results] == ['Both']
+
+    def test_update_and_delete_keep_entry_tags_in_sync(self, db_config, temp_dir):
+        """Test that updating or deleting an entry rewrites its entry_tags rows."""
+        _, hash_id = insert_entry(db_config, 'Retagged', 'old')
+        entry_id = operators.get_id_by_hash_id(db_config.get_conn(), hash_id)
+
+        post_form = {'date': '2023-05-02', 'Tags': 'new', 'File_Path': '', 'Notes': '',
+                     'entry_name': 'Retagged', 'parent_entry': ''}
+        operators.update_entry_in_db(db_config.get_conn(), entry_id, post_form, {'UPLOAD_FOLDER': temp_dir}, hash_id, [])
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Tags': 'old'}) == 0
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Tags': 'new'}) == 1
+
+        operators.delete_entry_from_db(db_config.get_conn(), entry_id)
+        cursor = db_config.get_conn().cursor()
+        cursor.execute('SELECT COUNT(*) FROM entry_tags WHERE entry_id=?', (entry_id,))
+        assert cursor.fetchone()[0] == 0
+
+    def test_migration_backfills_existing_entries(self, db_config):
+        """Test that entries written before entry_tags existed are backfilled."""
+        import migrate
+
+        cursor = db_config.get_conn().cursor()
+        cursor.execute("INSERT INTO entries (id_hash, tags, date, author, entry_name) "
+                       "VALUES ('LEGACY0001', 'legacy, cells', '2020-01-01', 'old-author', 'Legacy')")
+        cursor.execute("DROP TABLE entry_tags")
+        cursor.execute("DELETE FROM schema_version WHERE version >= 5")
+        db_config.get_conn().commit()
+
+        assert migrate.migrate_database(db_config.get_conn(), db_config.table_lists) is True
+        results = search_engine.filter_entries(db_config.get_conn(), {'Tags': 'legacy,cells'})
+        assert [entry['entry_name'] for entry in results] == ['Legacy']
+
+
+class TestEntryConditions:
+    """Test cases for the structured entry_conditions table."""
+
+    def test_conditions_are_split_into_rows(self, db_config):
+        """Test that plain and PARAM conditions are stored with typed values."""
+        _, hash_id = insert_entry(db_config, 'Slice', conditions='tpl&Species&Mouse Homozygous&Ai9,tpl&Incubation&Time&Temperature&37 C')
+        entry_id = operators.get_id_by_hash_id(db_config.get_conn(), hash_id)
+
+        cursor = db_config.get_conn().cursor()
+        cursor.execute('SELECT template, category, subcategory, item, param_value, param_number '
+                       'FROM entry_conditions WHERE entry_id=? ORDER BY category DESC', (entry_id,))
+        assert [tuple(row) for row in cursor.fetchall()] == [
+            ('tpl', 'Species', 'Mouse Homozygous', 'Ai9', None, None),
+            ('tpl', 'Incubation', 'Time', 'Temperature', '37 C', 37.0),
+        ]
+
+    def test_condition_filter_is_exact(self, db_config):
+        """Test filtering entries by category and item through the index."""
+        insert_entry(db_config, 'Ai9 mouse', conditions='&Species&Mouse Homozygous&Ai9')
+        insert_entry(db_config, 'Ai14 mouse', conditions='&Species&Mouse Homozygous&Ai14')
+
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Conditions': 'Species&Ai9'})
+        assert [entry['entry_name'] for entry in results] == ['Ai9 mouse']
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Conditions': 'Species&Mouse Homozygous&Ai14'}) == 1
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Conditions': 'Species&Ai'}) == 0
+
+    def test_update_and_delete_keep_entry_conditions_in_sync(self, db_config, temp_dir):
+        """Test that updating or deleting an entry rewrites its entry_conditions rows."""
+        _, hash_id = insert_entry(db_config, 'Reconditioned', conditions='&Species&Rat&Wistar')
+        entry_id = operators.get_id_by_hash_id(db_config.get_conn(), hash_id)
+
+        post_form = {'date': '2023-06-02', 'Tags': '', 'File_Path': '', 'Notes': '',
+                     'entry_name': 'Reconditioned', 'parent_entry': '',
+                     'condition&&Species&Mouse Homozygous&Ai9': 'on'}
+        operators.update_entry_in_db(db_config.get_conn(), entry_id, post_form, {'UPLOAD_FOLDER': temp_dir}, hash_id, [])
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Conditions': 'Species&Wistar'}) == 0
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Conditions': 'Species&Ai9'}) == 1
+
+        operators.delete_entry_from_db(db_config.get_conn(), entry_id)
+        cursor = db_config.get_conn().cursor()
+        cursor.execute('SELECT COUNT(*) FROM entry_conditions WHERE entry_id=?', (entry_id,))
+        assert cursor.fetchone()[0] == 0
+
+    def test_migration_backfills_existing_entries(self, db_config):
+        """Test that entries written before entry_conditions existed are backfilled."""
+        import migrate
+
+        cursor = db_config.get_conn().cursor()
+        cursor.execute("INSERT INTO entries (id_hash, conditions, date, author, entry_name) "
+                       "VALUES ('LEGACY0002', 'Species&Mouse Homozygous&Ai9', '2020-01-01', 'old-author', 'Legacy')")
+        cursor.execute("DROP TABLE entry_conditions")
+        cursor.execute("DELETE FROM schema_version WHERE version >= 6")
+        db_config.get_conn().commit()
+
+        assert migrate.migrate_database(db_config.get_conn(), db_config.table_lists) is True
+        results = search_engine.filter_entries(db_config.get_conn(), {'Conditions': 'Species&Ai9'})
+        assert [entry['entry_name'] for entry in results] == ['Legacy']
+
+
+class TestParamRanges:
+    """Test cases for numeric range predicates on PARAM values."""
+
+    def test_parse_param_predicates(self):
+        """Test parsing comma-separated predicates and rejecting malformed ones."""
+        assert search_query.parse_param_predicates('Temperature >= 30, Age<8.5, Dose == 2') == [
+            ('Temperature', '>=', 30.0), ('Age', '<', 8.5), ('Dose', '=', 2.0)
+        ]
+        with pytest.raises(ValueError):
+            search_query.parse_param_predicates('Temperature warm')
+
+    def test_range_is_numeric(self, db_config):
+        """Test that ranges compare numbers, not strings."""
+        insert_entry(db_config, 'Cold', conditions='&Incubation&Time&Temperature&4')
+        insert_entry(db_config, 'Body', conditions='&Incubation&Time&Temperature&37')
+        insert_entry(db_config, 'Hot', conditions='&Incubation&Time&Temperature&100 C')
+
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Params': 'Temperature >= 30'})
+        assert sorted(entry['entry_name'] for entry in results) == ['Body', 'Hot']
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Params': 'Temperature > 5, Temperature < 50'}) == 1
+        results = search_engine.filter_entries(db_config.get_conn(), {'Params': 'Temperature != 37'})
+        assert sorted(entry['entry_name'] for entry in results) == ['Cold', 'Hot']
+
+    def test_range_uses_index(self, db_config):
+        """Test that the predicate is answered from the (item, param_number) index."""
+        import indexes
+
+        where, params = search_query.param_clause([('Temperature', '>=', 30.0)])
+        plan = indexes.explain_query_plan(db_config.get_conn(), f'SELECT * FROM entries WHERE {where}')
+        assert any('idx_entry_conditions_item_number' in detail for detail in plan)
+
+
+class TestKeysetPagination:
+    """Test cases for (date, id) cursor pagination of realtime search."""
+
+    def test_cursor_round_trip(self):
+        """Test that cursors decode to what they encode and reject garbage."""
+        token = search_engine.encode_cursor(('2023-08-01', 42), 7)
+        assert search_engine.decode_cursor(token) == (('2023-08-01', 42), None, 7)
+        assert search_engine.decode_cursor(search_engine.encode_cursor(offset=20)) == (None, 20, None)
+        with pytest.raises(ValueError):
+            search_engine.decode_cursor('not-a-cursor')
+
+    def test_pages_follow_each_other_without_gaps(self, db_config):
+        """Test that seeking after the last row walks every entry once, ties included."""
+        for i in range(7):
+            operators.insert_entry_to_db(db_config.get_conn(), 'page-author', f'2023-08-0{1 + i // 2}',
+                                         '', '', '', '', f'Page {i}', None)
+
+        seen = []
+        after = None
+        while True:
+            page = search_engine.realtime_filter_entries(db_config.get_conn(), {}, limit=3, after=after)
+            seen.extend(entry['entry_name'] for entry in page)
+            if len(page) < 3:
+                break
+            after = (page[-1]['date'], page[-1]['id'])
+
+        assert sorted(seen) == [f'Page {i}' for i in range(7)]
+        assert len(seen) == len(set(seen))
+
+
+class TestSearchQueryCompiler:
+    """Test cases for the shared search AST to SQL compiler."""
+
+    def test_same_shape_compiles_to_same_sql(self):
+        """Test that field order, spacing and duplicates do not change the SQL text."""
+        first = search_query.from_form({'Tags': 'b, a', 'Author': 'x', 'Keyword': 'cells'})
+        second = search_query.from_form({'Keyword': ' neurons ', 'Author': 'y', 'Tags': 'c,d,c,d'})
+        assert first.compile()[0] == second.compile()[0]
+        assert first.key() == search_query.from_form({'Author': 'x', 'Tags': 'a,b', 'Keyword': 'cells'}).key()
+
+    def test_entry_points_agree(self, db_config):
+        """Test that filter, realtime and count apply the same author semantics."""
+        for author in ['Ada Lovelace', 'Alan Turing', 'Grace Hopper']:
+            operators.insert_entry_to_db(db_config.get_conn(), author, '2023-10-01', '', '', '', '', f'By {author}', None)
+
+        form = {'Author': 'Ada Lovelace, Alan Turing'}
+        filtered = {entry['entry_name'] for entry in search_engine.filter_entries(db_config.get_conn(), form)}
+        realtime = {entry['entry_name'] for entry in search_engine.realtime_filter_entries(db_config.get_conn(), form)}
+        assert filtered == realtime == {'By Ada Lovelace', 'By Alan Turing'}
+        assert search_engine.count_matching_entries(db_config.get_conn(), form) == 2
+        # an author is matched exactly, not as a substring
+        assert search_engine.filter_entries(db_config.get_conn(), {'Author': 'Lovelace'}) == []
+        assert search_engine.count_matching_entries(db_config.get_conn(), {'Author': 'Ada'}) == 0
+
+    def test_author_filter_uses_index(self, db_config):
+        """Test that an author search reads the (author, date) index instead of walking every entry."""
+        plan = search_query.from_form({'Author': 'Ada Lovelace, Alan Turing'}).explain(db_config.get_conn(), limit=10)
+        assert any('idx_entries_author_date' in detail for detail in plan)
+
+    def test_llm_search_without_text(self, db_config):
+        """Test that an LLM search with only a date range compiles to valid SQL."""
+        from src.utils import llm_search
+
+        operators.insert_entry_to_db(db_config.get_conn(), 'llm-author', '2023-10-05', '', '', '', '', 'Dated', None)
+        operators.insert_entry_to_db(db_config.get_conn(), 'llm-author', '2022-01-01', '', '', '', '', 'Old', None)
+        rows = llm_search.execute_llm_search(db_config.get_conn(), {'date_start': '2023-01-01'})
+        assert [row['entry_name'] for row in rows] == ['Dated']
+        assert search_query.from_llm({}).compile()[0] == 'SELECT * FROM entries WHERE 1 ORDER BY date DESC, id DESC'
+
+    def test_explain_exposes_the_plan(self, db_config):
+        """Test that the compiled plan of a tag search uses the entry_tags index."""
+        plan = search_query.from_form({'Tags': 'mouse'}).explain(db_config.get_conn(), limit=10)
+        assert any('idx_entry_tags_tag_entry' in detail for detail in plan)
+
+
+class TestRankedSearch:
+    """Test cases for BM25 relevance ranking and database-side snippets."""
+
+    def test_title_outranks_tags_outranks_notes(self, db_config):
+        """Test that relevance ordering follows the per-column weights, not the date."""
+        insert_entry(db_config, 'Slice prep', '', 'stained for calbindin', date='2023-11-03')
+        insert_entry(db_config, 'Slice prep', 'calbindin', '', date='2023-11-01')
+        insert_entry(db_config, 'Calbindin staining', '', '', date='2023-10-01')
+
+        params = {'Keyword': 'calbindin', 'sort': 'relevance'}
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), params)
+        assert [entry['date'] for entry in results] == ['2023-10-01', '2023-11-01', '2023-11-03']
+        results = search_engine.realtime_filter_entries(db_config.get_conn(), {'Keyword': 'calbindin'})
+        assert [entry['date'] for entry in results] == ['2023-11-03', '2023-11-01', '2023-10-01']
+
+    def test_text_search_returns_highlighted_snippets(self, db_config):
+        """Test that the text search cuts and highlights excerpts in SQL and caps the results."""
+        import flask
+
+        insert_entry(db_config, 'Long notes', '', 'x' * 500 + ' perfused with <b>PFA</b> overnight ' + 'y' * 500, date='2023-11-01')
+        for i in range(5):
+            insert_entry(db_config, f'Other {i}', '', 'fixed in PFA', date='2023-11-02')
+
+        with flask.Flask(__name__).app_context():
+            assert len(search_engine.text_search_in_db(db_config.get_conn(), 'PFA', limit=3).get_json()) == 3
+            results = search_engine.text_search_in_db(db_config.get_conn(), 'PFA').get_json()
+            assert len(results) == 6
+            long_note = [result for result in results if len(result['excerpt']) > 20]
+            assert long_note and len(long_note[0]['excerpt']) < 100
+            assert '&lt;b&gt;<mark>PFA</mark>&lt;/b&gt;' in long_note[0]['highlight']
+            assert 'PFA' in long_note[0]['excerpt'] and '<mark>' not in long_note[0]['excerpt']
+
+            short = search_engine.text_search_in_db(db_config.get_conn(), 'in', limit=1).get_json()
+            assert short[0]['highlight'].count('<mark>in</mark>') == 1
+
+
+class TestFuzzyMatching:
+    """Test cases for typo-tolerant suggestions."""
+
+    def test_edit_distance_matches_substrings(self):
+        """Test the bit-parallel distance against known values and its bound."""
+        from src.utils import fuzzy
+
+        assert fuzzy.edit_distance('immunstain', 'gfp immunostaining') == 1
+        assert fuzzy.edit_distance('kitten', 'sitting') == 2
+        assert fuzzy.edit_distance('kitten', 'sitting', bound=1) is None
+
+    def test_suggestions_tolerate_typos(self, db_config):
+        """Test that one typo still finds tags, authors and titles through the autocomplete service."""
+        import flask
+        from src.utils import autocomplete
+
+        operators.insert_entry_to_db(db_config.get_conn(), 'Margaret Hamilton', '2023-12-01', 'calbindin, parvalbumin',
+                                     '', '', '', 'Parvalbumin interneuron survey', None)
+        service = autocomplete.AutocompleteService(db_config)
+
+        assert service.search('tags', 'calbindn') == [('calbindin', 1)]
+        assert [author for author, _ in service.search('authors', 'hamliton')] == ['Margaret Hamilton']
+        assert service.search('tags', 'xyzzy') == []
+        with flask.Flask(__name__).app_context():
+            titles = search_engine.autocomplete_search(service, 'titles', 'intreneuron', 'entry_name').get_json()
+            assert titles == [{'entry_name': 'Parvalbumin interneuron survey'}]
+
+
+class TestAutocomplete:
+    """Test cases for the in-memory autocomplete service."""
+
+    def test_prefix_matches_rank_first(self):
+        """Test that prefixes beat word starts, which beat other infix matches."""
+        from src.utils import autocomplete
+
+        index = autocomplete.AutocompleteIndex([('Calcium imaging', 1), ('imaging', 2), ('Two-photon Imaging setup', 3),
+                                                ('reimaging', 4), ('histology', 5)])
+        assert [value for value, _ in index.search('imag')] == ['imaging', 'Calcium imaging', 'Two-photon Imaging setup', 'reimaging']
+        assert index.search('IMAGING', limit=1) == [('imaging', 2)]
+        assert index.search('histolgy') == [('histology', 5)]
+        assert index.search('  ') == []
+
+    def test_service_reads_database_only_after_invalidation(self, db_config):
+        """Test that repeated searches are served from memory until a write invalidates the source."""
+        # the module operators imports and invalidates
+        import autocomplete
+
+        operators.insert_tag(db_config.get_conn(), ['microglia'])
+        service = autocomplete.AutocompleteService(db_config)
+        assert service.search('tags', 'micro') == [('microglia', 1)]
+
+        statements = []
+        db_config.get_conn().set_trace_callback(statements.append)
+        try:
+            assert service.search('tags', 'glia') == [('microglia', 1)]
+            assert statements == []
+
+            operators.insert_tag(db_config.get_conn(), ['microtubule'])
+            assert [tag for tag, _ in service.search('tags', 'micro')] == ['microglia', 'microtubule']
+        finally:
+            db_config.get_conn().set_trace_callback(None)
+
+    def test_insert_extends_index_without_rebuilding(self, db_config, monkeypatch):
+        """Test that an inserted entry is appended to the titles index and only a rename rebuilds it."""
+        import autocomplete
+
+        _, hash_id = operators.insert_entry_to_db(db_config.get_conn(), 'Ada', '2023-05-01', '', '', '', '',
+                                                  'First slice', None)
+        service = autocomplete.AutocompleteService(db_config)
+        index = service.index('titles')
+        builds = []
+        monkeypatch.setattr(autocomplete, 'AutocompleteIndex', lambda rows: builds.append(rows))
+
+        operators.insert_entry_to_db(db_config.get_conn(), 'Ada', '2023-05-02', '', '', '', '', 'Second slice', None)
+        assert [title for title, _ in service.search('titles', 'slice')] == ['First slice', 'Second slice']
+        assert service.search('titles', 'sec') == [('Second slice', None)]
+        assert service.index('titles') is index
+        assert builds == []
+
+        monkeypatch.undo()
+        entry_id = operators.get_id_by_hash_id(db_config.get_conn(), hash_id)
+        operators.update_entry_title(db_config.get_conn(), entry_id, 'Renamed slice')
+        assert service.index('titles') is not index
+        assert [title for title, _ in service.search('titles', 'slice')] == ['Second slice', 'Renamed slice']
+
+    def test_added_keys_are_found_before_and_after_joining(self):
+        """Test that keys added to a built index match as prefixes, infixes and typos."""
+        from src.utils import autocomplete
+
+        index = autocomplete.AutocompleteIndex([('Calcium imaging', 1)])
+        index.add([('Live imaging', 2), ('calcium IMAGING', 3)])
+        assert index.search('imag') == [('Live imaging', 2), ('Calcium imaging', 1)]
+        assert index.search('live') == [('Live imaging', 2)]
+        assert index.search('lyve imaging') == [('Live imaging', 2)]
+
+        index.add([(f'Sample {number:03d}', number) for number in range(100)])
+        assert index.recent == []
+        assert index.search('ple 042', limit=1) == [('Sample 042', 42)]
+        assert index.search('imag') == [('Live imaging', 2), ('Calcium imaging', 1)]
+
+
+class TestFacets:
+    """Test cases for facet counts of a search."""
+
+    def test_facets_in_one_query(self, db_config):
+        """Test that authors, tags, categories and months are counted in a single statement."""
+        operators.insert_entry_to_db(db_config.get_conn(), 'Ada', '2023-01-10', 'mouse, cortex', '', '',
+                                     'Animal&Species&Mouse', 'Cortex slice A', None)
+        operators.insert_entry_to_db(db_config.get_conn(), 'Ada', '2023-02-03', 'mouse', '', '',
+                                     'Animal&Species&Mouse,Fixation&Method&PFA', 'Cortex slice B', None)
+        operators.insert_entry_to_db(db_config.get_conn(), 'Grace', '2023-02-20', 'cortex', '', '',
+                                     '', 'Cortex culture', None)
+        operators.insert_entry_to_db(db_config.get_conn(), 'Grace', '2023-03-01', 'retina', '', '',
+                                     '', 'Retina whole mount', None)
+
+        statements = []
+        db_config.get_conn().set_trace_callback(statements.append)
+        try:
+            total_count, facets = search_engine.facet_counts(db_config.get_conn(), {'Title': 'Cortex'})
+        finally:
+            db_config.get_conn().set_trace_callback(None)
+
+        # FTS5 traces its own shadow-table reads as '-- ' comments
+        assert len([sql for sql in statements if not sql.startswith('--')]) == 1
+        assert total_count == 3
+        assert facets['authors'] == [{'value': 'Ada', 'count': 2}, {'value': 'Grace', 'count': 1}]
+        assert facets['tags'] == [{'value': 'cortex', 'count': 2}, {'value': 'mouse', 'count': 2}]
+        assert facets['categories'] == [{'value': 'Animal', 'count': 2}, {'value': 'Fixation', 'count': 1}]
+        assert facets['months'] == [{'value': '2023-01', 'count': 1}, {'value': '2023-02', 'count': 2}]
+
+        total_count, facets = search_engine.facet_counts(db_config.get_conn(), {'Title': 'Cortex'}, top=1)
+        assert facets['authors'] == [{'value': 'Ada', 'count': 2}]
+
+
+class TestSearchCache:
+    """Test cases for the search-result cache."""
+
+    def test_repeat_search_skips_database(self, db_config):
+        """Test that a repeated search is answered from the cache until entries are written."""
+        # the module operators imports and invalidates
+        import search_cache
+
+        operators.insert_entry_to_db(db_config.get_conn(), 'Ada', '2023-04-01', 'cached', '', '', '', 'Cached search A', None)
+        cache = search_cache.SearchCache()
+        form = {'Tags': 'cached'}
+        first = search_engine.filter_entries(db_config.get_conn(), form, cache=cache)
+
+        statements = []
+        db_config.get_conn().set_trace_callback(statements.append)
+        try:
+            assert search_engine.filter_entries(db_config.get_conn(), {'Tags': ' cached, cached'}, cache=cache) == first
+            assert statements == []
+        finally:
+            db_config.get_conn().set_trace_callback(None)
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+        operators.insert_entry_to_db(db_config.get_conn(), 'Ada', '2023-04-02', 'cached', '', '', '', 'Cached search B', None)
+        assert len(search_engine.filter_entries(db_config.get_conn(), form, cache=cache)) == 2
+        assert cache.stats()['misses'] == 2
+
+    def test_least_recently_used_results_are_evicted(self):
+        """Test that the cache stays within max_entries, evicting the oldest lookups."""
+        import search_cache
+
+        cache = search_cache.SearchCache(max_entries=2)
+        cache.get_or_compute('a', lambda: [1])
+        cache.get_or_compute('b', lambda: [2])
+        cache.get_or_compute('a', lambda: [0])
+        cache.get_or_compute('c', lambda: [3])
+        assert cache.get_or_compute('a', lambda: [0]) == [1]
+        assert cache.get_or_compute('b', lambda: [0]) == [0]
+        assert len(cache) == 2 and cache.stats()['evictions'] == 2
+
+    def test_cache_is_bounded_by_total_rows(self):
+        """Test that large results evict older ones once the rows held exceed max_total_rows."""
+        import search_cache
+
+        cache = search_cache.SearchCache(max_total_rows=5)
+        cache.get_or_compute('a', lambda: [1, 2])
+        cache.get_or_compute('b', lambda: [3, 4])
+        cache.get_or_compute('c', lambda: [5, 6])
+        assert len(cache) == 2 and cache.stats()['rows'] == 4
+        assert cache.get_or_compute('a', lambda: [0]) == [0]
+        # a result larger than the whole budget is not cached at all
+        cache.get_or_compute('d', lambda: list(range(6)))
+        assert cache.get_or_compute('d', lambda: [0]) == [0]
@@ -28,7 +28,7 @@ class TestDatabaseUtilities:
     def test_init_db(self, db_config):
         """Test initializing the database."""
         # Drop all tables first to test initialization
-        cursor = db_config.conn.cursor()
+        cursor = db_config.get_conn().cursor()
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         tables = cursor.fetchall()
         
@@ -54,7 +54,7 @@ class TestDatabaseUtilities:
     def test_get_column_names(self, db_config):
         """Test retrieving column names from a table."""
         # Get column names for the 'users' table
-        column_names = operators.get_column_names(db_config.conn, 'users')
+        column_names = operators.get_column_names(db_config.get_conn(), 'users')
         
         # Verify expected columns
         expected_columns = ['id', 'username', 'password', 'admin', 'order_manager', 'name', 'email']
@@ -62,6 +62,111 @@ class TestDatabaseUtilities:
             assert col in column_names
 
 
+class TestSchemaMigrations:
+    """Test cases for the versioned schema migrations."""
+
+    def test_new_database_reaches_latest_version(self, db_config):
+        """Test that init_db records every migration in schema_version."""
+        import migrate
+
+        assert migrate.get_schema_version(db_config.get_conn()) == migrate.SCHEMA_VERSION
+        cursor = db_config.get_conn().cursor()
+        cursor.execute("SELECT version FROM schema_version ORDER BY version")
+        assert [row[0] for row in cursor.fetchall()] == [m[0] for m in migrate.migrations]
+
+    def test_up_to_date_database_skips_introspection(self, db_config):
+        """Test that a current database costs a single version lookup."""
+        statements = []
+        db_config.get_conn().set_trace_callback(statements.append)
+        try:
+            utils.init_db(db_config)
+        finally:
+            db_config.get_conn().set_trace_callback(None)
+        assert statements == ["SELECT MAX(version) FROM schema_version"]
+
+    def test_legacy_database_is_upgraded(self, db_config):
+        """Test that a pre-migration database gets its missing columns."""
+        import migrate
+
+        conn = sqlite3.connect(':memory:')
+        conn.execute("CREATE TABLE messages (id integer primary key autoincrement, author text NOT NULL, "
+                     "message text NOT NULL, date text NOT NULL, read integer DEFAULT 0)")
+        conn.execute("INSERT INTO messages (author, message, date) VALUES ('a', 'hi', 'now')")
+        conn.commit()
+
+        assert migrate.migrate_database(conn, db_config.table_lists) is True
+        assert 'destination' in operators.get_column_names(conn, 'messages')
+        assert migrate.get_schema_version(conn) == migrate.SCHEMA_VERSION
+        conn.close()
+
+    def test_failed_migration_is_rolled_back(self, monkeypatch):
+        """Test that a failing step leaves neither its changes nor its version behind."""
+        import migrate
+
+        def broken(cursor, table_lists):
+            cursor.execute("CREATE TABLE half_done (id integer)")
+            raise sqlite3.OperationalError("boom")
+
+        conn = sqlite3.connect(':memory:')
+        monkeypatch.setattr(migrate, 'migrations', migrate.migrations[:1] + [(2, 'broken', broken)])
+        monkeypatch.setattr(migrate, 'SCHEMA_VERSION', 2)
+
+        assert migrate.migrate_database(conn, ["CREATE TABLE kept (id integer)"]) is False
+        assert migrate.get_schema_version(conn) == 1
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        assert 'kept' in tables and 'half_done' not in tables
+        conn.close()
+
+
+class TestQueryPlans:
+    """Test cases guarding the hot queries against full table scans."""
+
+    def test_declared_indexes_exist(self, db_config):
+        """Test that the migrations created every declared index."""
+        import indexes
+
+        assert indexes.missing_indexes(db_config.get_conn()) == []
+
+    def test_hot_queries_use_indexes(self, db_config):
+        """Test that no declared hot query scans a whole table."""
+        import indexes
+
+        assert indexes.full_scans(db_config.get_conn()) == []
+
+    def test_compiled_queries_use_indexes(self, db_config):
+        """Test that the searches, log explorer pages and order lists compiled at run time use an index."""
+        import indexes
+        import log_explorer
+        import operators
+        import search_query
+
+        cursor = log_explorer.encode_cursor
+        queries = [
+            search_query.SearchQuery().compile(after=('2024-01-01', 10), limit=20),
+            search_query.SearchQuery([('tags', ('cells', 'mouse'))]).compile(limit=20),
+            search_query.SearchQuery([('conditions', ('Ai9', 'Species&Mouse', 'Species&Mouse&Ai14'))]).compile(limit=20),
+            search_query.SearchQuery([('params', (('Temperature', '>=', 30.0),))]).compile(limit=20),
+            log_explorer.page_query({}, after=cursor(['2024-01-01', 5])),
+            log_explorer.page_query({'username': 'admin'}, after=cursor(['2024-01-01', 5])),
+            log_explorer.page_query({'action': 'login', 'start': '2024-01-01', 'end': '2024-02-01'}),
+            log_explorer.page_query({'status': 'fail'}),
+            log_explorer.page_query({}, sort='username', descending=False, after=cursor(['admin', '2024-01-01', 5])),
+            log_explorer.page_query({}, sort='action', after=cursor(['login', '2024-01-01', 5])),
+            log_explorer.counts_query({}),
+            log_explorer.counts_query({'start': '2024-01-01', 'end': '2024-01-02'}, 'hour'),
+            operators.orders_query(),
+            operators.orders_query(status_filter='Ordered'),
+        ]
+        assert indexes.full_scans(db_config.get_conn(), [sql for sql, _ in queries]) == []
+
+    def test_full_scan_is_detected(self, db_config):
+        """Test that a query without a usable index is reported."""
+        import indexes
+
+        scans = indexes.full_scans(db_config.get_conn(), ["SELECT * FROM entries WHERE extra_txt=?"])
+        assert len(scans) == 1
+
+
 class TestFileSystemUtilities:
     """Test cases for file system utility functions."""
     
@@ -118,6 +223,34 @@ class TestFileSystemUtilities:
         assert os.path.exists(new_dir)
         assert os.path.isdir(new_dir)
 
+    def test_concurrent_backups_keep_their_own_files(self, temp_dir):
+        """Test that backups under different names stage and zip separately and clean up after themselves."""
+        import threading
+        import zipfile
+        from connection_pool import ConnectionPool
+
+        os.makedirs(os.path.join(temp_dir, 'conditions'))
+        with open(os.path.join(temp_dir, 'conditions', 'default.json'), 'w') as f:
+            f.write('{}')
+        pool = ConnectionPool(':memory:')
+        pool.thread_conn().execute('CREATE TABLE items (name text)')
+        results = {}
+        threads = [threading.Thread(target=lambda name=name: results.update(
+            {name: utils.backup_db({'DATABASE_FOLDER': temp_dir}, pool, name)})) for name in ('backup_1', 'backup_2')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pool.close_all()
+
+        for name in ('backup_1', 'backup_2'):
+            assert results[name] == (True, os.path.join(temp_dir, f'{name}.zip'))
+            with zipfile.ZipFile(results[name][1]) as archive:
+                names = archive.namelist()
+            assert any(entry.endswith('/db_main.db') for entry in names)
+            assert any(entry.endswith('conditions/default.json') for entry in names)
+        assert os.listdir(os.path.join(temp_dir, 'backup_datamanager')) == []
+
 
 class TestSecurityUtilities:
     """Test cases for security utility functions."""
@@ -166,7 +299,7 @@ class TestSecurityUtilities:
         # Login as a non-admin user
         with app_client.application.app_context():
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             # Create a non-admin user
             from src.database import operators
             operators.add_user(
@@ -205,7 +338,7 @@ class TestSecurityUtilities:
         # Clean up - delete the test user
         with app_client.application.app_context():
             db_configs = app_client.application.config['db_configs']
-            conn = db_configs.conn
+            conn = db_configs.get_conn()
             from src.database import operators
             operators.delete_user(conn, 'non_admin_user')
             conn.commit()
@@ -324,4 +457,673 @@ class TestDataValidationUtilities:
         assert conn is not None
         
         # Clean up
-        conn.close() 
\ No newline at end of file
+        conn.close() 
+
+class TestResultCursorStore:
+    """Test cases for the server-side search result store."""
+
+    def test_pages_and_owner_check(self):
+        """Test paging a stored result list and refusing other users."""
+        from src.utils.result_cursors import ResultCursorStore
+
+        store = ResultCursorStore()
+        cursor_id = store.put('alice', list(range(25)))
+        assert store.page(cursor_id, 'alice', 20, 10) == ([20, 21, 22, 23, 24], False)
+        assert store.page(cursor_id, 'alice', 0, 10) == (list(range(10)), True)
+        assert store.get(cursor_id, 'bob') is None
+        assert store.get('unknown', 'alice') is None
+
+    def test_expiry_and_lru_eviction(self, mocker):
+        """Test that cursors expire after the TTL and the least recently used is evicted."""
+        from src.utils import result_cursors
+
+        clock = mocker.patch.object(result_cursors.time, 'monotonic', return_value=100.0)
+        store = result_cursors.ResultCursorStore(ttl=60, max_cursors=2)
+        first = store.put('alice', ['a'])
+        second = store.put('alice', ['b'])
+        store.get(first, 'alice')
+        third = store.put('alice', ['c'])
+        assert store.get(second, 'alice') is None
+        assert store.get(first, 'alice') == ['a'] and store.get(third, 'alice') == ['c']
+
+        clock.return_value = 200.0
+        assert store.get(first, 'alice') is None
+        assert len(store) == 1
+
+
+class TestSingleFlight:
+    """Test cases for coalescing identical concurrent calls."""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving while a call is in flight get its result without running it."""
+        import threading
+        import time
+        from src.utils.single_flight import SingleFlight
+
+        flights = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow_query():
+            calls.append(1)
+            release.wait(5)
+            return ['row']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('key', slow_query))) for _ in range(5)]
+        threads[0].start()
+        while flights.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        while flights.stats()['shared'] < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert len(results) == 5 and all(result is results[0] for result in results)
+        assert flights.stats() == {'executions': 1, 'shared': 4, 'in_flight': 0}
+
+        # nothing is kept after the call returns
+        assert flights.do('key', lambda: ['fresh']) == ['fresh']
+
+    def test_errors_reach_every_waiter(self):
+        """Test that an exception of the running call is raised to the callers sharing it."""
+        import threading
+        import time
+        from src.utils.single_flight import SingleFlight
+
+        flights = SingleFlight()
+        release = threading.Event()
+
+        def failing_query():
+            release.wait(5)
+            raise ValueError('bad filter')
+
+        errors = []
+        def call():
+            try:
+                flights.do('key', failing_query)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=call) for _ in range(3)]
+        threads[0].start()
+        while flights.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        for thread in threads[1:]:
+            thread.start()
+        while flights.stats()['shared'] < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert errors == ['bad filter'] * 3
+
+    def test_partial_results_are_not_shared(self):
+        """Test that rows cut off at the leader's row budget are not handed to the callers waiting on it."""
+        import threading
+        import time
+        from src.utils import query_guard
+        from src.utils.single_flight import SingleFlight
+
+        flights = SingleFlight(share=query_guard.is_complete)
+        release = threading.Event()
+        def leader_query():
+            release.wait(5)
+            return query_guard.PartialRows(['row 1'])
+
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(leader=flights.do('key', leader_query)))
+        leader.start()
+        while flights.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        follower = threading.Thread(target=lambda: results.update(
+            follower=flights.do('key', lambda: ['row 1', 'row 2'])))
+        follower.start()
+        while flights.stats()['shared'] == 0:
+            time.sleep(0.001)
+        release.set()
+        leader.join()
+        follower.join()
+        assert results['leader'].partial and results['leader'] == ['row 1']
+        assert results['follower'] == ['row 1', 'row 2'] and query_guard.is_complete(results['follower'])
+
+    def test_waiters_give_up_when_their_budget_runs_out(self):
+        """Test that a caller waits on the call in flight only for the time left in its own budget."""
+        import threading
+        import time
+        import query_guard
+        import search_cache
+        import search_engine
+        from single_flight import SingleFlight, WaitTimeout
+
+        flights = SingleFlight()
+        cache = search_cache.SearchCache()
+        release = threading.Event()
+        leaders = [threading.Thread(target=lambda: flights.do('key', lambda: release.wait(5))),
+                   threading.Thread(target=lambda: cache.get_or_compute('key', lambda: release.wait(5) and ['row']))]
+        for leader in leaders:
+            leader.start()
+        while flights.stats()['in_flight'] == 0 or cache._flights.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+        conn = sqlite3.connect(':memory:')
+        budget = query_guard.QueryBudget('realtime_search', 0.05, rows=10)
+        try:
+            started = time.monotonic()
+            with pytest.raises(WaitTimeout):
+                flights.do('key', lambda: 'unused', timeout=0.05)
+            assert time.monotonic() - started < 1
+
+            # a search waiting on the same search of another request fails on its own budget
+            budget.install(conn)
+            with pytest.raises(query_guard.BudgetExceeded):
+                search_engine.fetch_all(conn, 'SELECT 1', (), cache, 'key')
+            assert budget.timed_out
+        finally:
+            budget.uninstall()
+            conn.close()
+            release.set()
+            for leader in leaders:
+                leader.join()
+
+
+class TestQueryGuard:
+    """Test cases for aborting superseded queries."""
+
+    ENDLESS_QUERY = 'WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter) SELECT COUNT(*) FROM counter'
+
+    def test_interruptible_aborts_running_statement(self):
+        """Test that a statement stops once the predicate turns true and the handler is removed afterwards."""
+        from src.utils import query_guard
+
+        conn = sqlite3.connect(':memory:')
+        checks = []
+        with pytest.raises(query_guard.QueryCancelled):
+            with query_guard.interruptible(conn, lambda: checks.append(1) or len(checks) > 5):
+                conn.execute(self.ENDLESS_QUERY).fetchone()
+        assert len(checks) >= 6
+        assert conn.execute('SELECT COUNT(*) FROM (SELECT 1 UNION ALL SELECT 2)').fetchone() == (2,)
+        conn.close()
+
+    def test_newer_search_supersedes_older(self):
+        """Test that only the newest search of a session is current."""
+        from src.utils import query_guard
+
+        generations = query_guard.SearchGenerations()
+        first = generations.start('tab-1')
+        other = generations.start('tab-2')
+        second = generations.start('tab-1')
+        assert not generations.is_current('tab-1', first)
+        assert generations.is_current('tab-1', second) and generations.is_current('tab-2', other)
+
+        generations.finish('tab-1', first)
+        assert generations.is_current('tab-1', second)
+        generations.finish('tab-1', second)
+        generations.finish('tab-2', other)
+        assert len(generations) == 0
+
+    def test_waiters_rerun_a_cancelled_call(self):
+        """Test that callers sharing a cancelled query run it themselves instead of failing."""
+        import threading
+        import time
+        from src.utils import query_guard
+        from src.utils.single_flight import SingleFlight
+
+        flights = SingleFlight(retry_on=query_guard.is_interrupt)
+        release = threading.Event()
+        def cancelled_query():
+            release.wait(5)
+            raise sqlite3.OperationalError('interrupted')
+
+        errors = []
+        def leader():
+            try:
+                flights.do('key', cancelled_query)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+        thread = threading.Thread(target=leader)
+        thread.start()
+        while flights.stats()['in_flight'] == 0:
+            time.sleep(0.001)
+
+        results = []
+        follower = threading.Thread(target=lambda: results.append(flights.do('key', lambda: ['rows'])))
+        follower.start()
+        while flights.stats()['shared'] == 0:
+            time.sleep(0.001)
+        release.set()
+        thread.join()
+        follower.join()
+        assert errors == ['interrupted'] and results == [['rows']]
+
+
+class TestQueryBudget:
+    """Test cases for per-request SQL time and row budgets."""
+
+    def test_row_budget_cuts_off_fetch(self):
+        """Test that fetch stops at the row budget and marks the result partial."""
+        from src.utils import query_guard
+
+        conn = sqlite3.connect(':memory:')
+        budget = query_guard.QueryBudget('entries', 10, rows=3)
+        budget.install(conn)
+        try:
+            rows = query_guard.fetch(conn.execute('SELECT value FROM json_each(?)', ('[1, 2, 3, 4, 5]',)))
+            assert rows == [(1,), (2,), (3,)] and rows.partial
+            assert not getattr(query_guard.fetch(conn.execute('SELECT 1')), 'partial', False)
+        finally:
+            budget.uninstall()
+        assert budget.truncated and budget.record() == 'rows'
+        assert query_guard.overruns[-1]['endpoint'] == 'entries'
+        assert len(query_guard.fetch(conn.execute('SELECT value FROM json_each(?)', ('[1, 2, 3, 4, 5]',)))) == 5
+        conn.close()
+
+    def test_time_budget_interrupts_statement(self):
+        """Test that a statement running past the deadline is interrupted."""
+        from src.utils import query_guard
+
+        conn = sqlite3.connect(':memory:')
+        budget = query_guard.QueryBudget('logs', 0.05, rows=100)
+        budget.install(conn)
+        try:
+            with pytest.raises(sqlite3.OperationalError, match='interrupted'):
+                conn.execute(TestQueryGuard.ENDLESS_QUERY).fetchone()
+        finally:
+            budget.uninstall()
+        assert budget.timed_out and budget.record() == 'time'
+        assert query_guard.active(conn) is None
+
+    def test_budgets_from_environment_format(self):
+        """Test parsing of the SQL_BUDGETS override."""
+        from src.utils import query_guard
+
+        assert query_guard.parse_budgets('realtime_search=2:500, logs=0.5:20,') == {
+            'realtime_search': (2.0, 500), 'logs': (0.5, 20)}
+
+
+class TestSqlTrace:
+    """Test cases for per-request SQL tracing."""
+
+    def test_normalize_statement_shapes(self):
+        """Test that literals and IN lists collapse so repeated statements share a shape."""
+        import sql_trace
+
+        assert sql_trace.normalize("SELECT * FROM entries\n  WHERE id = 12 AND author = 'O''Brien'") == \
+            'SELECT * FROM entries WHERE id = ? AND author = ?'
+        assert sql_trace.normalize('DELETE FROM tags WHERE id IN (?, ?,?)') == 'DELETE FROM tags WHERE id IN (?)'
+
+    def test_statements_rows_and_repeats_are_recorded(self, mocker):
+        """Test that a traced request records each statement, its rows, slow queries and N+1 repeats."""
+        import sql_trace
+
+        conn = sqlite3.connect(':memory:', factory=sql_trace.TracedConnection)
+        conn.execute('CREATE TABLE items (id integer primary key, name text)')
+        conn.executemany('INSERT INTO items (name) VALUES (?)', [('a',), ('b',), ('c',)])
+        conn.commit()
+
+        mocker.patch.object(sql_trace, 'SLOW_QUERY_MS', 0)
+        sql_trace.start('report', conn)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT name FROM items')
+            assert len(cursor.fetchall()) == 3
+            for item_id in range(1, 6):
+                conn.execute(f'SELECT name FROM items WHERE id = {item_id}').fetchone()
+            conn.execute("UPDATE items SET name = 'z'")
+            conn.commit()
+        finally:
+            summary = sql_trace.finish()
+
+        assert summary['endpoint'] == 'report' and summary['queries'] == 8
+        assert summary['rows'] == 3 + 3 + 3
+        assert summary['n_plus_one'][0]['sql'] == 'SELECT name FROM items WHERE id = ?'
+        assert summary['n_plus_one'][0]['count'] == 5
+        assert sql_trace.recent_requests[-1] is summary
+        assert sql_trace.slow_queries[-1]['sql'] == 'COMMIT'
+
+        # nothing is recorded outside a traced request
+        conn.execute('SELECT 1').fetchone()
+        assert sql_trace.current() is None
+        conn.close()
+
+
+class TestMetrics:
+    """Test cases for the Prometheus metrics registry."""
+
+    def test_thread_shards_are_summed(self):
+        """Test that requests recorded on different threads add up in one histogram."""
+        import threading
+        import metrics
+
+        def handle(seconds):
+            started = metrics.request_started() - seconds
+            metrics.observe_response('metrics_test', 200, started)
+            metrics.observe_sql('metrics_test', 0.002, 3)
+            metrics.request_finished()
+
+        threads = [threading.Thread(target=handle, args=(seconds,)) for seconds in (0.001, 0.2, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        text = metrics.render([('custom_ratio', 'gauge', 'A ratio.', 0.5)])
+        assert 'http_request_duration_seconds_bucket{endpoint="metrics_test",le="0.005"} 1' in text
+        assert 'http_request_duration_seconds_bucket{endpoint="metrics_test",le="0.25"} 2' in text
+        assert 'http_request_duration_seconds_bucket{endpoint="metrics_test",le="+Inf"} 3' in text
+        assert 'http_request_duration_seconds_count{endpoint="metrics_test"} 3' in text
+        assert 'http_responses_total{endpoint="metrics_test",status="200"} 3' in text
+        assert 'sql_queries_total{endpoint="metrics_test"} 9' in text
+        assert '# TYPE custom_ratio gauge\ncustom_ratio 0.5' in text
+
+
+LOGS_TABLE_SQL = ('CREATE TABLE logs (username text NOT NULL, action text NOT NULL, date text NOT NULL, '
+                  'status text NOT NULL, error text, id integer primary key autoincrement)')
+
+
+class TestAuditLogger:
+    """Test cases for the write-behind audit log."""
+
+    @staticmethod
+    def make_configs(file_db_configs):
+        return file_db_configs('audit.db', lambda conn: conn.execute(LOGS_TABLE_SQL))
+
+    def test_rows_are_written_behind_in_batches(self, file_db_configs):
+        """Test that records and failure updates reach the table from the writer thread."""
+        import audit_log
+
+        configs = self.make_configs(file_db_configs)
+        logger = audit_log.AuditLogger(configs, batch_size=2, flush_interval=0.05)
+        records = [logger.record('alice', f'action_{i}', '2024-01-01 10:00:00') for i in range(5)]
+        logger.fail(records[3], 'boom')
+        logger.close()
+
+        rows = configs.get_conn().execute('SELECT id, action, status, error FROM logs ORDER BY id').fetchall()
+        assert [row[0] for row in rows] == [record.id for record in records] == [1, 2, 3, 4, 5]
+        assert rows[3][2:] == ('fail', 'boom') and rows[0][2:] == ('pass', None)
+        assert logger.stats() == {'queued': 0, 'written': 6, 'dropped': 0}
+
+    def test_full_queue_drops_records(self, file_db_configs, mocker):
+        """Test that records beyond the queue bound are dropped and counted instead of blocking."""
+        import audit_log
+
+        configs = self.make_configs(file_db_configs)
+        logger = audit_log.AuditLogger(configs, max_queue=2, overflow='drop')
+        mocker.patch.object(logger, '_start')  # keep the writer from draining the queue
+        for i in range(4):
+            logger.record('bob', f'action_{i}', '2024-01-01 10:00:00')
+        assert logger.stats()['dropped'] == 2
+
+        logger.close()
+        assert configs.get_conn().execute('SELECT COUNT(*) FROM logs').fetchone()[0] == 2
+
+    def test_bad_row_is_dropped_alone(self, file_db_configs, mocker):
+        """Test that a failing row costs only itself and that ids come from SQLite, not a counter."""
+        import audit_log
+
+        configs = self.make_configs(file_db_configs)
+        logger = audit_log.AuditLogger(configs, batch_size=10)
+        mocker.patch.object(logger, '_start')  # write everything in one batch on close
+        first = logger.record('carol', 'first', '2024-01-01 10:00:00')
+        # another writer takes the next id while the rows wait in the queue
+        configs.get_conn().execute("INSERT INTO logs (username, action, date, status) VALUES ('x', 'other', 'd', 'pass')")
+        configs.get_conn().commit()
+        bad = logger.record(None, 'broken', '2024-01-01 10:00:00')
+        last = logger.record('carol', 'last', '2024-01-01 10:00:00')
+        logger.fail(bad, 'boom')
+        logger.fail(last, 'boom')
+        logger.close()
+
+        rows = configs.get_conn().execute('SELECT id, action, status FROM logs ORDER BY id').fetchall()
+        assert [tuple(row) for row in rows] == [(1, 'other', 'pass'), (2, 'first', 'pass'), (3, 'last', 'fail')]
+        assert first.id == 2 and bad.id is None and last.id == 3
+        assert logger.stats()['dropped'] == 1
+
+
+class TestLogRetention:
+    """Test cases for the monthly rollover of the logs table into the archive."""
+
+    @staticmethod
+    def add_logs(conn):
+        conn.execute(LOGS_TABLE_SQL)
+        conn.execute('CREATE INDEX idx_logs_date ON logs (date)')
+        dates = ['2024-01-05 10:00:00', '2024-01-31 23:59:59.5', '2024-02-10 08:00:00',
+                 '2024-03-01 00:00:00', '2024-04-20 12:00:00']
+        conn.executemany('INSERT INTO logs (username, action, date, status) VALUES (?, ?, ?, ?)',
+                         [('alice', 'entries', date, 'pass') for date in dates])
+
+    def make_configs(self, file_db_configs):
+        return file_db_configs('live.db', self.add_logs)
+
+    def test_month_boundaries(self):
+        """Test the month arithmetic across year boundaries."""
+        import log_retention
+        from datetime import date
+
+        assert log_retention.month_start(date(2024, 3, 15), 2) == '2024-01-01'
+        assert log_retention.month_start(date(2024, 1, 15), 1) == '2023-12-01'
+        assert log_retention.month_start(date(2024, 12, 1), -1) == '2025-01-01'
+
+    def test_old_months_move_to_the_archive(self, file_db_configs, temp_dir):
+        """Test that months before the live window become archive tables and can expire."""
+        import log_retention
+        from datetime import date
+
+        configs = self.make_configs(file_db_configs)
+        archive = os.path.join(temp_dir, 'archive.db')
+        retention = log_retention.LogRetention(configs, archive_file=archive, live_months=2, archive_months=0)
+        result = retention.run_once(today=date(2024, 4, 20))
+        assert result['moved'] == {'2024-01': 2, '2024-02': 1}
+
+        conn = configs.pool.thread_conn()
+        assert [row[0] for row in conn.execute('SELECT date FROM logs ORDER BY date')] == \
+            ['2024-03-01 00:00:00', '2024-04-20 12:00:00']
+        assert log_retention.archived_months(conn, archive) == [('2024-01', 2), ('2024-02', 1)]
+        # nothing left to move, and a second pass does not duplicate archived rows
+        assert retention.run_once(today=date(2024, 4, 20))['moved'] == {}
+
+        expired = log_retention.expire(conn, archive, archive_months=2, today=date(2024, 4, 20))
+        assert expired == ['2024-01']
+        assert log_retention.archived_months(conn, archive) == [('2024-02', 1)]
+
+    def test_explorer_pages_across_the_archive(self, file_db_configs, temp_dir):
+        """Test that the log explorer pages and counts the live rows and the archived months as one table."""
+        import log_explorer
+        import log_retention
+        from datetime import date
+
+        configs = self.make_configs(file_db_configs)
+        archive = os.path.join(temp_dir, 'archive.db')
+        log_retention.LogRetention(configs, archive_file=archive, live_months=2).run_once(today=date(2024, 4, 20))
+        conn = configs.pool.thread_conn()
+
+        for descending in (True, False):
+            seen, after = [], None
+            while True:
+                rows, after = log_explorer.page(conn, {'username': 'alice'}, descending=descending, after=after,
+                                                limit=2, archive_file=archive)
+                seen.extend(row['date'] for row in rows)
+                if after is None:
+                    break
+            assert seen == sorted(seen, reverse=descending) and len(seen) == 5
+
+        # only the months of the date range are read
+        with log_explorer.sources(conn, {'start': '2024-02-01', 'end': '2024-03-02'}, archive) as tables:
+            assert tables == ['logs', 'archive.logs_2024_02']
+        rows, _ = log_explorer.page(conn, {'start': '2024-01-31', 'end': '2024-03-02'}, archive_file=archive)
+        assert [row['date'] for row in rows] == ['2024-03-01 00:00:00', '2024-02-10 08:00:00', '2024-01-31 23:59:59.5']
+
+        assert [(count['bucket'], count['count']) for count in log_explorer.counts(conn, {}, 'month', archive)] == \
+            [('2024-04', 1), ('2024-03', 1), ('2024-02', 1), ('2024-01', 2)]
+        # the archive is detached again
+        assert [row[1] for row in conn.execute('PRAGMA database_list')] == ['main']
+
+        # each archived month is walked in date order by its own index
+        with log_explorer.sources(conn, {}, archive) as tables:
+            sql, params = log_explorer.page_query({}, tables=tables)
+            plan = ' '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+        assert 'idx_logs_2024_01_date' in plan and 'idx_logs_2024_02_date' in plan
+
+    def test_compaction_is_incremental_or_off_peak(self, file_db_configs, temp_dir, monkeypatch):
+        """Test that free pages are released in steps, and a full VACUUM waits for the off-peak hours."""
+        import sqlite3
+        import log_retention
+        from datetime import datetime as moment
+
+        configs = self.make_configs(file_db_configs)
+        conn = configs.pool.thread_conn()
+        assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        conn.executemany('INSERT INTO logs (username, action, date, status) VALUES (?, ?, ?, ?)',
+                         [('bob', 'x' * 1000, '2024-05-01', 'pass')] * 500)
+        conn.commit()
+        conn.execute("DELETE FROM logs WHERE username = 'bob'")
+        conn.commit()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        assert log_retention.compact(conn, pages=50) == ['main']
+        conn.set_trace_callback(None)
+        assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+        assert not any(sql.startswith('VACUUM') for sql in statements)
+
+        # a database created without incremental auto-vacuum
+        legacy = sqlite3.connect(os.path.join(temp_dir, 'legacy.db'))
+        legacy.execute('CREATE TABLE filler (value text)')
+        legacy.executemany('INSERT INTO filler VALUES (?)', [('x' * 1000,)] * 500)
+        legacy.commit()
+        legacy.execute('DELETE FROM filler')
+        legacy.commit()
+        monkeypatch.setattr(log_retention, 'VACUUM_HOURS', '2-4')
+        assert log_retention.compact(legacy, now=moment(2024, 5, 1, 12)) == []
+        assert log_retention.compact(legacy, now=moment(2024, 5, 1, 3)) == ['main']
+        assert legacy.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+        assert legacy.execute('PRAGMA freelist_count').fetchone()[0] == 0
+        legacy.close()
+
+
+class TestLogConfig:
+    """Test cases for the central queued logging pipeline."""
+
+    def test_create_log_reuses_its_file_handler(self, temp_dir, monkeypatch):
+        """Test that repeated create_log calls keep a single handler per logger."""
+        monkeypatch.setattr(utils, 'log_dir', temp_dir)
+        for _ in range(3):
+            logger = utils.create_log('reused_log')
+        try:
+            assert len(logger.handlers) == 1
+            # written by its own file handler only, not again by the root queue pipeline
+            assert logger.propagate is False
+            logger.info('written once')
+            with open(os.path.join(temp_dir, 'reused_log.log')) as f:
+                assert f.read().count('written once') == 1
+        finally:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+
+    def test_queue_pipeline_and_module_levels(self, temp_dir):
+        """Test that records reach app.log through the listener and module levels filter them."""
+        import logging
+        import log_config
+
+        log_config.shutdown()
+        log_config.setup(log_dir=temp_dir, level='INFO', levels={'chatty_module': 'WARNING'}, console=False)
+        try:
+            logging.getLogger('search_engine').debug('hidden diagnostics')
+            logging.getLogger('search_engine').info('kept info')
+            logging.getLogger('chatty_module').info('muted info')
+            logging.getLogger('chatty_module').warning('kept warning')
+            log_config.flush()
+            with open(os.path.join(temp_dir, 'app.log')) as f:
+                content = f.read()
+            assert 'kept info' in content and 'kept warning' in content
+            assert 'hidden diagnostics' not in content and 'muted info' not in content
+        finally:
+            log_config.shutdown()
+            logging.getLogger().setLevel(logging.WARNING)
+            logging.getLogger('chatty_module').setLevel(logging.NOTSET)
+
+
+class TestJobQueue:
+    """Test cases for the SQLite-backed background job queue."""
+
+    @staticmethod
+    def make_configs(file_db_configs):
+        import migrate
+        return file_db_configs('jobs.db', lambda conn: migrate.create_jobs(conn.cursor(), []))
+
+    def test_workers_run_jobs_once_per_idempotency_key(self, file_db_configs):
+        """Test that workers run queued jobs with progress and that a repeated key returns the first job."""
+        import time
+        import jobs
+
+        configs = self.make_configs(file_db_configs)
+        queue = jobs.JobQueue(configs, workers=2, poll_interval=0.05)
+
+        def add(job):
+            job.progress(1, 2, 'halfway')
+            return {'sum': sum(job.payload['numbers'])}
+        queue.register('add', add)
+
+        first = queue.enqueue('add', {'numbers': [1, 2, 3]}, owner='alice', idempotency_key='add-123')
+        assert queue.enqueue('add', {'numbers': [1, 2, 3]}, owner='alice', idempotency_key='add-123') == first
+        # the same key from another owner is a separate request
+        other = queue.enqueue('add', {'numbers': [1, 2, 3]}, owner='carol', idempotency_key='add-123')
+        assert other != first
+        second = queue.enqueue('add', {'numbers': [4]}, owner='bob')
+        queue.start()
+        try:
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline and any(queue.get(i)['status'] != 'done' for i in (first, other, second)):
+                time.sleep(0.02)
+        finally:
+            queue.stop()
+
+        job = queue.get(first)
+        assert job['status'] == 'done' and job['progress'] == 1.0 and job['result'] == {'sum': 6}
+        assert job['attempts'] == 1 and job['message'] == 'halfway'
+        assert [job['id'] for job in queue.recent('alice')] == [first]
+
+    def test_enqueue_leaves_the_callers_transaction_alone(self, file_db_configs):
+        """Test that enqueue refuses to commit an open transaction of the caller and works once it is closed."""
+        import jobs
+
+        configs = self.make_configs(file_db_configs)
+        queue = jobs.JobQueue(configs)
+        queue.register('noop', lambda job: None)
+        conn = configs.get_conn()
+        conn.execute("INSERT INTO jobs (kind, payload, status, progress, attempts, max_attempts, run_after, "
+                     "created_at, updated_at) VALUES ('draft', '{}', 'queued', 0, 0, 1, '', '', '')")
+        with pytest.raises(RuntimeError):
+            queue.enqueue('noop', {})
+        assert conn.in_transaction
+        conn.rollback()
+
+        job_id = queue.enqueue('noop', {})
+        assert [job['kind'] for job in queue.recent()] == ['noop'] and queue.get(job_id)['status'] == 'queued'
+
+    def test_failed_attempts_retry_with_backoff_from_checkpoint(self, file_db_configs):
+        """Test that a failing job is retried after its backoff, resumes from its checkpoint, then fails."""
+        import jobs
+
+        configs = self.make_configs(file_db_configs)
+        queue = jobs.JobQueue(configs, retry_delay=0, max_delay=0)
+        seen = []
+
+        def flaky(job):
+            seen.append(list(job.checkpoint.get('done', [])))
+            job.progress(job.attempt, 3, checkpoint={'done': seen[-1] + [job.attempt]})
+            raise jobs.JobError(f'attempt {job.attempt} failed')
+        queue.register('flaky', flaky)
+
+        job_id = queue.enqueue('flaky', {}, max_attempts=3)
+        while queue.run_next():
+            pass
+        assert seen == [[], [1], [1, 2]]
+        job = queue.get(job_id)
+        assert job['status'] == 'failed' and job['attempts'] == 3 and job['error'] == 'attempt 3 failed'
+
+        queue.retry_delay, queue.max_delay = 30, 3600
+        assert queue.backoff(1) == 30 and queue.backoff(3) == 120
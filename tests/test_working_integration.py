@@ -30,7 +30,7 @@ class TestBasicIntegration:
         
         # Test adding and retrieving a user
         operators.add_user(
-            db_config.conn,
+            db_config.get_conn(),
             'test_user',
             'test_password',
             0,  # not admin
@@ -40,7 +40,7 @@ class TestBasicIntegration:
         )
         
         # Retrieve the user
-        user = operators.get_user_by_username(db_config.conn, 'test_user')
+        user = operators.get_user_by_username(db_config.get_conn(), 'test_user')
         assert user is not None
         assert user['username'] == 'test_user'
         assert user['name'] == 'Test User'
@@ -53,7 +53,7 @@ class TestBasicIntegration:
         
         # Get the database connection from the app
         db_configs = app_client.application.config['db_configs']
-        conn = db_configs.conn
+        conn = db_configs.get_conn()
         
         # Add test entry directly to the database
         from src.database import operators